@@ -0,0 +1,205 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+import models
+import prompt_builder
+from database import SessionLocal
+
+# Cache de resultados da IA endereçado por conteúdo.
+# A chave é o hash das entradas normalizadas do prompt; duas camadas:
+#   1) LRU em memória (por processo)
+#   2) tabela ai_analysis_cache no banco (compartilhada entre processos e reinícios)
+
+# Incrementar quando o texto do prompt mudar, para não reaproveitar respostas do prompt antigo
+PROMPT_VERSION = "4"
+
+CACHE_HABILITADO = os.getenv("AI_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MEMORIA_MAX = int(os.getenv("AI_CACHE_MEMORY_SIZE", "512"))
+CACHE_BANCO_MAX = int(os.getenv("AI_CACHE_MAX_ROWS", "10000"))
+CACHE_TTL = timedelta(hours=float(os.getenv("AI_CACHE_TTL_HOURS", "168")))
+
+# A cada N gravações a tabela é podada (expirados + excesso de linhas)
+INTERVALO_PODA = 100
+
+
+def _normalizar_texto(valor) -> str:
+    if valor is None:
+        return ""
+    return " ".join(str(valor).split()).casefold()
+
+
+def gerar_chave(idade, gender, medical_history, care_type, anamnesis, hpma,
+                extended_anamnesis: dict, symptoms, exams, model: str) -> str:
+    entradas = {
+        "v": PROMPT_VERSION,
+        # O orçamento muda o texto enviado ao modelo quando o contexto é grande
+        "budget": prompt_builder.PROMPT_TOKEN_BUDGET,
+        "model": model,
+        # Idade exata, como vai no prompt (doses pediátricas dependem dela)
+        "idade": idade if isinstance(idade, int) else None,
+        "gender": _normalizar_texto(gender),
+        "medical_history": _normalizar_texto(medical_history),
+        "care_type": _normalizar_texto(care_type),
+        "anamnesis": _normalizar_texto(anamnesis),
+        "hpma": _normalizar_texto(hpma),
+        "extended": {k: _normalizar_texto(v) for k, v in sorted((extended_anamnesis or {}).items()) if v},
+        "symptoms": _normalizar_texto(symptoms),
+        "exams": _normalizar_texto(exams),
+    }
+    payload = json.dumps(entradas, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AIAnalysisCache:
+    def __init__(self, max_memoria: int, max_linhas: int, ttl: timedelta, habilitado: bool = True):
+        self.max_memoria = max_memoria
+        self.max_linhas = max_linhas
+        self.ttl = ttl
+        self.habilitado = habilitado
+        self._memoria = OrderedDict()  # chave -> (resultado, criado_em, latencia_ms)
+        self._lock = threading.Lock()
+        self._gravacoes_desde_poda = 0
+        self._stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+            "saved_ms": 0.0,
+        }
+
+    def _contar(self, campo: str, valor=1):
+        with self._lock:
+            self._stats[campo] += valor
+
+    def _expirado(self, criado_em: datetime) -> bool:
+        return criado_em is None or datetime.utcnow() - criado_em > self.ttl
+
+    def _guardar_memoria(self, chave, resultado, criado_em, latencia_ms):
+        with self._lock:
+            self._memoria[chave] = (resultado, criado_em, latencia_ms)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get(self, chave: str):
+        """Retorna uma cópia do resultado em cache, ou None."""
+        if not self.habilitado:
+            return None
+
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                if self._expirado(item[1]):
+                    del self._memoria[chave]
+                    item = None
+                else:
+                    self._memoria.move_to_end(chave)
+        if item is not None:
+            self._contar("memory_hits")
+            self._contar("saved_ms", item[2] or 0)
+            return copy.deepcopy(item[0])
+
+        db = SessionLocal()
+        try:
+            entrada = db.query(models.AIAnalysisCache).filter(models.AIAnalysisCache.key == chave).first()
+            if entrada is None or self._expirado(entrada.created_at):
+                self._contar("misses")
+                return None
+            entrada.hits = (entrada.hits or 0) + 1
+            entrada.last_hit_at = datetime.utcnow()
+            db.commit()
+            resultado, criado_em, latencia_ms = entrada.result_json, entrada.created_at, entrada.latency_ms
+        except Exception as e:
+            print(f"Erro ao consultar cache da IA: {e}")
+            self._contar("misses")
+            return None
+        finally:
+            db.close()
+
+        self._guardar_memoria(chave, resultado, criado_em, latencia_ms)
+        self._contar("db_hits")
+        self._contar("saved_ms", latencia_ms or 0)
+        return copy.deepcopy(resultado)
+
+    def set(self, chave: str, resultado: dict, model: str, latencia_ms: float):
+        if not self.habilitado:
+            return
+        agora = datetime.utcnow()
+        resultado = copy.deepcopy(resultado)
+        self._guardar_memoria(chave, resultado, agora, latencia_ms)
+        self._contar("stores")
+
+        db = SessionLocal()
+        try:
+            entrada = db.query(models.AIAnalysisCache).filter(models.AIAnalysisCache.key == chave).first()
+            if entrada is None:
+                entrada = models.AIAnalysisCache(key=chave)
+                db.add(entrada)
+            entrada.model = model
+            entrada.result_json = resultado
+            entrada.latency_ms = latencia_ms
+            entrada.created_at = agora
+            entrada.last_hit_at = None
+            entrada.hits = 0
+            db.commit()
+
+            with self._lock:
+                self._gravacoes_desde_poda += 1
+                podar = self._gravacoes_desde_poda >= INTERVALO_PODA
+                if podar:
+                    self._gravacoes_desde_poda = 0
+            if podar:
+                self._podar(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Erro ao gravar cache da IA: {e}")
+        finally:
+            db.close()
+
+    def _podar(self, db):
+        # Remove expirados e, se ainda passar do limite, os menos usados recentemente
+        limite = datetime.utcnow() - self.ttl
+        removidos = db.query(models.AIAnalysisCache).\
+            filter(models.AIAnalysisCache.created_at < limite).\
+            delete(synchronize_session=False)
+
+        excesso = db.query(models.AIAnalysisCache).count() - self.max_linhas
+        if excesso > 0:
+            ultimo_uso = func.coalesce(models.AIAnalysisCache.last_hit_at, models.AIAnalysisCache.created_at)
+            chaves = [k for (k,) in db.query(models.AIAnalysisCache.key).order_by(ultimo_uso).limit(excesso)]
+            removidos += db.query(models.AIAnalysisCache).\
+                filter(models.AIAnalysisCache.key.in_(chaves)).\
+                delete(synchronize_session=False)
+        db.commit()
+        self._contar("evictions", removidos)
+
+    def registrar_bypass(self):
+        self._contar("bypassed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            dados = dict(self._stats)
+            dados["memory_entries"] = len(self._memoria)
+        consultas = dados["memory_hits"] + dados["db_hits"] + dados["misses"]
+        dados["hit_rate"] = round((dados["memory_hits"] + dados["db_hits"]) / consultas, 4) if consultas else 0.0
+        dados["saved_ms"] = round(dados["saved_ms"], 1)
+        dados["enabled"] = self.habilitado
+        return dados
+
+
+cache_analise = AIAnalysisCache(
+    max_memoria=CACHE_MEMORIA_MAX,
+    max_linhas=CACHE_BANCO_MAX,
+    ttl=CACHE_TTL,
+    habilitado=CACHE_HABILITADO,
+)
@@ -0,0 +1,29 @@
+from dashboard_rollup import URGENCIAS_VALIDAS
+
+# Campos "quentes" do ai_analysis_json copiados para colunas indexadas de cases,
+# para que filtros e agregações não precisem carregar e decodificar o JSON de cada linha.
+
+
+def extrair_campos_ia(ai_result) -> dict:
+    ai = ai_result or {}
+    urgency = ai.get("urgency")
+    if urgency not in URGENCIAS_VALIDAS:
+        urgency = "Indefinida"
+    cid10 = ai.get("cid10")
+    cid10_code = cid10.get("code") if isinstance(cid10, dict) else None
+    return {
+        "urgency": urgency,
+        "referral": ai.get("referral"),
+        "pathology_type": ai.get("pathology_type"),
+        "cid10_code": cid10_code,
+    }
+
+
+def aplicar_resultado_ia(case, ai_result, ai_sucesso: bool, meta: dict = None):
+    """Grava o resultado da IA no caso: JSON completo, status, colunas promovidas e metadados da chamada."""
+    case.ai_analysis_json = ai_result
+    if meta is not None:
+        case.analysis_meta_json = meta
+    case.status = "Analisado" if ai_sucesso else "Erro na Análise"
+    for campo, valor in extrair_campos_ia(ai_result).items():
+        setattr(case, campo, valor)
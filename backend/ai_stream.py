@@ -0,0 +1,40 @@
+import json
+import re
+
+# Apoio ao streaming da análise (SSE): extrai campos do JSON parcial do Gemini assim que eles
+# ficam completos, sem esperar o documento inteiro. Só campos de texto de primeiro nível
+# (e o código do CID-10 principal) são extraídos antes do fim; o resto vem no evento final.
+
+CAMPOS_PARCIAIS = ("referral", "urgency", "pathology_type", "justification")
+
+_STRING_JSON = r'"((?:[^"\\]|\\.)*)"'
+_PADROES = {campo: re.compile(rf'"{campo}"\s*:\s*{_STRING_JSON}') for campo in CAMPOS_PARCIAIS}
+_PADRAO_CID10 = re.compile(rf'"cid10"\s*:\s*\{{[^{{}}]*?"code"\s*:\s*{_STRING_JSON}')
+
+
+class ExtratorParcial:
+    def __init__(self):
+        self.texto = ""
+        self.encontrados = {}
+
+    def feed(self, trecho: str) -> list:
+        """Acrescenta um trecho do stream e retorna os campos [(nome, valor)] que acabaram de ficar completos."""
+        self.texto += trecho
+        novos = []
+        for campo, padrao in _PADROES.items():
+            if campo in self.encontrados:
+                continue
+            m = padrao.search(self.texto)
+            if m:
+                self.encontrados[campo] = json.loads(f'"{m.group(1)}"')
+                novos.append((campo, self.encontrados[campo]))
+        if "cid10" not in self.encontrados:
+            m = _PADRAO_CID10.search(self.texto)
+            if m:
+                self.encontrados["cid10"] = json.loads(f'"{m.group(1)}"')
+                novos.append(("cid10", self.encontrados["cid10"]))
+        return novos
+
+
+def evento_sse(evento: str, dados) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Fila de análise de IA em segundo plano.
+# O caso é salvo na hora com status "Em análise" e um worker faz a chamada ao Gemini,
+# liberando a requisição HTTP (e a thread do FastAPI) imediatamente.
+#
+# Os casos entram em faixas de prioridade (ver faixa_analise em main.py):
+#   - urgencia:   care_type "Urgência"
+#   - pediatrico: care_type "Pediátrico" ou paciente com menos de 12 anos
+#   - rotina:     o resto (Clínica Geral etc.)
+# Cada faixa é FIFO. Entre as faixas o próximo caso sai por escalonamento proporcional (stride
+# scheduling): cada faixa recebe uma fatia proporcional ao seu peso (AI_LANE_WEIGHTS), então a
+# urgência passa na frente de um backlog de rotina, mas a rotina continua andando (não fica sem vez).
+# AI_LANE_CAPS limita quantos workers cada faixa ocupa ao mesmo tempo; por padrão a rotina deixa
+# ao menos um worker livre para urgência/pediatria, então um caso urgente espera no máximo o fim de
+# uma análise em andamento, por maior que seja a fila de rotina.
+
+STATUS_EM_ANALISE = "Em análise"
+
+FAIXA_URGENCIA = "urgencia"
+FAIXA_PEDIATRICO = "pediatrico"
+FAIXA_ROTINA = "rotina"
+FAIXAS = (FAIXA_URGENCIA, FAIXA_PEDIATRICO, FAIXA_ROTINA)
+
+PESOS_PADRAO = {FAIXA_URGENCIA: 8, FAIXA_PEDIATRICO: 4, FAIXA_ROTINA: 1}
+
+
+def _ler_por_faixa(variavel: str, padrao: dict) -> dict:
+    """"urgencia=8,rotina=1" -> dict; faixas omitidas ficam com o padrão. Os valores devem ser > 0."""
+    valores = dict(padrao)
+    for item in os.getenv(variavel, "").split(","):
+        if "=" not in item:
+            continue
+        nome, valor = (parte.strip() for parte in item.split("=", 1))
+        if nome not in FAIXAS:
+            raise ValueError(f"{variavel}: faixa desconhecida {nome!r} (use {', '.join(FAIXAS)})")
+        valor = float(valor) if "." in valor else int(valor)
+        # Peso 0 dividiria por zero no passe do escalonador; limite 0 deixaria a faixa parada para sempre
+        if not valor > 0:
+            raise ValueError(f"{variavel}: valor da faixa {nome!r} deve ser maior que zero (recebido {valor})")
+        valores[nome] = valor
+    return valores
+
+
+def limites_padrao(max_workers: int) -> dict:
+    reserva = max(1, max_workers // 4) if max_workers > 1 else 0
+    return {
+        FAIXA_URGENCIA: max_workers,
+        FAIXA_PEDIATRICO: max_workers,
+        FAIXA_ROTINA: max(1, max_workers - reserva),
+    }
+
+
+class Faixa:
+    def __init__(self, nome: str, peso: float, limite: int):
+        self.nome = nome
+        self.peso = peso
+        self.limite = limite
+        self.fila = deque()
+        self.em_execucao = 0
+        # Stride scheduling: a faixa escolhida é a de menor passe; cada caso despachado soma 1/peso
+        self.passe = 0.0
+        self.enfileirados = 0
+        self.processados = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.esperas = deque(maxlen=500)
+
+    def stats(self) -> dict:
+        esperas = sorted(self.esperas)
+        p95 = esperas[min(int(len(esperas) * 0.95), len(esperas) - 1)] if esperas else 0.0
+        return {
+            "lane": self.nome,
+            "weight": self.peso,
+            "max_running": self.limite,
+            "queued": len(self.fila),
+            "running": self.em_execucao,
+            "enqueued_total": self.enfileirados,
+            "processed_total": self.processados,
+            "wait_avg_ms": round(self.espera_total / self.processados * 1000, 1) if self.processados else 0.0,
+            "wait_p95_ms": round(p95 * 1000, 1),
+            "wait_max_ms": round(self.espera_max * 1000, 1),
+        }
+
+
+class AnalysisQueue:
+    def __init__(self, max_workers: int, pesos: dict = None, limites: dict = None):
+        self.max_workers = max_workers
+        pesos = pesos or PESOS_PADRAO
+        limites = limites or limites_padrao(max_workers)
+        invalidos = [nome for nome in FAIXAS if not pesos[nome] > 0]
+        if invalidos:
+            raise ValueError(f"Peso de faixa deve ser maior que zero: {', '.join(invalidos)}")
+        self.faixas = {nome: Faixa(nome, pesos[nome], limites[nome]) for nome in FAIXAS}
+        self._handler = None
+        self._workers = []
+        self._encerrando = False
+        self._pendentes = set()
+        self._cond = threading.Condition()
+
+    def configurar(self, handler):
+        """Define a função que processa um caso (recebe o case_id e as opções passadas ao enqueue)."""
+        self._handler = handler
+
+    def _iniciar_workers(self):
+        # Chamado com o lock: os workers só sobem no primeiro enqueue
+        if self._workers:
+            return
+        self._encerrando = False
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._loop, name=f"analise-ia-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def enqueue(self, case_id: int, faixa: str = FAIXA_ROTINA, **opcoes) -> bool:
+        """Agenda a análise do caso na faixa indicada. Retorna False se ele já estiver na fila."""
+        if self._handler is None:
+            raise RuntimeError("Fila de análise sem handler configurado")
+        if faixa not in self.faixas:
+            raise ValueError(f"Faixa de análise desconhecida: {faixa!r}")
+        with self._cond:
+            if case_id in self._pendentes:
+                return False
+            self._pendentes.add(case_id)
+            destino = self.faixas[faixa]
+            if not destino.fila and not destino.em_execucao:
+                # Faixa que estava ociosa entra no passe atual, sem crédito acumulado do tempo parada
+                ativas = [f.passe for f in self.faixas.values() if f is not destino and (f.fila or f.em_execucao)]
+                if ativas:
+                    destino.passe = max(destino.passe, min(ativas))
+            destino.fila.append((case_id, opcoes, time.monotonic()))
+            destino.enfileirados += 1
+            self._iniciar_workers()
+            self._cond.notify()
+        return True
+
+    def _proxima(self):
+        """Faixa elegível (com casos e abaixo do limite) de menor passe, ou None. Chamado com o lock."""
+        elegiveis = [f for f in self.faixas.values() if f.fila and f.em_execucao < f.limite]
+        if not elegiveis:
+            return None
+        return min(elegiveis, key=lambda f: (f.passe, FAIXAS.index(f.nome)))
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                faixa = self._proxima()
+                while faixa is None and not self._encerrando:
+                    self._cond.wait()
+                    faixa = self._proxima()
+                if self._encerrando:
+                    return
+                case_id, opcoes, enfileirado_em = faixa.fila.popleft()
+                faixa.em_execucao += 1
+                faixa.passe += 1 / faixa.peso
+                espera = time.monotonic() - enfileirado_em
+                faixa.processados += 1
+                faixa.espera_total += espera
+                faixa.espera_max = max(faixa.espera_max, espera)
+                faixa.esperas.append(espera)
+            metrics.observar_espera_fila(faixa.nome, espera)
+            self._executar(faixa, case_id, opcoes)
+
+    def _executar(self, faixa: Faixa, case_id: int, opcoes: dict):
+        try:
+            self._handler(case_id, **opcoes)
+        except Exception as e:
+            print(f"Erro na fila de análise (caso {case_id}, faixa {faixa.nome}): {e}")
+        finally:
+            with self._cond:
+                faixa.em_execucao -= 1
+                self._pendentes.discard(case_id)
+                # O limite da faixa pode ter segurado casos: acorda quem estiver esperando
+                self._cond.notify_all()
+
+    def is_pending(self, case_id: int) -> bool:
+        with self._cond:
+            return case_id in self._pendentes
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pendentes)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.max_workers,
+                "depth": len(self._pendentes),
+                "lanes": [f.stats() for f in self.faixas.values()],
+            }
+
+    async def aguardar(self, case_id: int, timeout: float, intervalo: float = 0.1):
+        """Espera (sem prender thread) até o caso sair da fila ou o timeout expirar."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.is_pending(case_id) and loop.time() < deadline:
+            await asyncio.sleep(intervalo)
+
+    def shutdown(self):
+        # Casos ainda não processados continuam "Em análise" no banco e são recuperados no próximo startup
+        with self._cond:
+            self._encerrando = True
+            for faixa in self.faixas.values():
+                for case_id, _, _ in faixa.fila:
+                    self._pendentes.discard(case_id)
+                faixa.fila.clear()
+            self._workers = []
+            self._cond.notify_all()
+
+
+_workers = int(os.getenv("AI_WORKERS", "4"))
+fila_analise = AnalysisQueue(
+    max_workers=_workers,
+    pesos=_ler_por_faixa("AI_LANE_WEIGHTS", PESOS_PADRAO),
+    limites=_ler_por_faixa("AI_LANE_CAPS", limites_padrao(_workers)),
+)
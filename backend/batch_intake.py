@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Fan-out limitado das chamadas de IA para o cadastro em lote (POST /cases/batch).
+# Até `concorrencia` análises rodam ao mesmo tempo; cada item tem seu próprio timeout,
+# contado a partir do momento em que começou a rodar (não do envio do lote).
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_CONCURRENCY_MAX = int(os.getenv("BATCH_CONCURRENCY_MAX", "32"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "60"))
+BATCH_COMMIT_SIZE = int(os.getenv("BATCH_COMMIT_SIZE", "20"))
+
+
+class ItemTimeout(Exception):
+    pass
+
+
+def executar_em_paralelo(tarefas: dict, concorrencia: int, timeout_item: float):
+    """Executa {indice: callable} e gera (indice, resultado, erro) na ordem em que terminam.
+
+    Itens que passam do timeout são reportados com ItemTimeout; a thread deles não pode ser
+    interrompida, mas o lote não espera por ela.
+    """
+    inicio = {}
+    lock = threading.Lock()
+
+    def rodar(indice, funcao):
+        with lock:
+            inicio[indice] = time.monotonic()
+        return funcao()
+
+    executor = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="lote-ia")
+    try:
+        futuros = {executor.submit(rodar, i, f): i for i, f in tarefas.items()}
+        pendentes = set(futuros)
+        while pendentes:
+            wait(pendentes, timeout=0.25, return_when=FIRST_COMPLETED)
+            agora = time.monotonic()
+            for futuro in list(pendentes):
+                indice = futuros[futuro]
+                if futuro.done():
+                    pendentes.discard(futuro)
+                    erro = futuro.exception()
+                    yield (indice, None, erro) if erro else (indice, futuro.result(), None)
+                else:
+                    with lock:
+                        comecou = inicio.get(indice)
+                    if comecou is not None and agora - comecou > timeout_item:
+                        pendentes.discard(futuro)
+                        futuro.cancel()
+                        yield indice, None, ItemTimeout(f"Análise excedeu {timeout_item:.0f}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+import synthetic
+
+# Benchmark de carga ponta a ponta da API, sem gastar cota do Gemini (LLM_BACKEND=fake).
+#
+# Uso, a partir de backend/:
+#   python benchmarks/load_test.py                      # sobe um servidor temporário (banco novo) e mede
+#   python benchmarks/load_test.py --url http://host:p  # mede um servidor já rodando com LLM_BACKEND=fake
+#   python benchmarks/load_test.py --update-baselines   # grava os resultados como nova referência
+#
+# Sem --update-baselines, o script compara p95 e req/s de cada rota com benchmarks/baselines.json
+# e sai com código 1 se alguma piorar além da tolerância (ou se o baseline não existir).
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(args, diretorio: str):
+    porta = porta_livre()
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": BACKEND_DIR,
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MS": args.llm_latency,
+        "FAKE_LLM_ERROR_RATE": str(args.llm_error_rate),
+    })
+    # cwd no diretório temporário: o SQLite padrão (./ainurse_dev.db) nasce vazio lá
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(porta),
+         "--log-level", "warning"],
+        cwd=diretorio, env=env,
+    )
+    url = f"http://127.0.0.1:{porta}"
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError("Servidor encerrou durante o startup")
+        try:
+            if httpx.get(f"{url}/openapi.json", timeout=1).status_code == 200:
+                return processo, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError("Servidor não respondeu em 30s")
+
+
+def semear(client: httpx.Client, args, rng: random.Random) -> list:
+    """Cria médicos, pacientes e casos sintéticos. Retorna [(owner_id, [case_ids])]."""
+    contexto = []
+    sufixo = int(time.time())
+    for u in range(args.users):
+        resp = client.post("/users/", json={
+            "email": f"bench{sufixo}_{u}@example.com",
+            "full_name": f"Médico Benchmark {u}",
+            "crm": f"{100000 + u}",
+            "password": "benchmark",
+        })
+        resp.raise_for_status()
+        owner_id = resp.json()["id"]
+
+        pacientes = [synthetic.paciente(rng) for _ in range(args.patients_per_user)]
+        casos = [synthetic.caso(rng, rng.choice(pacientes)) for _ in range(args.cases_per_user)]
+        case_ids = []
+        for i in range(0, len(casos), 100):
+            resp = client.post("/cases/batch", params={"owner_id": owner_id, "concurrency": 32},
+                               json=casos[i:i + 100], timeout=600)
+            resp.raise_for_status()
+            case_ids += [item["case_id"] for item in resp.json()["items"] if item.get("case_id")]
+        contexto.append((owner_id, case_ids))
+        print(f"  médico {owner_id}: {len(pacientes)} pacientes, {len(case_ids)} casos")
+    return contexto
+
+
+def cenarios(args):
+    """Nome da rota -> (peso, função que faz a requisição)."""
+    def criar_caso(client, owner_id, case_ids, rng):
+        return client.post("/cases/", params={"owner_id": owner_id}, json=synthetic.caso(rng))
+
+    def detalhe(client, owner_id, case_ids, rng):
+        return client.get(f"/cases/{rng.choice(case_ids)}")
+
+    def lista_casos(client, owner_id, case_ids, rng):
+        return client.get("/cases/", params={"owner_id": owner_id})
+
+    def lista_pacientes(client, owner_id, case_ids, rng):
+        return client.get("/patients/", params={"owner_id": owner_id})
+
+    def busca(client, owner_id, case_ids, rng):
+        termos = " ".join(rng.sample(rng.choice(synthetic.SINTOMAS).split(), 2))
+        return client.get("/cases/search", params={"owner_id": owner_id, "q": termos})
+
+    def dashboard(client, owner_id, case_ids, rng):
+        return client.get("/dashboard/stats", params={"owner_id": owner_id})
+
+    return {
+        "POST /cases/": (args.weight_create, criar_caso),
+        "GET /cases/{id}": (5, detalhe),
+        "GET /cases/": (3, lista_casos),
+        "GET /patients/": (1, lista_pacientes),
+        "GET /cases/search": (1, busca),
+        "GET /dashboard/stats": (2, dashboard),
+    }
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def executar_carga(url: str, contexto: list, args) -> dict:
+    rotas = cenarios(args)
+    nomes = list(rotas)
+    pesos = [rotas[n][0] for n in nomes]
+    amostras = {n: [] for n in nomes}
+    erros = {n: 0 for n in nomes}
+    lock = threading.Lock()
+    fim = time.monotonic() + args.duration
+
+    def worker(semente):
+        rng = random.Random(semente)
+        with httpx.Client(base_url=url, timeout=60) as client:
+            while time.monotonic() < fim:
+                nome = rng.choices(nomes, weights=pesos)[0]
+                owner_id, case_ids = rng.choice(contexto)
+                inicio = time.perf_counter()
+                try:
+                    ok = rotas[nome][1](client, owner_id, case_ids, rng).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                ms = (time.perf_counter() - inicio) * 1000
+                with lock:
+                    amostras[nome].append(ms)
+                    if not ok:
+                        erros[nome] += 1
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    duracao = time.monotonic() - inicio
+
+    resultado = {}
+    for nome in nomes:
+        valores = amostras[nome]
+        resultado[nome] = {
+            "requests": len(valores),
+            "errors": erros[nome],
+            "rps": round(len(valores) / duracao, 2),
+            "p50_ms": round(percentil(valores, 0.50), 2),
+            "p95_ms": round(percentil(valores, 0.95), 2),
+            "p99_ms": round(percentil(valores, 0.99), 2),
+        }
+    return resultado
+
+
+def imprimir(resultado: dict):
+    print(f"\n{'rota':<22}{'req':>8}{'erros':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for nome, r in resultado.items():
+        print(f"{nome:<22}{r['requests']:>8}{r['errors']:>7}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+def comparar_baselines(resultado: dict, parametros: dict, tolerancia: float) -> list:
+    if not os.path.exists(BASELINES_PATH):
+        # Sem referência não há como garantir que nada piorou: falha em vez de passar em silêncio
+        return [f"sem baseline em {BASELINES_PATH}; rode com --update-baselines para criar"]
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("params") != parametros:
+        print("\nAVISO: parâmetros diferentes dos usados no baseline; a comparação pode não ser justa.")
+
+    falhas = []
+    for nome, ref in baseline.get("routes", {}).items():
+        atual = resultado.get(nome)
+        if not atual or not atual["requests"]:
+            continue
+        if atual["p95_ms"] > ref["p95_ms"] * (1 + tolerancia):
+            falhas.append(f"{nome}: p95 {atual['p95_ms']} ms > baseline {ref['p95_ms']} ms (+{tolerancia:.0%})")
+        if atual["rps"] < ref["rps"] * (1 - tolerancia):
+            falhas.append(f"{nome}: {atual['rps']} req/s < baseline {ref['rps']} req/s (-{tolerancia:.0%})")
+        if atual["errors"] > ref.get("errors", 0) and not parametros.get("llm_error_rate"):
+            falhas.append(f"{nome}: {atual['errors']} erro(s)")
+    return falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga da API com LLM fake.")
+    parser.add_argument("--url", help="Servidor já rodando (senão sobe um temporário)")
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--patients-per-user", type=int, default=200)
+    parser.add_argument("--cases-per-user", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Duração da fase de carga em segundos")
+    parser.add_argument("--weight-create", type=int, default=1, help="Peso de POST /cases/ no mix")
+    parser.add_argument("--llm-latency", default="lognormal:800:0.4", help="FAKE_LLM_LATENCY_MS do servidor temporário")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Piora aceitável sobre o baseline")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--json", help="Grava o resultado completo neste arquivo")
+    args = parser.parse_args()
+
+    parametros = {k: getattr(args, k) for k in (
+        "users", "patients_per_user", "cases_per_user", "concurrency", "weight_create", "llm_latency", "llm_error_rate"
+    )}
+    rng = random.Random(args.seed)
+    processo = None
+    with tempfile.TemporaryDirectory() as diretorio:
+        try:
+            url = args.url
+            if not url:
+                processo, url = iniciar_servidor(args, diretorio)
+                print(f"Servidor temporário em {url}")
+
+            print("Semeando dados sintéticos...")
+            with httpx.Client(base_url=url, timeout=60) as client:
+                contexto = semear(client, args, rng)
+
+            print(f"Carga: {args.concurrency} clientes por {args.duration:.0f}s...")
+            resultado = executar_carga(url, contexto, args)
+        finally:
+            if processo:
+                processo.terminate()
+                processo.wait(timeout=10)
+
+    imprimir(resultado)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": parametros, "routes": resultado}, f, indent=2, ensure_ascii=False)
+
+    if args.update_baselines:
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump({"params": parametros, "routes": resultado}, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline atualizado em {BASELINES_PATH}")
+        return 0
+
+    falhas = comparar_baselines(resultado, parametros, args.tolerance)
+    if falhas:
+        print("\nREGRESSÃO DE DESEMPENHO:")
+        for falha in falhas:
+            print(f"  - {falha}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis_queue  # noqa: E402
+from analysis_queue import AnalysisQueue, FAIXA_ROTINA, FAIXA_URGENCIA  # noqa: E402
+
+# Espera de casos urgentes na fila de análise conforme o backlog de rotina cresce.
+#
+# Uso, a partir de backend/:
+#   python benchmarks/queue_bench.py
+#   python benchmarks/queue_bench.py --backlogs 100 400 1600 --service-ms 20 --workers 4
+#
+# Para cada tamanho de backlog, enfileira N casos de rotina de uma vez e, em seguida, um caso urgente
+# a cada --urgent-every-ms enquanto o backlog é drenado. O "handler" só dorme --service-ms (simula a
+# chamada ao LLM). Compara:
+#   - fifo:   tudo numa faixa só, na ordem de chegada (comportamento anterior da fila)
+#   - faixas: as faixas de prioridade com os pesos/limites padrão de analysis_queue.py
+# A espera do urgente deve ficar plana com as faixas e crescer com o backlog no fifo.
+
+
+def rodar(modo: str, backlog: int, workers: int, servico: float, intervalo_urgente: float, urgentes: int) -> dict:
+    if modo == "fifo":
+        fila = AnalysisQueue(workers, limites={nome: workers for nome in analysis_queue.FAIXAS})
+    else:
+        fila = AnalysisQueue(workers)
+    enfileirado_em = {}
+    esperas = {FAIXA_URGENCIA: [], FAIXA_ROTINA: []}
+    terminou = threading.Event()
+    restantes = [backlog + urgentes]
+    lock = threading.Lock()
+
+    def handler(case_id, faixa_real):
+        esperas[faixa_real].append(time.perf_counter() - enfileirado_em[case_id])
+        time.sleep(servico)
+        with lock:
+            restantes[0] -= 1
+            if restantes[0] == 0:
+                terminou.set()
+
+    fila.configurar(handler)
+    for i in range(backlog):
+        enfileirado_em[i] = time.perf_counter()
+        fila.enqueue(i, faixa=FAIXA_ROTINA, faixa_real=FAIXA_ROTINA)
+    for j in range(urgentes):
+        time.sleep(intervalo_urgente)
+        case_id = backlog + j
+        enfileirado_em[case_id] = time.perf_counter()
+        faixa = FAIXA_ROTINA if modo == "fifo" else FAIXA_URGENCIA
+        fila.enqueue(case_id, faixa=faixa, faixa_real=FAIXA_URGENCIA)
+    terminou.wait()
+    fila.shutdown()
+
+    def resumo(valores):
+        valores = sorted(valores)
+        return {
+            "p50_ms": round(statistics.median(valores) * 1000, 1),
+            "p95_ms": round(valores[min(int(len(valores) * 0.95), len(valores) - 1)] * 1000, 1),
+            "max_ms": round(valores[-1] * 1000, 1),
+        }
+
+    return {"urgent": resumo(esperas[FAIXA_URGENCIA]), "routine": resumo(esperas[FAIXA_ROTINA])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da fila de análise com faixas de prioridade.")
+    parser.add_argument("--backlogs", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=10)
+    parser.add_argument("--urgent-every-ms", type=float, default=25)
+    parser.add_argument("--urgent", type=int, default=20, help="Casos urgentes por rodada")
+    parser.add_argument("--json", help="Grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    resultado = []
+    print(f"\n{'backlog':>8}{'modo':>8}{'urg p50':>10}{'urg p95':>10}{'urg max':>10}{'rot p95':>10}   (ms)")
+    for backlog in args.backlogs:
+        for modo in ("fifo", "faixas"):
+            medida = rodar(modo, backlog, args.workers, args.service_ms / 1000, args.urgent_every_ms / 1000, args.urgent)
+            resultado.append({"backlog": backlog, "mode": modo, **medida})
+            urgente, rotina = medida["urgent"], medida["routine"]
+            print(f"{backlog:>8}{modo:>8}{urgente['p50_ms']:>10}{urgente['p95_ms']:>10}"
+                  f"{urgente['max_ms']:>10}{rotina['p95_ms']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
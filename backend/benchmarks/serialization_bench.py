@@ -0,0 +1,116 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+import schemas  # noqa: E402
+import fast_json  # noqa: E402
+import compression  # noqa: E402
+
+# Custo de serializar e comprimir uma página grande de GET /cases/ (padrão: 1000 casos com ai_analysis_json).
+#
+# Uso, a partir de backend/:
+#   python benchmarks/serialization_bench.py
+#   python benchmarks/serialization_bench.py --cases 5000 --repeat 10 --json resultado.json
+#
+# Compara, por resposta, o tempo de CPU (time.process_time) e o tamanho do corpo:
+#   - fastapi: caminho padrão (valida, dump_python(mode="json") e json.dumps como o JSONResponse)
+#   - orjson:  o mesmo, mas com orjson.dumps (ORJSONResponse)
+#   - direto:  fast_json.serializar (model_dump_json do pydantic-core, sem árvore intermediária)
+# e depois gzip/brotli do corpo gerado, com os níveis configurados em compression.py.
+
+
+def casos_sinteticos(n: int, seed: int) -> list:
+    """Objetos com os mesmos atributos do que read_cases devolve (Case + patient_name/cpf)."""
+    rng = random.Random(seed)
+    inicio = datetime(2024, 1, 1)
+    casos = []
+    for i in range(n):
+        paciente = synthetic.paciente(rng)
+        casos.append(SimpleNamespace(
+            id=i + 1,
+            patient_id=rng.randint(1, n // 5 + 1),
+            status=rng.choice(("Analisado", "Analisado", "Revisado pelo Médico", "Erro na Análise")),
+            created_at=inicio + timedelta(minutes=37 * i),
+            ai_analysis_json=synthetic.analise_ia(rng),
+            patient_name=paciente["full_name"],
+            care_type=rng.choice(synthetic.CARE_TYPES),
+            cpf=paciente["cpf"],
+            version=1,
+            updated_at=None,
+        ))
+    return casos
+
+
+def medir(funcao, repeticoes: int):
+    funcao()  # aquecimento (adapters, caches do pydantic)
+    inicio = time.process_time()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.process_time() - inicio) / repeticoes * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialização e compressão de listas de casos.")
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    casos = casos_sinteticos(args.cases, args.seed)
+    schema = list[schemas.CaseResponse]
+    adapter = fast_json._adapter(schema)
+
+    def padrao():
+        conteudo = adapter.dump_python(adapter.validate_python(casos, from_attributes=True), mode="json")
+        return json.dumps(conteudo, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+    modos = {"fastapi": padrao, "direto": lambda: fast_json.serializar(schema, casos)}
+    if fast_json.orjson is not None:
+        modos["orjson"] = lambda: fast_json.orjson.dumps(
+            adapter.dump_python(adapter.validate_python(casos, from_attributes=True), mode="json")
+        )
+    else:
+        print("orjson não instalado: modo orjson ignorado.")
+
+    resultado = {"parameters": {"cases": args.cases, "repeat": args.repeat}, "serialization": {}, "compression": {}}
+    print(f"\nSerialização de {args.cases} casos ({args.repeat} repetições)")
+    print(f"{'modo':<12}{'ms CPU':>10}{'bytes':>12}")
+    corpo = None
+    for nome, funcao in modos.items():
+        ms, saida = medir(funcao, args.repeat)
+        resultado["serialization"][nome] = {"cpu_ms": round(ms, 2), "bytes": len(saida)}
+        print(f"{nome:<12}{ms:>10.2f}{len(saida):>12}")
+        if nome == "direto":
+            corpo = saida
+
+    compressores = {"gzip": lambda: gzip.compress(corpo, compresslevel=compression.COMPRESSION_GZIP_LEVEL, mtime=0)}
+    if compression.brotli is not None:
+        compressores["brotli"] = lambda: compression.brotli.compress(corpo, quality=compression.COMPRESSION_BROTLI_QUALITY)
+    else:
+        print("brotli não instalado: compressão brotli ignorada.")
+
+    print(f"\nCompressão do corpo ({len(corpo)} bytes)")
+    print(f"{'codificação':<12}{'ms CPU':>10}{'bytes':>12}{'razão':>8}")
+    for nome, funcao in compressores.items():
+        ms, saida = medir(funcao, args.repeat)
+        razao = len(corpo) / len(saida)
+        resultado["compression"][nome] = {"cpu_ms": round(ms, 2), "bytes": len(saida), "ratio": round(razao, 1)}
+        print(f"{nome:<12}{ms:>10.2f}{len(saida):>12}{razao:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
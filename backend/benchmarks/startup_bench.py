@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import BACKEND_DIR, porta_livre
+
+# Tempo de cold start da API, para o startup continuar rápido conforme o app cresce.
+#
+# Uso, a partir de backend/:
+#   python benchmarks/startup_bench.py                     # mede e compara com benchmarks/startup_baselines.json
+#   python benchmarks/startup_bench.py --update-baselines
+#   python benchmarks/startup_bench.py --importtime        # lista os módulos mais caros do import do main
+#
+# Mede (mediana de --runs execuções):
+#   - import_ms: `import main` num processo novo, sem GEMINI_API_KEY (o import não pode depender dela)
+#   - live_ms / ready_ms (banco novo): do spawn do uvicorn até /healthz e /readyz responderem 200,
+#     incluindo as migrações de um banco vazio
+#   - live_ms / ready_ms (banco existente): o mesmo, num segundo start sobre o banco já migrado
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baselines.json")
+
+
+def _env(extra: dict = None) -> dict:
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    env.update({"PYTHONPATH": BACKEND_DIR, "LLM_BACKEND": "fake", "FAKE_LLM_LATENCY_MS": "fixed:0"})
+    env.update(extra or {})
+    return env
+
+
+def medir_import(diretorio: str) -> float:
+    codigo = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=diretorio, env=_env({"LLM_BACKEND": "gemini"}),
+        capture_output=True, text=True, check=True,
+    )
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def medir_subida(diretorio: str, timeout: float = 60) -> dict:
+    porta = porta_livre()
+    url = f"http://127.0.0.1:{porta}"
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(porta), "--log-level", "warning"],
+        cwd=diretorio, env=_env(), stdout=subprocess.DEVNULL,
+    )
+    resultado = {}
+    try:
+        limite = time.monotonic() + timeout
+        while "ready_ms" not in resultado:
+            if processo.poll() is not None:
+                raise RuntimeError("Servidor encerrou durante o startup")
+            if time.monotonic() > limite:
+                raise RuntimeError(f"Servidor não ficou pronto em {timeout:.0f}s")
+            rota = "/healthz" if "live_ms" not in resultado else "/readyz"
+            try:
+                if httpx.get(url + rota, timeout=1).status_code == 200:
+                    resultado["live_ms" if rota == "/healthz" else "ready_ms"] = (time.perf_counter() - inicio) * 1000
+                    continue
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+    finally:
+        processo.terminate()
+        processo.wait(timeout=10)
+    return resultado
+
+
+def importtime(diretorio: str, top: int = 15):
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=diretorio,
+        env=_env({"LLM_BACKEND": "gemini"}), capture_output=True, text=True, check=True,
+    )
+    linhas = []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, modulo = linha[len("import time:"):].split("|")
+        linhas.append((int(cumulativo), modulo.strip()))
+    print("\nMódulos mais caros no import do main (cumulativo, µs):")
+    for cumulativo, modulo in sorted(linhas, reverse=True)[:top]:
+        print(f"{cumulativo:>12}  {modulo}")
+
+
+def mediana(valores: list) -> float:
+    return round(statistics.median(valores), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de tempo de startup da API.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Piora aceitável sobre o baseline")
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--json", help="Grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    imports, frio, quente = [], [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as diretorio:
+            imports.append(medir_import(diretorio))
+            frio.append(medir_subida(diretorio))
+            quente.append(medir_subida(diretorio))
+        if args.importtime and len(imports) == 1:
+            with tempfile.TemporaryDirectory() as diretorio:
+                importtime(diretorio)
+
+    resultado = {
+        "import_ms": mediana(imports),
+        "fresh_db_live_ms": mediana([r["live_ms"] for r in frio]),
+        "fresh_db_ready_ms": mediana([r["ready_ms"] for r in frio]),
+        "existing_db_live_ms": mediana([r["live_ms"] for r in quente]),
+        "existing_db_ready_ms": mediana([r["ready_ms"] for r in quente]),
+    }
+    print(f"\n{'medida':<24}{'ms':>10}")
+    for nome, valor in resultado.items():
+        print(f"{nome:<24}{valor:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+    if args.update_baselines:
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+        print(f"\nBaseline atualizado em {BASELINES_PATH}")
+        return 0
+    if not os.path.exists(BASELINES_PATH):
+        print(f"\nSem baseline em {BASELINES_PATH}. Rode com --update-baselines para criar.")
+        return 0
+
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    falhas = [
+        f"{nome}: {resultado[nome]} ms > baseline {ref} ms (+{args.tolerance:.0%})"
+        for nome, ref in baseline.items() if nome in resultado and resultado[nome] > ref * (1 + args.tolerance)
+    ]
+    if falhas:
+        print("\nREGRESSÃO DE STARTUP:")
+        for falha in falhas:
+            print(f"  - {falha}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
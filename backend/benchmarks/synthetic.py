@@ -0,0 +1,57 @@
+import random
+
+# Dados sintéticos (sem dados reais de pacientes) para os benchmarks.
+
+NOMES = ("Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+         "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Tiago", "Vitória", "William")
+SOBRENOMES = ("Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Ferreira", "Almeida", "Ribeiro")
+SINTOMAS = (
+    "Febre há 3 dias, tosse produtiva e dor ao respirar",
+    "Dor torácica em aperto há 2 horas, irradiando para braço esquerdo",
+    "Diarreia aquosa e vômitos desde ontem, sem sangue",
+    "Cefaleia intensa de início súbito com náuseas",
+    "Dor lombar após esforço físico, sem irradiação",
+    "Coriza, dor de garganta e febre baixa",
+    "Dispneia progressiva e edema de membros inferiores",
+    "Dor abdominal em fossa ilíaca direita com febre",
+)
+CARE_TYPES = ("Clínica Geral", "Clínica Geral", "Clínica Geral", "Urgência", "Pediátrico")
+HISTORICOS = ("Hipertensão arterial", "Diabetes tipo 2", "Asma", "", "Dislipidemia", "")
+
+
+def paciente(rng: random.Random) -> dict:
+    pediatrico = rng.random() < 0.15
+    ano = rng.randint(2014, 2022) if pediatrico else rng.randint(1940, 2005)
+    return {
+        "full_name": f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+        "birth_date": f"{ano}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "gender": rng.choice(("Feminino", "Masculino")),
+        "cpf": "".join(str(rng.randint(0, 9)) for _ in range(11)),
+        "medical_history": rng.choice(HISTORICOS),
+    }
+
+
+def caso(rng: random.Random, patient_data: dict = None) -> dict:
+    return {
+        "patient_data": patient_data or paciente(rng),
+        "care_type": rng.choice(CARE_TYPES),
+        "hpma": f"Paciente refere {rng.choice(SINTOMAS).lower()}. Evolução de {rng.randint(1, 10)} dias.",
+        "alergias": rng.choice(("Nega", "Dipirona", "Penicilina", "")) or None,
+        "medicamentos_uso": rng.choice(("Losartana 50 mg", "Metformina 850 mg", "Nenhum", "")) or None,
+        "symptoms": rng.choice(SINTOMAS),
+        "exams": rng.choice((None, "Hemograma sem alterações", "PCR elevada")),
+    }
+
+
+def analise_ia(rng: random.Random) -> dict:
+    return {
+        "referral": rng.choice(("Clínica Geral", "Cardiologia", "Pneumologia", "Urgência")),
+        "urgency": rng.choice(("Alta", "Média", "Baixa")),
+        "justification": "Justificativa clínica sintética. " * rng.randint(5, 20),
+        "pathology_type": rng.choice(("Infecciosa", "Cardiovascular", "Respiratória", "Gastrointestinal")),
+        "cid10": {"code": "J06.9", "description": "Infecção aguda das vias aéreas superiores não especificada"},
+        "cid10_secondary": [{"code": "R50.9", "description": "Febre não especificada"}],
+        "diagnoses": [{"name": f"Hipótese {i}", "probability": f"{80 - i * 15}%"} for i in range(4)],
+        "exams": ["Hemograma completo", "PCR", "Radiografia de tórax"],
+        "medications": ["Dipirona 500 mg VO 6/6h", "Amoxicilina 500 mg VO 8/8h por 7 dias"],
+    }
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+import os
+
+import models
+import pagination
+from fast_json import orjson
+
+# Exportação de casos para auditoria (GET /cases/export), em NDJSON ou CSV, com memória constante.
+#
+# A consulta seleciona só as colunas exportadas (sem montar objetos ORM) e é lida com yield_per:
+# no Postgres vira cursor do lado do servidor, no SQLite as linhas já vêm sob demanda. Cada lote de
+# EXPORT_BATCH_SIZE linhas é convertido e enviado antes de o próximo ser lido, então exportar 10^6
+# casos ocupa o mesmo tanto de memória que exportar mil.
+#
+# Com flatten_ai=true os campos do ai_analysis_json viram colunas ai_* (listas separadas por " | ");
+# sem isso o NDJSON leva o objeto aninhado e o CSV uma coluna com o JSON.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+COLUNAS_CASO = (
+    ("id", models.Case.id),
+    ("created_at", models.Case.created_at),
+    ("updated_at", models.Case.updated_at),
+    ("status", models.Case.status),
+    ("care_type", models.Case.care_type),
+    ("patient_id", models.Case.patient_id),
+    ("patient_name", models.Patient.full_name),
+    ("birth_date", models.Patient.birth_date),
+    ("gender", models.Patient.gender),
+    ("symptoms", models.Case.symptoms),
+    ("hpma", models.Case.hpma),
+    ("anamnesis", models.Case.anamnesis),
+    ("extended_anamnesis_json", models.Case.extended_anamnesis_json),
+    ("exams_input", models.Case.exams_input),
+    ("doctor_conclusion", models.Case.doctor_conclusion),
+    ("ai_analysis_json", models.Case.ai_analysis_json),
+)
+NOMES_COLUNAS = tuple(nome for nome, _ in COLUNAS_CASO)
+
+CAMPOS_IA = (
+    "ai_urgency", "ai_referral", "ai_pathology_type", "ai_cid10_code", "ai_cid10_description",
+    "ai_cid10_secondary", "ai_diagnoses", "ai_exams", "ai_medications", "ai_justification",
+)
+SEPARADOR_LISTA = " | "
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def consulta_exportacao(db, owner_id: int, created_from=None, created_to=None, status=None):
+    query = db.query(*(coluna for _, coluna in COLUNAS_CASO)).\
+        join(models.Patient, models.Case.patient_id == models.Patient.id).\
+        filter(models.Case.owner_id == owner_id)
+    if status:
+        query = query.filter(models.Case.status == status)
+    query = pagination.filtrar_periodo(query, models.Case.created_at, created_from, created_to)
+    return query.order_by(models.Case.id).yield_per(EXPORT_BATCH_SIZE)
+
+
+def _item_ia(item) -> str:
+    if isinstance(item, dict):
+        if "code" in item:
+            return f"{item.get('code')} {item.get('description') or ''}".strip()
+        if "name" in item:
+            return f"{item['name']} ({item['probability']})" if item.get("probability") else str(item["name"])
+    return str(item)
+
+
+def achatar_ia(ai) -> dict:
+    """Campos do ai_analysis_json em colunas simples (texto), para planilhas."""
+    ai = ai if isinstance(ai, dict) else {}
+    cid10 = ai.get("cid10") if isinstance(ai.get("cid10"), dict) else {}
+
+    def lista(chave):
+        valor = ai.get(chave)
+        return SEPARADOR_LISTA.join(_item_ia(i) for i in valor) if isinstance(valor, list) else None
+
+    return {
+        "ai_urgency": ai.get("urgency"),
+        "ai_referral": ai.get("referral"),
+        "ai_pathology_type": ai.get("pathology_type"),
+        "ai_cid10_code": cid10.get("code"),
+        "ai_cid10_description": cid10.get("description"),
+        "ai_cid10_secondary": lista("cid10_secondary"),
+        "ai_diagnoses": lista("diagnoses"),
+        "ai_exams": lista("exams"),
+        "ai_medications": lista("medications"),
+        "ai_justification": ai.get("justification"),
+    }
+
+
+def _registro(linha, achatar: bool) -> dict:
+    registro = dict(zip(NOMES_COLUNAS, linha))
+    for campo in ("created_at", "updated_at"):
+        if registro[campo] is not None:
+            registro[campo] = registro[campo].isoformat()
+    if achatar:
+        registro.update(achatar_ia(registro.pop("ai_analysis_json")))
+    return registro
+
+
+def _lotes(query):
+    lote = []
+    for linha in query:
+        lote.append(linha)
+        if len(lote) >= EXPORT_BATCH_SIZE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def gerar_ndjson(query, achatar: bool = False):
+    if orjson is not None:
+        def dumps(registro):
+            return orjson.dumps(registro)
+    else:
+        def dumps(registro):
+            return json.dumps(registro, ensure_ascii=False, default=str).encode("utf-8")
+
+    for lote in _lotes(query):
+        yield b"\n".join(dumps(_registro(linha, achatar)) for linha in lote) + b"\n"
+
+
+def gerar_csv(query, achatar: bool = False):
+    colunas = [c for c in NOMES_COLUNAS if not (achatar and c == "ai_analysis_json")]
+    if achatar:
+        colunas += CAMPOS_IA
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=colunas, extrasaction="ignore")
+    # BOM para o Excel abrir como UTF-8 (acentos)
+    buffer.write("\ufeff")
+    escritor.writeheader()
+    for lote in _lotes(query):
+        for linha in lote:
+            registro = _registro(linha, achatar)
+            for campo in ("extended_anamnesis_json", "ai_analysis_json"):
+                if registro.get(campo) is not None:
+                    registro[campo] = json.dumps(registro[campo], ensure_ascii=False)
+            escritor.writerow(registro)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def exportar(db, formato: str, query, achatar: bool = False):
+    """Gerador dos bytes da exportação; fecha a sessão no fim (ou se o cliente desconectar)."""
+    try:
+        gerador = gerar_csv if formato == "csv" else gerar_ndjson
+        yield from gerador(query, achatar)
+    finally:
+        db.close()
@@ -0,0 +1,239 @@
+import argparse
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, text
+
+import pagination
+
+# Busca textual nos casos (sintomas, HPMA, anamnese, exames, conclusão do médico e justificativa da IA).
+#
+# SQLite: tabela virtual FTS5 "cases_fts" (rowid = cases.id), mantida por triggers em cases — então
+#   cadastro, edição, reanálise, jobs, backfills e exclusão ficam sincronizados sem código extra.
+#   O tokenizer remove acentos: "toracica" encontra "torácica".
+# Postgres: coluna gerada cases.search_vector (tsvector) com índice GIN, na configuração textual
+#   portuguese_unaccent (cópia da portuguese com o dicionário unaccent antes do stemmer). Documento,
+#   consulta e ts_headline usam a mesma configuração, então "toracica" também encontra "torácica".
+#
+# Os resultados vêm ordenados por relevância (bm25 / ts_rank_cd) e paginados por cursor (score + id).
+# Nos dois bancos o score é positivo e maior = mais relevante.
+
+CAMPOS = ("symptoms", "hpma", "anamnesis", "exams_input", "doctor_conclusion", "justification")
+# Peso de cada campo no bm25 (mesma ordem de CAMPOS): sintomas e conclusão valem mais
+PESOS_BM25 = (4.0, 2.0, 1.0, 1.0, 3.0, 2.0)
+
+MARCA_INICIO, MARCA_FIM = "«", "»"
+PALAVRAS_SNIPPET = 16
+
+STOPWORDS = {
+    "a", "o", "e", "as", "os", "de", "da", "do", "das", "dos", "em", "na", "no", "nas", "nos",
+    "com", "sem", "para", "por", "que", "um", "uma", "ou", "ao", "aos", "se",
+}
+
+_JUSTIFICATIVA_SQLITE = "CASE WHEN json_valid({t}.ai_analysis_json) THEN json_extract({t}.ai_analysis_json, '$.justification') END"
+
+DDL_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS cases_fts USING fts5(
+        symptoms, hpma, anamnesis, exams_input, doctor_conclusion, justification,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS cases_fts_ai AFTER INSERT ON cases BEGIN
+        DELETE FROM cases_fts WHERE rowid = new.id;
+        INSERT INTO cases_fts(rowid, symptoms, hpma, anamnesis, exams_input, doctor_conclusion, justification)
+        VALUES (new.id, new.symptoms, new.hpma, new.anamnesis, new.exams_input, new.doctor_conclusion,
+                {_JUSTIFICATIVA_SQLITE.format(t="new")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cases_fts_au
+        AFTER UPDATE OF symptoms, hpma, anamnesis, exams_input, doctor_conclusion, ai_analysis_json ON cases BEGIN
+        DELETE FROM cases_fts WHERE rowid = old.id;
+        INSERT INTO cases_fts(rowid, symptoms, hpma, anamnesis, exams_input, doctor_conclusion, justification)
+        VALUES (new.id, new.symptoms, new.hpma, new.anamnesis, new.exams_input, new.doctor_conclusion,
+                {_JUSTIFICATIVA_SQLITE.format(t="new")});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cases_fts_ad AFTER DELETE ON cases BEGIN
+        DELETE FROM cases_fts WHERE rowid = old.id;
+    END""",
+]
+
+RECONSTRUIR_SQLITE = [
+    "DELETE FROM cases_fts",
+    f"""INSERT INTO cases_fts(rowid, symptoms, hpma, anamnesis, exams_input, doctor_conclusion, justification)
+        SELECT id, symptoms, hpma, anamnesis, exams_input, doctor_conclusion, {_JUSTIFICATIVA_SQLITE.format(t="cases")}
+        FROM cases""",
+]
+
+CONFIG_POSTGRES = "portuguese_unaccent"
+
+DDL_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # CREATE TEXT SEARCH CONFIGURATION não tem IF NOT EXISTS
+    f"""DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIG_POSTGRES}') THEN
+            CREATE TEXT SEARCH CONFIGURATION {CONFIG_POSTGRES} (COPY = portuguese);
+            ALTER TEXT SEARCH CONFIGURATION {CONFIG_POSTGRES}
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+        END IF;
+    END $$""",
+    f"""ALTER TABLE cases ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{CONFIG_POSTGRES}', coalesce(symptoms, '')), 'A') ||
+        setweight(to_tsvector('{CONFIG_POSTGRES}', coalesce(doctor_conclusion, '')), 'A') ||
+        setweight(to_tsvector('{CONFIG_POSTGRES}', coalesce(hpma, '') || ' ' || coalesce(ai_analysis_json->>'justification', '')), 'B') ||
+        setweight(to_tsvector('{CONFIG_POSTGRES}', coalesce(anamnesis, '') || ' ' || coalesce(exams_input, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_cases_search_vector ON cases USING gin (search_vector)",
+]
+
+# Bancos que criaram a coluna com a configuração antiga (portuguese, sem unaccent): a expressão de uma
+# coluna gerada não pode ser alterada, então ela é apagada e recriada pelo DDL_POSTGRES
+_EXPRESSAO_POSTGRES = """
+    SELECT generation_expression FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'cases' AND column_name = 'search_vector'
+"""
+REMOVER_COLUNA_POSTGRES = [
+    "DROP INDEX IF EXISTS ix_cases_search_vector",
+    "ALTER TABLE cases DROP COLUMN search_vector",
+]
+
+
+class BuscaIndisponivel(Exception):
+    pass
+
+
+def preparar_indice(engine) -> bool:
+    """Cria o índice textual se ainda não existir (idempotente). Retorna True se precisou popular do zero.
+
+    No Postgres também recria a coluna gerada quando ela ainda usa a configuração sem unaccent.
+    """
+    dialeto = engine.dialect.name
+    with engine.begin() as conn:
+        if dialeto == "sqlite":
+            existia = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cases_fts'"
+            )).first() is not None
+            for sql in DDL_SQLITE:
+                conn.execute(text(sql))
+            if not existia:
+                for sql in RECONSTRUIR_SQLITE:
+                    conn.execute(text(sql))
+            return not existia
+        if dialeto == "postgresql":
+            # A coluna gerada é preenchida pelo próprio Postgres ao ser criada (reescreve a tabela)
+            expressao = conn.execute(text(_EXPRESSAO_POSTGRES)).scalar()
+            if expressao is not None and CONFIG_POSTGRES not in expressao:
+                for sql in REMOVER_COLUNA_POSTGRES:
+                    conn.execute(text(sql))
+            for sql in DDL_POSTGRES:
+                conn.execute(text(sql))
+            return False
+    raise BuscaIndisponivel(f"Busca textual não suportada no banco {dialeto}")
+
+
+def remover_indice(engine):
+    """Usado pelo reset_db: no SQLite a tabela FTS não é apagada junto com cases."""
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS cases_fts"))
+
+
+def reconstruir_indice(engine):
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for sql in RECONSTRUIR_SQLITE:
+            conn.execute(text(sql))
+        conn.execute(text("INSERT INTO cases_fts(cases_fts) VALUES ('optimize')"))
+
+
+def _sem_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+
+def consulta_fts5(termos: str) -> str:
+    """Converte o texto digitado numa consulta FTS5 segura: todas as palavras (E), a última como prefixo."""
+    palavras = [p for p in re.findall(r"\w+", termos.lower()) if _sem_acentos(p) not in STOPWORDS]
+    if not palavras:
+        return ""
+    partes = [f'"{p}"' for p in palavras]
+    partes[-1] += "*"
+    return " ".join(partes)
+
+
+def _filtro_keyset(cursor):
+    if not cursor:
+        return "", {}
+    pos = pagination.decodificar_cursor(cursor, "rank")
+    return (
+        "AND (score < :cursor_score OR (score = :cursor_score AND id > :cursor_id))",
+        {"cursor_score": pos["v"], "cursor_id": pos["id"]},
+    )
+
+
+def buscar(db, owner_id: int, termos: str, limit: int, cursor: str = None):
+    """Retorna ([(case_id, score, snippet)], próximo_cursor), do mais ao menos relevante."""
+    dialeto = db.get_bind().dialect.name
+    if dialeto == "sqlite":
+        consulta = consulta_fts5(termos)
+        pesos = ", ".join(str(p) for p in PESOS_BM25)
+        # bm25 é negativo (menor = mais relevante): invertido para o score valer como o ts_rank_cd
+        sql_ranking = f"""
+            SELECT c.id AS id, -bm25(cases_fts, {pesos}) AS score
+            FROM cases_fts JOIN cases c ON c.id = cases_fts.rowid
+            WHERE cases_fts MATCH :consulta AND c.owner_id = :owner_id
+        """
+        sql_snippets = f"""
+            SELECT rowid, snippet(cases_fts, -1, :ini, :fim, '…', {PALAVRAS_SNIPPET})
+            FROM cases_fts WHERE cases_fts MATCH :consulta AND rowid IN :ids
+        """
+    elif dialeto == "postgresql":
+        consulta = termos.strip()
+        sql_ranking = f"""
+            SELECT c.id AS id, ts_rank_cd(c.search_vector, q) AS score
+            FROM cases c, websearch_to_tsquery('{CONFIG_POSTGRES}', :consulta) q
+            WHERE c.owner_id = :owner_id AND c.search_vector @@ q
+        """
+        sql_snippets = f"""
+            SELECT id, ts_headline('{CONFIG_POSTGRES}',
+                concat_ws(' … ', symptoms, hpma, anamnesis, exams_input, doctor_conclusion, ai_analysis_json->>'justification'),
+                websearch_to_tsquery('{CONFIG_POSTGRES}', :consulta),
+                'StartSel=' || :ini || ', StopSel=' || :fim || ', MaxWords={PALAVRAS_SNIPPET}, MinWords=6, MaxFragments=2')
+            FROM cases WHERE id IN :ids
+        """
+    else:
+        raise BuscaIndisponivel(f"Busca textual não suportada no banco {dialeto}")
+
+    if not consulta:
+        return [], None
+
+    filtro, params_cursor = _filtro_keyset(cursor)
+    # Só o ranking roda sobre todos os resultados; os snippets são gerados apenas para a página
+    linhas = db.execute(
+        text(f"SELECT id, score FROM ({sql_ranking}) AS r WHERE 1 = 1 {filtro} ORDER BY score DESC, id LIMIT :limite"),
+        {"consulta": consulta, "owner_id": owner_id, "limite": limit + 1, **params_cursor},
+    ).all()
+
+    proximo = None
+    if len(linhas) > limit:
+        linhas = linhas[:limit]
+        proximo = pagination.codificar_cursor("rank", float(linhas[-1].score), linhas[-1].id)
+    if not linhas:
+        return [], None
+
+    snippets = dict(db.execute(
+        text(sql_snippets).bindparams(bindparam("ids", expanding=True)),
+        {"consulta": consulta, "ids": [l.id for l in linhas], "ini": MARCA_INICIO, "fim": MARCA_FIM},
+    ).all())
+    return [(l.id, float(l.score), snippets.get(l.id)) for l in linhas], proximo
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Cria ou reconstrói o índice de busca textual dos casos.")
+    parser.add_argument("--rebuild", action="store_true", help="Repopula o índice FTS5 a partir de cases (SQLite)")
+    args = parser.parse_args()
+
+    criado = preparar_indice(engine)
+    if args.rebuild and not criado:
+        reconstruir_indice(engine)
+        criado = True
+    print("Índice de busca textual " + ("populado a partir dos casos." if criado else "já estava pronto."))
@@ -0,0 +1,289 @@
+import copy
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+import models
+from database import ReadSessionLocal
+
+# Casos parecidos (GET /cases/{id}/similar) e reaproveitamento de análises revisadas.
+#
+# Cada caso vira um vetor de n-gramas de palavras (unigramas e bigramas, sem acentos e stopwords) do
+# relato clínico — queixa, HPMA, anamnese e revisão por sistemas — projetados por hashing em
+# SIMILARITY_DIMENSIONS posições (hashing trick: sem vocabulário para manter, com sinal para os
+# conflitos se cancelarem em média) e normalizados, então o produto escalar é a similaridade do cosseno.
+#
+# Os vetores ficam numa matriz NumPy em memória (float32; ~2 KB por caso com 512 dimensões) com
+# inclusão/remoção incremental, e a busca é exata: um produto matriz-vetor filtrado pelo médico.
+# O índice é carregado do banco no startup (em segundo plano) e sincronizado pela coluna
+# cases.updated_at a cada SIMILARITY_SYNC_SECONDS no máximo, então pega também o que outros workers
+# gravaram. Casos apagados saem do índice quando aparecem numa busca e não existem mais.
+#
+# Desligado por padrão (SIMILARITY_ENABLED): ligado, cada worker carrega o relato de todos os casos na
+# memória no startup. Só entram no resultado casos com similaridade acima de SIMILARITY_MIN_SCORE.
+#
+# Com SIMILARITY_REUSE_ENABLED=true, executar_analise_ia devolve a análise de um caso "Revisado pelo
+# Médico" do mesmo médico e do mesmo grupo clínico (urgência, pediátrico ou rotina — o main configura
+# com faixa_analise, então dose pediátrica nunca vai para adulto) quando a similaridade passa de
+# SIMILARITY_REUSE_THRESHOLD, sem chamar o Gemini. force_refresh ignora o reaproveitamento, como o cache.
+
+SIMILARITY_HABILITADO = os.getenv("SIMILARITY_ENABLED", "false").lower() in ("1", "true", "yes")
+SIMILARITY_DIMENSOES = int(os.getenv("SIMILARITY_DIMENSIONS", "512"))
+SIMILARITY_SYNC_SECONDS = float(os.getenv("SIMILARITY_SYNC_SECONDS", "2"))
+# Abaixo disso os relatos só compartilham palavras soltas: não é um caso "parecido"
+SIMILARITY_MIN_SCORE = float(os.getenv("SIMILARITY_MIN_SCORE", "0.2"))
+SIMILARITY_REUSO_HABILITADO = os.getenv("SIMILARITY_REUSE_ENABLED", "false").lower() in ("1", "true", "yes")
+SIMILARITY_REUSO_LIMIAR = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.92"))
+
+STATUS_REVISADO = "Revisado pelo Médico"
+LOTE_CARGA = 1000
+
+# Peso de cada parte do relato: a queixa principal define mais a apresentação que o resto
+PESOS_CAMPOS = (("symptoms", 2.0), ("hpma", 1.0), ("anamnesis", 1.0), ("revisao_sistemas", 0.5))
+
+STOPWORDS = {
+    "a", "o", "e", "as", "os", "de", "da", "do", "das", "dos", "em", "na", "no", "nas", "nos",
+    "com", "sem", "para", "por", "que", "um", "uma", "ou", "ao", "aos", "se", "ha", "ja", "mais",
+    "paciente", "refere", "relata", "apresenta", "dias", "dia",
+}
+
+COLUNAS_INDICE = (
+    models.Case.id, models.Case.owner_id, models.Case.status, models.Case.care_type,
+    models.Case.symptoms, models.Case.hpma, models.Case.anamnesis, models.Case.extended_anamnesis_json,
+    models.Case.updated_at, models.Patient.birth_date,
+)
+
+
+def _tokens(texto: str) -> list:
+    sem_acentos = "".join(c for c in unicodedata.normalize("NFD", texto.lower()) if unicodedata.category(c) != "Mn")
+    return [t for t in re.findall(r"[a-z0-9]+", sem_acentos) if len(t) > 1 and t not in STOPWORDS]
+
+
+def textos_caso(symptoms, hpma, anamnesis, extended_anamnesis) -> dict:
+    extended_anamnesis = extended_anamnesis if isinstance(extended_anamnesis, dict) else {}
+    return {
+        "symptoms": symptoms,
+        "hpma": hpma,
+        "anamnesis": anamnesis,
+        "revisao_sistemas": extended_anamnesis.get("revisao_sistemas"),
+    }
+
+
+def vetorizar(textos: dict, dimensoes: int = SIMILARITY_DIMENSOES):
+    """Vetor normalizado (float32) dos n-gramas do relato, ou None se não houver texto aproveitável."""
+    vetor = np.zeros(dimensoes, dtype=np.float32)
+    for campo, peso in PESOS_CAMPOS:
+        texto = textos.get(campo)
+        if not texto:
+            continue
+        tokens = _tokens(str(texto))
+        for termo in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = zlib.crc32(termo.encode("utf-8"))
+            vetor[h % dimensoes] += peso if h & 0x80000000 else -peso
+    norma = float(np.linalg.norm(vetor))
+    if norma == 0.0:
+        return None
+    return vetor / norma
+
+
+class IndiceSimilaridade:
+    def __init__(self, dimensoes: int):
+        self.dimensoes = dimensoes
+        self._vetores = np.zeros((0, dimensoes), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._grupos = np.zeros(0, dtype=np.int32)
+        self._revisados = np.zeros(0, dtype=bool)
+        self._n = 0
+        self._linha = {}
+        self._codigos_grupo = {}
+        self._classificar = None
+        self._marca = None
+        self._carregado = False
+        self._ultima_sync = 0.0
+        self._lock = threading.RLock()
+        self._lock_sync = threading.Lock()
+
+    def configurar(self, classificar):
+        """classificar(care_type, birth_date) -> chave do grupo clínico (só reaproveita dentro do mesmo grupo)."""
+        self._classificar = classificar
+
+    def codigo_grupo(self, care_type, birth_date) -> int:
+        chave = self._classificar(care_type, birth_date) if self._classificar else care_type
+        with self._lock:
+            return self._codigos_grupo.setdefault(chave, len(self._codigos_grupo))
+
+    # --- inclusão / remoção ---
+
+    def _crescer(self, minimo: int):
+        capacidade = max(minimo, 2 * len(self._ids), 1024)
+        self._vetores = np.resize(self._vetores, (capacidade, self.dimensoes))
+        for nome in ("_ids", "_owners", "_grupos", "_revisados"):
+            setattr(self, nome, np.resize(getattr(self, nome), capacidade))
+
+    def adicionar(self, case_id: int, owner_id: int, vetor, grupo: int, revisado: bool):
+        """Inclui ou atualiza o caso; sem vetor (relato vazio) o caso sai do índice."""
+        if vetor is None:
+            self.remover(case_id)
+            return
+        with self._lock:
+            linha = self._linha.get(case_id)
+            if linha is None:
+                if self._n == len(self._ids):
+                    self._crescer(self._n + 1)
+                linha = self._n
+                self._n += 1
+                self._linha[case_id] = linha
+            self._vetores[linha] = vetor
+            self._ids[linha] = case_id
+            self._owners[linha] = owner_id if owner_id is not None else -1
+            self._grupos[linha] = grupo
+            self._revisados[linha] = revisado
+
+    def remover(self, case_id: int):
+        with self._lock:
+            linha = self._linha.pop(case_id, None)
+            if linha is None:
+                return
+            # A última linha ocupa o lugar da removida (a matriz continua contígua)
+            ultima = self._n - 1
+            if linha != ultima:
+                for nome in ("_vetores", "_ids", "_owners", "_grupos", "_revisados"):
+                    arr = getattr(self, nome)
+                    arr[linha] = arr[ultima]
+                self._linha[int(self._ids[linha])] = linha
+            self._n = ultima
+
+    def __len__(self):
+        return self._n
+
+    # --- sincronização com o banco ---
+
+    def _indexar_linha(self, linha):
+        textos = textos_caso(linha.symptoms, linha.hpma, linha.anamnesis, linha.extended_anamnesis_json)
+        self.adicionar(
+            linha.id, linha.owner_id, vetorizar(textos, self.dimensoes),
+            self.codigo_grupo(linha.care_type, linha.birth_date), linha.status == STATUS_REVISADO,
+        )
+        if linha.updated_at is not None and (self._marca is None or linha.updated_at > self._marca):
+            self._marca = linha.updated_at
+
+    def sincronizar(self, forcar: bool = False):
+        """Carrega o índice na primeira chamada; depois traz só os casos alterados desde a última vez."""
+        if not SIMILARITY_HABILITADO:
+            return
+        if not forcar and self._carregado and time.monotonic() - self._ultima_sync < SIMILARITY_SYNC_SECONDS:
+            return
+        with self._lock_sync:
+            if not forcar and self._carregado and time.monotonic() - self._ultima_sync < SIMILARITY_SYNC_SECONDS:
+                return
+            inicio = time.perf_counter()
+            db = ReadSessionLocal()
+            try:
+                query = db.query(*COLUNAS_INDICE).join(models.Patient, models.Case.patient_id == models.Patient.id)
+                if self._carregado:
+                    # >= : casos gravados no mesmo instante da marca podem não ter sido vistos ainda
+                    query = query.filter(
+                        models.Case.updated_at >= self._marca if self._marca is not None
+                        else models.Case.updated_at.isnot(None)
+                    )
+                total = 0
+                for linha in query.yield_per(LOTE_CARGA):
+                    self._indexar_linha(linha)
+                    total += 1
+            finally:
+                db.close()
+            if not self._carregado:
+                ms = (time.perf_counter() - inicio) * 1000
+                print(f"Índice de similaridade carregado: {len(self)} caso(s) em {ms:.0f} ms.")
+            self._carregado = True
+            self._ultima_sync = time.monotonic()
+
+    def carregar_em_segundo_plano(self):
+        def _carregar():
+            try:
+                self.sincronizar(forcar=True)
+            except Exception as e:
+                print(f"Erro ao carregar índice de similaridade: {e}")
+        threading.Thread(target=_carregar, name="indice-similaridade", daemon=True).start()
+
+    # --- busca ---
+
+    def buscar(self, vetor, owner_id: int, k: int = 10, excluir=None, grupo: int = None,
+               apenas_revisados: bool = False, minimo: float = SIMILARITY_MIN_SCORE) -> list:
+        """Os k casos do médico mais parecidos com o vetor (similaridade > minimo): [(case_id, similaridade)],
+        do maior ao menor."""
+        if vetor is None:
+            return []
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            scores = self._vetores[:n] @ vetor
+            validos = (self._owners[:n] == owner_id) & (scores > max(minimo, 0.0))
+            if grupo is not None:
+                validos &= self._grupos[:n] == grupo
+            if apenas_revisados:
+                validos &= self._revisados[:n]
+            if excluir is not None and excluir in self._linha:
+                validos[self._linha[excluir]] = False
+            ids = self._ids[:n]
+            candidatos = np.flatnonzero(validos)
+            if candidatos.size == 0:
+                return []
+            if candidatos.size > k:
+                melhores = np.argpartition(scores[candidatos], -k)[-k:]
+                candidatos = candidatos[melhores]
+            ordem = candidatos[np.argsort(-scores[candidatos], kind="stable")]
+            return [(int(ids[i]), float(scores[i])) for i in ordem]
+
+
+indice_similaridade = IndiceSimilaridade(SIMILARITY_DIMENSOES)
+
+
+def similares(db, case, k: int, apenas_revisados: bool = False, minimo: float = SIMILARITY_MIN_SCORE) -> list:
+    """Casos parecidos com `case` (mesmo médico), já conferidos no banco: [(case_id, similaridade)]."""
+    indice_similaridade.sincronizar()
+    textos = textos_caso(case.symptoms, case.hpma, case.anamnesis, case.extended_anamnesis_json)
+    encontrados = indice_similaridade.buscar(
+        vetorizar(textos), case.owner_id, k, excluir=case.id, apenas_revisados=apenas_revisados, minimo=minimo,
+    )
+    existentes = {
+        case_id for (case_id,) in
+        db.query(models.Case.id).filter(models.Case.id.in_([case_id for case_id, _ in encontrados]))
+    } if encontrados else set()
+    for case_id, _ in encontrados:
+        if case_id not in existentes:
+            indice_similaridade.remover(case_id)
+    return [(case_id, score) for case_id, score in encontrados if case_id in existentes]
+
+
+def analise_reaproveitavel(owner_id: int, care_type, birth_date, textos: dict, excluir=None):
+    """(ai_analysis_json, case_id, similaridade) do caso revisado mais parecido acima do limiar, ou None."""
+    if not (SIMILARITY_HABILITADO and SIMILARITY_REUSO_HABILITADO) or owner_id is None:
+        return None
+    indice_similaridade.sincronizar()
+    grupo = indice_similaridade.codigo_grupo(care_type, birth_date)
+    encontrados = indice_similaridade.buscar(
+        vetorizar(textos), owner_id, k=3, excluir=excluir, grupo=grupo, apenas_revisados=True,
+    )
+    db = ReadSessionLocal()
+    try:
+        for case_id, score in encontrados:
+            if score < SIMILARITY_REUSO_LIMIAR:
+                break
+            vizinho = db.query(models.Case.ai_analysis_json, models.Case.status).\
+                filter(models.Case.id == case_id).first()
+            # Confere no banco: o caso pode ter sido apagado ou editado depois da última sincronização
+            if vizinho is None:
+                indice_similaridade.remover(case_id)
+            elif vizinho.status == STATUS_REVISADO and isinstance(vizinho.ai_analysis_json, dict):
+                return copy.deepcopy(vizinho.ai_analysis_json), case_id, score
+    finally:
+        db.close()
+    return None
@@ -0,0 +1,195 @@
+import bisect
+import csv
+import os
+import re
+import threading
+import unicodedata
+
+# Catálogo CID-10 em memória para autocomplete e validação dos códigos sugeridos pela IA.
+#
+# Carregado uma vez do arquivo em CID10_CATALOG_PATH (padrão: data/cid10_parcial.csv, um recorte parcial
+# com os códigos mais comuns na atenção primária e na urgência). Aceita dois formatos:
+#   - "codigo;descricao" (o recorte embutido)
+#   - CID10CM_SUBCATEGORIAS.CSV / CID10CM_CATEGORIAS.CSV do DATASUS (latin-1, coluna SUBCAT ou CAT + DESCRICAO)
+#
+# O índice são arrays ordenados + bisect: uma busca por prefixo custa O(log n + resultados).
+# Só a lista de subcategorias do DATASUS conta como catálogo completo. Com ela, códigos fora do catálogo
+# ficam com "validated": false (ou, com CID10_STRICT=true, são descartados ou trocados pela categoria de
+# 3 caracteres). Com um recorte parcial, ausência não prova que o código é inválido: ele é mantido com
+# "validated": null (não conferido) e CID10_STRICT é ignorado.
+
+CATALOGO_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cid10_parcial.csv")
+CID10_CATALOG_PATH = os.getenv("CID10_CATALOG_PATH", CATALOGO_PADRAO)
+CID10_STRICT = os.getenv("CID10_STRICT", "false").lower() in ("1", "true", "yes")
+
+# Código usado por resultado_ia_indisponivel / completar_resultado_ia quando não há classificação
+CODIGO_SEM_CLASSIFICACAO = "Z99"
+SEM_CLASSIFICACAO = {"code": CODIGO_SEM_CLASSIFICACAO, "description": "Não classificado"}
+
+_FORMATO_CODIGO = re.compile(r"^([A-Z])(\d{2})\.?([0-9X])?$")
+_PARECE_CODIGO = re.compile(r"^[A-Za-z](\d|$)")
+
+
+def normalizar_codigo(codigo) -> str:
+    """"j180", "J18.0 " e "J18,0" viram "J18.0". Retorna None se não tiver formato de CID-10."""
+    if not isinstance(codigo, str):
+        return None
+    limpo = re.sub(r"[\s,\-]", ".", codigo.strip().upper()).strip(".")
+    m = _FORMATO_CODIGO.match(limpo)
+    if not m:
+        return None
+    letra, categoria, sub = m.groups()
+    return f"{letra}{categoria}.{sub}" if sub else f"{letra}{categoria}"
+
+
+def normalizar_texto(texto: str) -> str:
+    sem_acento = "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+    return " ".join(re.findall(r"[a-z0-9]+", sem_acento.lower()))
+
+
+class CatalogoCID10:
+    def __init__(self, itens, completo: bool = False):
+        self.completo = completo
+        self.descricoes = {}
+        for codigo, descricao in itens:
+            codigo = normalizar_codigo(codigo)
+            if codigo and descricao:
+                self.descricoes[codigo] = descricao.strip()
+
+        # Códigos sem ponto, para "j18" encontrar J18, J18.0, J18.1...
+        codigos = sorted((c.replace(".", ""), c) for c in self.descricoes)
+        self._chaves_codigo = [k for k, _ in codigos]
+        self._codigos = [c for _, c in codigos]
+
+        # Um termo por início de palavra da descrição: "pneumonia bacteriana" é encontrada por "pneu" e por "bact"
+        termos = []
+        for codigo, descricao in self.descricoes.items():
+            palavras = normalizar_texto(descricao).split()
+            for i in range(len(palavras)):
+                termos.append((" ".join(palavras[i:]), i, codigo))
+        termos.sort()
+        self._chaves_termo = [t for t, _, _ in termos]
+        self._termos = [(i, c) for _, i, c in termos]
+
+    def __len__(self):
+        return len(self.descricoes)
+
+    def __contains__(self, codigo):
+        return codigo in self.descricoes
+
+    def _prefixo(self, chaves, prefixo):
+        inicio = bisect.bisect_left(chaves, prefixo)
+        fim = bisect.bisect_left(chaves, prefixo + "\uffff", lo=inicio)
+        return range(inicio, fim)
+
+    def buscar(self, q: str, limite: int = 10) -> list:
+        """Autocomplete por prefixo de código ou de palavras da descrição (sem diferenciar acentos)."""
+        encontrados = []
+        vistos = set()
+
+        q = (q or "").strip()
+        if _PARECE_CODIGO.match(q):
+            chave = re.sub(r"[^A-Z0-9]", "", q.upper())
+            for i in self._prefixo(self._chaves_codigo, chave):
+                encontrados.append(self._codigos[i])
+                vistos.add(self._codigos[i])
+                if len(encontrados) >= limite:
+                    break
+
+        texto = normalizar_texto(q)
+        if texto and len(encontrados) < limite:
+            # Descrições que começam com o texto vêm antes das que só têm uma palavra começando com ele
+            inicio_descricao, meio_descricao = [], []
+            for i in self._prefixo(self._chaves_termo, texto):
+                posicao, codigo = self._termos[i]
+                destino = inicio_descricao if posicao == 0 else meio_descricao
+                if codigo not in vistos and len(destino) < limite:
+                    destino.append(codigo)
+                    vistos.add(codigo)
+                if len(inicio_descricao) >= limite:
+                    break
+            encontrados = (encontrados + inicio_descricao + meio_descricao)[:limite]
+
+        return [{"code": c, "description": self.descricoes[c]} for c in encontrados]
+
+    def validar(self, item, estrito: bool = CID10_STRICT):
+        """Normaliza um {"code", "description"} vindo da IA. Retorna None se deve ser descartado (sem código)."""
+        if not isinstance(item, dict):
+            return None
+        codigo = normalizar_codigo(item.get("code"))
+        if codigo in self.descricoes:
+            return {"code": codigo, "description": self.descricoes[codigo], "validated": True}
+        if estrito and self.completo:
+            categoria = codigo[:3] if codigo else None
+            if categoria in self.descricoes:
+                return {"code": categoria, "description": self.descricoes[categoria], "validated": True}
+            return None
+        if not codigo:
+            # Sem formato de CID-10: mantém o texto do modelo (nunca troca um código existente por None)
+            bruto = str(item.get("code") or "").strip()
+            return {"code": bruto, "description": item.get("description"), "validated": False} if bruto else None
+        return {
+            "code": codigo,
+            "description": item.get("description"),
+            # Fora de um recorte parcial não quer dizer inválido: fica como não conferido
+            "validated": False if self.completo else None,
+        }
+
+    def normalizar_resultado(self, ai_result: dict) -> dict:
+        """Valida cid10 e cid10_secondary do resultado da IA (remove repetidos e o principal da lista secundária)."""
+        principal = ai_result.get("cid10")
+        if isinstance(principal, dict) and principal.get("code") != CODIGO_SEM_CLASSIFICACAO:
+            ai_result["cid10"] = self.validar(principal) or dict(SEM_CLASSIFICACAO)
+        elif not isinstance(principal, dict):
+            ai_result["cid10"] = dict(SEM_CLASSIFICACAO)
+
+        secundarios = []
+        vistos = {ai_result["cid10"].get("code")}
+        for item in ai_result.get("cid10_secondary") or []:
+            validado = self.validar(item)
+            if validado and validado["code"] and validado["code"] not in vistos:
+                secundarios.append(validado)
+                vistos.add(validado["code"])
+        ai_result["cid10_secondary"] = secundarios
+        return ai_result
+
+
+def ler_arquivo(caminho: str):
+    """Retorna ([(codigo, descricao)], completo): completo só para a lista de subcategorias do DATASUS."""
+    with open(caminho, "rb") as f:
+        bruto = f.read()
+    try:
+        conteudo = bruto.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        conteudo = bruto.decode("latin-1")  # arquivos do DATASUS
+
+    linhas = csv.reader(conteudo.splitlines(), delimiter=";")
+    cabecalho = [c.strip().upper() for c in next(linhas, [])]
+    col_codigo, col_descricao = 0, 1
+    completo = False
+    for coluna in ("SUBCAT", "CAT"):
+        if coluna in cabecalho and "DESCRICAO" in cabecalho:
+            col_codigo, col_descricao = cabecalho.index(coluna), cabecalho.index("DESCRICAO")
+            completo = coluna == "SUBCAT"
+            break
+    itens = [(l[col_codigo], l[col_descricao]) for l in linhas if len(l) > max(col_codigo, col_descricao)]
+    return itens, completo
+
+
+_catalogo = None
+_lock = threading.Lock()
+
+
+def catalogo() -> CatalogoCID10:
+    """Catálogo carregado sob demanda (uma vez por processo); o startup chama para já deixar pronto."""
+    global _catalogo
+    if _catalogo is None:
+        with _lock:
+            if _catalogo is None:
+                try:
+                    itens, completo = ler_arquivo(CID10_CATALOG_PATH)
+                except OSError as e:
+                    print(f"Catálogo CID-10 não carregado ({CID10_CATALOG_PATH}): {e}")
+                    itens, completo = [], False
+                _catalogo = CatalogoCID10(itens, completo)
+    return _catalogo
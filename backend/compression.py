@@ -0,0 +1,104 @@
+import gzip
+import os
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # opcional: pip install brotli
+    brotli = None
+
+# Compressão gzip/brotli das respostas (middleware ASGI).
+#
+# Só comprime respostas de corpo único (JSON das rotas, /metrics) com pelo menos COMPRESSION_MIN_BYTES:
+# respostas em streaming (SSE da análise, exportações) passam direto, sem buffer. Brotli é usado quando
+# o pacote está instalado e o cliente aceita "br"; senão gzip. Corpos grandes são comprimidos fora do
+# event loop. As ETags são fracas (W/), então continuam válidas para a versão comprimida.
+
+COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+TIPOS_COMPRIMIVEIS = ("application/json", "text/plain", "text/csv", "application/x-ndjson")
+# Acima disso a compressão roda numa thread para não travar as outras requisições
+LIMITE_THREAD_BYTES = 256 * 1024
+
+
+def escolher_codificacao(accept_encoding: str):
+    aceitas = {}
+    for parte in (accept_encoding or "").lower().split(","):
+        nome, _, params = parte.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nome:
+            aceitas[nome] = q
+    if brotli is not None and aceitas.get("br", 0) > 0:
+        return "br"
+    if aceitas.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def comprimir(corpo: bytes, codificacao: str) -> bytes:
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(corpo, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressaoMiddleware:
+    def __init__(self, app, minimo: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codificacao = escolher_codificacao(Headers(scope=scope).get("accept-encoding"))
+        if codificacao is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+
+        async def enviar(message):
+            nonlocal inicio
+            if message["type"] == "http.response.start":
+                # Segura o início até ver o primeiro pedaço do corpo: só então dá para decidir
+                inicio = message
+                return
+            if message["type"] != "http.response.body" or inicio is None:
+                await send(message)
+                return
+
+            start, inicio = inicio, None
+            corpo = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            tipo = headers.get("content-type", "").split(";")[0].strip()
+            if (
+                message.get("more_body")
+                or len(corpo) < self.minimo
+                or "content-encoding" in headers
+                or tipo not in TIPOS_COMPRIMIVEIS
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            if len(corpo) > LIMITE_THREAD_BYTES:
+                comprimido = await run_in_threadpool(comprimir, corpo, codificacao)
+            else:
+                comprimido = comprimir(corpo, codificacao)
+            headers["Content-Encoding"] = codificacao
+            headers["Content-Length"] = str(len(comprimido))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": comprimido})
+
+        await self.app(scope, receive, enviar)
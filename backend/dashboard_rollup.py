@@ -0,0 +1,156 @@
+import argparse
+from collections import Counter
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+# Agregados do dashboard mantidos de forma incremental.
+# Cada linha de dashboard_rollup conta os casos de um médico por (dia, urgência, tipo de atendimento, patologia).
+# As rotas que criam/alteram/removem casos aplicam o delta na mesma transação do caso;
+# reconstruir() recalcula tudo a partir da tabela cases para corrigir divergências.
+
+URGENCIAS_VALIDAS = ("Alta", "Média", "Baixa")
+
+
+def chave_rollup(case):
+    """Retorna a chave (owner_id, dia, urgência, care_type, patologia) que o caso ocupa no rollup."""
+    ai = case.ai_analysis_json or {}
+    urgency = ai.get("urgency", "Indefinida")
+    if urgency not in URGENCIAS_VALIDAS:
+        urgency = "Indefinida"
+    day = case.created_at.date().isoformat() if case.created_at else None
+    return (
+        case.owner_id,
+        day,
+        urgency,
+        case.care_type or "Clínica Geral",
+        ai.get("pathology_type") or "",
+    )
+
+
+def _upsert(db, chave, delta: int):
+    owner_id, day, urgency, care_type, pathology_type = chave
+    valores = dict(owner_id=owner_id, day=day, urgency=urgency, care_type=care_type,
+                   pathology_type=pathology_type, count=delta)
+    dialeto = db.get_bind().dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialeto == "sqlite" else postgresql.insert
+        stmt = insert(models.DashboardRollup).values(**valores)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["owner_id", "day", "urgency", "care_type", "pathology_type"],
+            set_={"count": models.DashboardRollup.count + stmt.excluded.count},
+        )
+        db.execute(stmt)
+        return
+
+    linha = _filtrar_chave(db.query(models.DashboardRollup), chave).first()
+    if linha:
+        linha.count += delta
+    else:
+        db.add(models.DashboardRollup(**valores))
+
+
+def _filtrar_chave(query, chave):
+    owner_id, day, urgency, care_type, pathology_type = chave
+    return query.filter(
+        models.DashboardRollup.owner_id == owner_id,
+        models.DashboardRollup.day == day,
+        models.DashboardRollup.urgency == urgency,
+        models.DashboardRollup.care_type == care_type,
+        models.DashboardRollup.pathology_type == pathology_type,
+    )
+
+
+def aplicar_delta(db, chave, delta: int):
+    if chave is None or chave[0] is None or chave[1] is None or delta == 0:
+        return
+    if delta > 0:
+        _upsert(db, chave, delta)
+        return
+
+    db.execute(
+        _filtrar_chave(update(models.DashboardRollup), chave).
+        values(count=models.DashboardRollup.count + delta).
+        execution_options(synchronize_session=False)
+    )
+    _filtrar_chave(db.query(models.DashboardRollup), chave).\
+        filter(models.DashboardRollup.count <= 0).\
+        delete(synchronize_session=False)
+
+
+def registrar_caso(db, case):
+    """Conta um caso novo. O caso precisa ter passado por flush (created_at preenchido)."""
+    aplicar_delta(db, chave_rollup(case), +1)
+
+
+def remover_caso(db, case):
+    aplicar_delta(db, chave_rollup(case), -1)
+
+
+def mover_caso(db, chave_antiga, case):
+    """Move o caso para a chave atual se algo relevante mudou (ex.: nova urgência após reanálise)."""
+    chave_nova = chave_rollup(case)
+    if chave_nova != chave_antiga:
+        aplicar_delta(db, chave_antiga, -1)
+        aplicar_delta(db, chave_nova, +1)
+
+
+def reconstruir(db, owner_id=None, lote: int = 1000) -> int:
+    """Recalcula o rollup a partir da tabela cases. Retorna o número de linhas gravadas."""
+    consulta = db.query(
+        models.Case.owner_id, models.Case.created_at, models.Case.care_type, models.Case.ai_analysis_json
+    )
+    limpeza = db.query(models.DashboardRollup)
+    if owner_id is not None:
+        consulta = consulta.filter(models.Case.owner_id == owner_id)
+        limpeza = limpeza.filter(models.DashboardRollup.owner_id == owner_id)
+
+    contagem: Counter = Counter()
+    for row in consulta.yield_per(lote):
+        chave = chave_rollup(row)
+        if chave[0] is not None and chave[1] is not None:
+            contagem[chave] += 1
+
+    limpeza.delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.DashboardRollup, [
+        dict(owner_id=o, day=d, urgency=u, care_type=c, pathology_type=p, count=n)
+        for (o, d, u, c, p), n in contagem.items()
+    ])
+    db.commit()
+    return len(contagem)
+
+
+def ler_estatisticas(db, owner_id: int, dias_inicio: str):
+    """Consulta agregada do dashboard: só lê linhas do rollup, nunca a tabela cases."""
+    Rollup = models.DashboardRollup
+    total = func.sum(Rollup.count)
+    base = db.query(Rollup).filter(Rollup.owner_id == owner_id)
+
+    urgency = base.with_entities(Rollup.urgency, total).group_by(Rollup.urgency).all()
+    care_type = base.with_entities(Rollup.care_type, total).group_by(Rollup.care_type).\
+        order_by(total.desc(), Rollup.care_type).all()
+    pathology = base.with_entities(Rollup.pathology_type, total).\
+        filter(Rollup.pathology_type != "").group_by(Rollup.pathology_type).\
+        order_by(total.desc(), Rollup.pathology_type).limit(5).all()
+    por_dia = base.with_entities(Rollup.day, total).\
+        filter(Rollup.day >= dias_inicio).group_by(Rollup.day).all()
+
+    return urgency, care_type, pathology, por_dia
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Reconstrói os agregados do dashboard a partir dos casos.")
+    parser.add_argument("--owner-id", type=int, default=None, help="Reconstrói só os agregados deste médico")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        linhas = reconstruir(db, owner_id=args.owner_id)
+        print(f"Rollup do dashboard reconstruído: {linhas} linha(s).")
+    finally:
+        db.close()
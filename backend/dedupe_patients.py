@@ -0,0 +1,98 @@
+import argparse
+
+from sqlalchemy import func
+
+import http_cache
+import models
+import patient_matching
+from database import SessionLocal
+
+# Ferramenta única para limpar pacientes duplicados antigos:
+#   1) preenche cpf_digits/match_key dos pacientes que ainda não têm as chaves
+#   2) junta duplicatas do mesmo médico (mesmo CPF, ou mesmo nome normalizado + nascimento sem CPF conflitante):
+#      os casos passam para o paciente mais antigo, campos vazios dele são completados e as cópias são apagadas
+# Use --dry-run para só listar o que seria feito (o passo 1 roda mesmo assim: só grava colunas derivadas).
+
+CAMPOS_COMPLETAVEIS = ("cpf", "mother_name", "medical_history", "gender")
+
+
+def preencher_chaves_pendentes(db, lote: int = 1000) -> int:
+    total = 0
+    while True:
+        pacientes = db.query(models.Patient).filter(models.Patient.match_key.is_(None)).limit(lote).all()
+        if not pacientes:
+            return total
+        for p in pacientes:
+            patient_matching.preencher_chaves(p)
+        db.commit()
+        total += len(pacientes)
+
+
+def _grupos_duplicados(db, coluna):
+    chaves = db.query(models.Patient.owner_id, coluna).\
+        filter(coluna.isnot(None)).\
+        group_by(models.Patient.owner_id, coluna).\
+        having(func.count(models.Patient.id) > 1).all()
+    for owner_id, chave in chaves:
+        yield db.query(models.Patient).\
+            filter(models.Patient.owner_id == owner_id, coluna == chave).\
+            order_by(models.Patient.id).all()
+
+
+def _mesclar(db, principal, duplicatas, dry_run: bool) -> int:
+    ids = [d.id for d in duplicatas]
+    casos = db.query(func.count(models.Case.id)).filter(models.Case.patient_id.in_(ids)).scalar()
+    print(f"  paciente {principal.id} ({principal.full_name}) <- {ids} ({casos} caso(s))")
+    if dry_run:
+        return len(ids)
+
+    for d in duplicatas:
+        for campo in CAMPOS_COMPLETAVEIS:
+            if not getattr(principal, campo) and getattr(d, campo):
+                setattr(principal, campo, getattr(d, campo))
+    patient_matching.preencher_chaves(principal)
+
+    db.query(models.Case).filter(models.Case.patient_id.in_(ids)).\
+        update({models.Case.patient_id: principal.id}, synchronize_session=False)
+    # Updates em massa não passam pelo before_flush: versões incrementadas aqui para invalidar as ETags
+    # (inclui os casos que já eram do principal, cujos dados do paciente podem ter sido completados)
+    db.query(models.Case).filter(models.Case.patient_id == principal.id).\
+        update({models.Case.version: models.Case.version + 1}, synchronize_session=False)
+    http_cache.incrementar_owner(db, principal.owner_id)
+    # delete em massa (sem o cascade do ORM): os casos já foram movidos para o paciente principal
+    db.query(models.Patient).filter(models.Patient.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    return len(ids)
+
+
+def deduplicar(dry_run: bool = False) -> int:
+    db = SessionLocal()
+    removidos = 0
+    try:
+        preenchidos = preencher_chaves_pendentes(db)
+        if preenchidos:
+            print(f"Chaves geradas para {preenchidos} paciente(s).")
+
+        print("Duplicados por CPF:")
+        for grupo in _grupos_duplicados(db, models.Patient.cpf_digits):
+            removidos += _mesclar(db, grupo[0], grupo[1:], dry_run)
+
+        print("Duplicados por nome + data de nascimento:")
+        for grupo in _grupos_duplicados(db, models.Patient.match_key):
+            # Pacientes com CPFs diferentes são pessoas diferentes (homônimos), mesmo com a mesma chave
+            if len({p.cpf_digits for p in grupo if p.cpf_digits}) > 1:
+                continue
+            removidos += _mesclar(db, grupo[0], grupo[1:], dry_run)
+    finally:
+        db.close()
+    return removidos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Junta pacientes duplicados e seus casos.")
+    parser.add_argument("--dry-run", action="store_true", help="Só lista as duplicatas, sem alterar nada")
+    args = parser.parse_args()
+
+    n = deduplicar(dry_run=args.dry_run)
+    acao = "seriam removidos" if args.dry_run else "removidos"
+    print(f"Concluído: {n} paciente(s) duplicado(s) {acao}.")
@@ -0,0 +1,48 @@
+import functools
+import os
+
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # opcional: pip install orjson
+    orjson = None
+
+# Serialização das respostas grandes (listas de casos, detalhe com ai_analysis_json).
+#
+# Caminho padrão do FastAPI: valida no response_model, converte para dicts/listas Python (mode="json")
+# e só então o JSONResponse chama json.dumps. Com JSON_FAST_PATH=true:
+#   - rotas que usam responder_modelo() serializam direto em bytes pelo pydantic-core (model_dump_json),
+#     sem montar a árvore intermediária de objetos Python
+#   - as demais rotas usam ORJSONResponse (se o orjson estiver instalado) no lugar do json.dumps
+# As rotas com ETag (http_cache.responder) sempre usam serializar(): o corpo é guardado em bytes no cache.
+
+JSON_FAST_PATH = os.getenv("JSON_FAST_PATH", "false").lower() in ("1", "true", "yes")
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def serializar(schema, obj) -> bytes:
+    """Valida `obj` (objetos ORM ou dicts) com o schema, ex.: schemas.CaseResponse ou list[...], e devolve o JSON."""
+    adapter = _adapter(schema)
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+
+def responder_modelo(schema, obj, headers: dict = None):
+    """Resposta já serializada quando JSON_FAST_PATH está ativo; senão devolve `obj` para o caminho normal da rota."""
+    if not JSON_FAST_PATH:
+        return obj
+    return Response(content=serializar(schema, obj), media_type="application/json", headers=headers)
+
+
+def classe_resposta_padrao():
+    if not JSON_FAST_PATH:
+        return JSONResponse
+    if orjson is None:
+        print("JSON_FAST_PATH ativo mas orjson não está instalado; usando JSONResponse.")
+        return JSONResponse
+    return ORJSONResponse
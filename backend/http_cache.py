@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Response
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+# ETags e cache de respostas das rotas de leitura (detalhe e listagens de casos, pacientes e dashboard).
+#
+# Versões:
+#   - cases.version: incrementada em toda alteração do caso (edição, reanálise, jobs, fila)
+#   - owner_data_versions.version: uma por médico, incrementada a cada caso/paciente criado, alterado ou apagado
+# As duas são mantidas por um evento before_flush da Session, então qualquer escrita pelo ORM já invalida.
+# Alterações em massa (query.update/delete) precisam chamar incrementar_owner() — ver dedupe_patients.py.
+#
+# A ETag sai da versão (uma consulta por chave primária), então um If-None-Match que confere vira 304 sem
+# carregar nem serializar nada. RESPONSE_CACHE_ENABLED=true guarda também o corpo já serializado por alguns
+# segundos, por médico; a versão faz parte da chave e os commits locais descartam as entradas do médico.
+
+RESPONSE_CACHE_HABILITADO = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+# O navegador guarda a resposta mas revalida sempre (If-None-Match automático no fetch do frontend)
+CACHE_CONTROL = "private, no-cache"
+
+
+# --- Versões ---
+
+def _upsert_versao(conn, owner_id: int):
+    tabela = models.OwnerDataVersion.__table__
+    dialeto = conn.dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialeto == "sqlite" else postgresql.insert
+        stmt = insert(tabela).values(owner_id=owner_id, version=1)
+        stmt = stmt.on_conflict_do_update(index_elements=["owner_id"], set_={"version": tabela.c.version + 1})
+        conn.execute(stmt)
+        return
+    resultado = conn.execute(tabela.update().where(tabela.c.owner_id == owner_id).values(version=tabela.c.version + 1))
+    if not resultado.rowcount:
+        conn.execute(tabela.insert().values(owner_id=owner_id, version=1))
+
+
+def incrementar_owner(db: Session, owner_id: int):
+    """Invalida ETags e cache das listagens do médico (para escritas em massa fora do ORM)."""
+    _upsert_versao(db.connection(), owner_id)
+    db.info.setdefault("owners_alterados", set()).add(owner_id)
+
+
+def _antes_do_flush(session, flush_context, instances):
+    owners = set()
+    for obj in session.new:
+        if isinstance(obj, (models.Case, models.Patient)):
+            owners.add(obj.owner_id)
+    for obj in session.dirty:
+        if isinstance(obj, (models.Case, models.Patient)) and session.is_modified(obj, include_collections=False):
+            owners.add(obj.owner_id)
+            if isinstance(obj, models.Case):
+                # Incremento no próprio UPDATE: duas escritas concorrentes nunca geram a mesma versão
+                obj.version = models.Case.version + 1
+    for obj in session.deleted:
+        if isinstance(obj, (models.Case, models.Patient)):
+            owners.add(obj.owner_id)
+
+    owners.discard(None)
+    if owners:
+        conn = session.connection()
+        for owner_id in sorted(owners):
+            _upsert_versao(conn, owner_id)
+        session.info.setdefault("owners_alterados", set()).update(owners)
+
+
+def _depois_do_commit(session):
+    owners = session.info.pop("owners_alterados", None)
+    if owners:
+        cache_respostas.invalidar(owners)
+
+
+def _depois_do_rollback(session):
+    session.info.pop("owners_alterados", None)
+
+
+def registrar_eventos():
+    event.listen(Session, "before_flush", _antes_do_flush)
+    event.listen(Session, "after_commit", _depois_do_commit)
+    event.listen(Session, "after_soft_rollback", lambda session, previous_transaction: _depois_do_rollback(session))
+
+
+def versao_owner(db: Session, owner_id: int) -> int:
+    versao = db.query(models.OwnerDataVersion.version).filter(models.OwnerDataVersion.owner_id == owner_id).scalar()
+    return versao or 0
+
+
+def versao_caso(db: Session, case_id: int):
+    """(version, owner_id) do caso, ou None se não existir."""
+    return db.query(models.Case.version, models.Case.owner_id).filter(models.Case.id == case_id).first()
+
+
+# --- ETag ---
+
+def gerar_etag(*partes) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in partes).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_confere(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca: ignora o prefixo W/
+    alvo = etag[2:] if etag.startswith("W/") else etag
+    for candidata in if_none_match.split(","):
+        candidata = candidata.strip()
+        if (candidata[2:] if candidata.startswith("W/") else candidata) == alvo:
+            return True
+    return False
+
+
+def nao_modificado(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+# --- Cache de respostas ---
+
+class CacheRespostas:
+    def __init__(self, ttl: float, max_entradas: int, habilitado: bool = False):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.habilitado = habilitado
+        self._entradas = OrderedDict()  # (owner_id, chave) -> (etag, corpo, headers, expira_em)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, owner_id: int, chave, etag: str):
+        if not self.habilitado:
+            return None
+        with self._lock:
+            entrada = self._entradas.get((owner_id, chave))
+            if entrada is None or entrada[0] != etag or entrada[3] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entradas.move_to_end((owner_id, chave))
+            self.hits += 1
+            return entrada[1], entrada[2]
+
+    def set(self, owner_id: int, chave, etag: str, corpo: bytes, headers: dict):
+        if not self.habilitado:
+            return
+        with self._lock:
+            self._entradas[(owner_id, chave)] = (etag, corpo, headers, time.monotonic() + self.ttl)
+            self._entradas.move_to_end((owner_id, chave))
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, owners):
+        if not self.habilitado:
+            return
+        with self._lock:
+            for chave in [k for k in self._entradas if k[0] in owners]:
+                del self._entradas[chave]
+
+    def tamanho(self) -> int:
+        with self._lock:
+            return len(self._entradas)
+
+
+cache_respostas = CacheRespostas(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX, RESPONSE_CACHE_HABILITADO)
+
+
+def responder(request, owner_id: int, chave, etag: str, gerar):
+    """304 se o cliente já tem a versão; senão corpo do cache ou `gerar()` -> (bytes JSON, headers extras)."""
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return nao_modificado(etag)
+    em_cache = cache_respostas.get(owner_id, chave, etag)
+    if em_cache is not None:
+        corpo, headers = em_cache
+    else:
+        corpo, headers = gerar()
+        cache_respostas.set(owner_id, chave, etag, corpo, headers)
+    return Response(
+        content=corpo,
+        media_type="application/json",
+        headers={**headers, "ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
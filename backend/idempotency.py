@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+# Idempotency-Key no POST /cases/.
+#
+# O cliente manda um identificador único por tentativa lógica de cadastro (ex.: um UUID gerado ao abrir
+# o formulário) e repete o mesmo valor nas retentativas. A primeira requisição reserva a chave
+# (estado "em_andamento"); a resposta é gravada na mesma transação do caso, então ou existem os dois
+# ou nenhum. Uma retentativa:
+#   - com a resposta já gravada recebe o mesmo corpo/status na hora (header Idempotent-Replayed: true),
+#     sem nova chamada à IA nem caso duplicado;
+#   - enquanto a primeira ainda roda, espera até IDEMPOTENCY_WAIT_SECONDS por ela (409 se não terminar);
+#   - com outro corpo para a mesma chave recebe 422.
+# As chaves valem por médico e expiram em IDEMPOTENCY_TTL_HOURS. Uma reserva "em_andamento" mais velha
+# que IDEMPOTENCY_LOCK_SECONDS é considerada abandonada (processo caiu no meio) e pode ser retomada.
+
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+IDEMPOTENCY_LOCK = timedelta(seconds=float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300")))
+
+TAMANHO_MAXIMO_CHAVE = 255
+INTERVALO_ESPERA = 0.2
+# A cada N reservas as chaves expiradas são apagadas
+INTERVALO_PODA = 100
+
+ESTADO_EM_ANDAMENTO = "em_andamento"
+ESTADO_CONCLUIDA = "concluida"
+
+HEADER_REPETIDA = "Idempotent-Replayed"
+
+_lock = threading.Lock()
+_reservas_desde_poda = 0
+
+
+def hash_requisicao(*partes) -> str:
+    """Impressão digital do corpo + parâmetros, para detectar a mesma chave usada em outra requisição."""
+    conteudo = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _registro(db: Session, owner_id: int, chave: str):
+    return db.query(models.IdempotencyKey).\
+        filter(models.IdempotencyKey.owner_id == owner_id, models.IdempotencyKey.key == chave).first()
+
+
+def _resposta_guardada(registro) -> Response:
+    return Response(
+        content=registro.response_body,
+        status_code=registro.status_code,
+        media_type="application/json",
+        headers={HEADER_REPETIDA: "true"},
+    )
+
+
+def _retomar(db: Session, registro, hash_req: str, agora: datetime) -> bool:
+    # Compare-and-set: só uma das requisições concorrentes consegue retomar a reserva abandonada
+    retomada = db.query(models.IdempotencyKey).\
+        filter(
+            models.IdempotencyKey.id == registro.id,
+            models.IdempotencyKey.state == registro.state,
+            models.IdempotencyKey.created_at == registro.created_at,
+        ).\
+        update(
+            {"state": ESTADO_EM_ANDAMENTO, "request_hash": hash_req, "created_at": agora,
+             "expires_at": agora + IDEMPOTENCY_TTL, "status_code": None, "response_body": None, "case_id": None},
+            synchronize_session=False,
+        )
+    db.commit()
+    return bool(retomada)
+
+
+def _podar(db: Session):
+    global _reservas_desde_poda
+    with _lock:
+        _reservas_desde_poda += 1
+        if _reservas_desde_poda < INTERVALO_PODA:
+            return
+        _reservas_desde_poda = 0
+    try:
+        db.query(models.IdempotencyKey).\
+            filter(models.IdempotencyKey.expires_at < datetime.utcnow()).\
+            delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao podar chaves de idempotência: {e}")
+
+
+def reservar(db: Session, owner_id: int, chave: str, hash_req: str):
+    """Reserva a chave para esta requisição (retorna None) ou devolve a Response já gravada para ela."""
+    if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key deve ter de 1 a {TAMANHO_MAXIMO_CHAVE} caracteres")
+
+    limite = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        agora = datetime.utcnow()
+        registro = _registro(db, owner_id, chave)
+
+        if registro is None:
+            db.add(models.IdempotencyKey(
+                owner_id=owner_id, key=chave, request_hash=hash_req, state=ESTADO_EM_ANDAMENTO,
+                created_at=agora, expires_at=agora + IDEMPOTENCY_TTL,
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Outra requisição com a mesma chave reservou primeiro
+                db.rollback()
+                continue
+            _podar(db)
+            return None
+
+        expirada = registro.expires_at is not None and registro.expires_at <= agora
+        abandonada = registro.state == ESTADO_EM_ANDAMENTO and registro.created_at <= agora - IDEMPOTENCY_LOCK
+        if expirada or abandonada:
+            if _retomar(db, registro, hash_req, agora):
+                return None
+            continue
+
+        if registro.request_hash != hash_req:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key já usada com outro conteúdo. Gere uma nova chave para um novo cadastro.",
+            )
+        if registro.state == ESTADO_CONCLUIDA:
+            return _resposta_guardada(registro)
+
+        if time.monotonic() >= limite:
+            raise HTTPException(status_code=409, detail="Requisição com esta Idempotency-Key ainda em processamento")
+        # Encerra a transação para enxergar o resultado da outra requisição na próxima leitura
+        db.rollback()
+        time.sleep(INTERVALO_ESPERA)
+
+
+def concluir(db: Session, owner_id: int, chave: str, corpo: bytes, status_code: int = 200, case_id: int = None):
+    """Grava a resposta da chave reservada. Não faz commit: deve entrar na mesma transação do caso."""
+    db.query(models.IdempotencyKey).\
+        filter(models.IdempotencyKey.owner_id == owner_id, models.IdempotencyKey.key == chave).\
+        update(
+            {"state": ESTADO_CONCLUIDA, "status_code": status_code,
+             "response_body": corpo.decode("utf-8"), "case_id": case_id},
+            synchronize_session=False,
+        )
+
+
+def liberar(db: Session, owner_id: int, chave: str):
+    """Desfaz a reserva quando a requisição falha, para que a retentativa seja processada de novo."""
+    try:
+        db.rollback()
+        db.query(models.IdempotencyKey).\
+            filter(
+                models.IdempotencyKey.owner_id == owner_id,
+                models.IdempotencyKey.key == chave,
+                models.IdempotencyKey.state == ESTADO_EM_ANDAMENTO,
+            ).\
+            delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao liberar Idempotency-Key: {e}")
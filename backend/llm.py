@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+# Backends de LLM usados por executar_analise_ia.
+# LLM_BACKEND=gemini (padrão) chama a API real; LLM_BACKEND=fake responde localmente com JSON válido,
+# latência e taxa de erro configuráveis — para desenvolvimento sem chave e para os benchmarks de carga.
+#
+# O backend é criado no primeiro uso (backend()), não no import do main: subir um worker ou importar o app
+# em testes não importa o SDK do Gemini nem exige GEMINI_API_KEY. O startup dispara aquecer() em segundo
+# plano para a primeira análise não pagar esse custo.
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+# Intervalo entre verificações reais de disponibilidade (/readyz), para não gastar cota a cada probe
+LLM_READY_CHECK_TTL = float(os.getenv("LLM_READY_CHECK_TTL_SECONDS", "60"))
+# Timeout HTTP padrão do SDK; o llm_client passa em cada chamada o prazo que ainda resta (timeout=)
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "30"))
+
+
+class RespostaLLM:
+    def __init__(self, text: str, prompt_tokens=None, output_tokens=None, total_tokens=None, model=None):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.total_tokens = total_tokens
+
+
+class GeminiBackend:
+    nome = "gemini"
+
+    def __init__(self, api_key: str):
+        if not api_key:
+            raise ValueError("ERRO: A variável GEMINI_API_KEY não foi encontrada no arquivo .env")
+        from google import genai
+        from google.genai import types
+        self._types = types
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(timeout=int(LLM_HTTP_TIMEOUT * 1000)),
+        )
+
+    def _config(self, timeout: float = None):
+        # Timeout por requisição: a chamada HTTP termina junto com o prazo que o llm_client deu a ela,
+        # em vez de segurar a thread do pool até o timeout padrão do cliente
+        http_options = self._types.HttpOptions(timeout=max(int(timeout * 1000), 1)) if timeout else None
+        return self._types.GenerateContentConfig(response_mime_type="application/json", http_options=http_options)
+
+    def gerar_json(self, model: str, prompt: str, timeout: float = None) -> RespostaLLM:
+        response = self.client.models.generate_content(model=model, contents=prompt, config=self._config(timeout))
+        uso = getattr(response, "usage_metadata", None)
+        return RespostaLLM(
+            response.text,
+            prompt_tokens=getattr(uso, "prompt_token_count", None),
+            output_tokens=getattr(uso, "candidates_token_count", None),
+            total_tokens=getattr(uso, "total_token_count", None),
+        )
+
+    def gerar_json_stream(self, model: str, prompt: str, timeout: float = None):
+        stream = self.client.models.generate_content_stream(model=model, contents=prompt, config=self._config(timeout))
+        for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    def verificar(self, model: str):
+        # Só metadados do modelo: confirma chave e conectividade sem gerar tokens
+        self.client.models.get(model=model)
+
+
+class FakeLLMError(Exception):
+    pass
+
+
+class FakeBackend:
+    """Substituto local do Gemini.
+
+    FAKE_LLM_LATENCY_MS aceita "fixed:300", "uniform:100:900" ou "lognormal:<mediana_ms>:<sigma>".
+    FAKE_LLM_ERROR_RATE é a fração de chamadas que falham (0.0 a 1.0).
+    A resposta é determinística para o mesmo prompt, então o cache da IA se comporta como com o Gemini.
+    """
+    nome = "fake"
+
+    URGENCIAS = ("Alta", "Média", "Baixa")
+    ENCAMINHAMENTOS = ("Clínica Geral", "Cardiologia", "Pneumologia", "Gastroenterologia", "Neurologia", "Ortopedia")
+    PATOLOGIAS = ("Infecciosa", "Cardiovascular", "Respiratória", "Gastrointestinal", "Neurológica", "Musculoesquelética")
+    CIDS = (
+        ("J06.9", "Infecção aguda das vias aéreas superiores não especificada"),
+        ("I10", "Hipertensão essencial (primária)"),
+        ("A09", "Diarreia e gastroenterite de origem infecciosa presumível"),
+        ("R51", "Cefaleia"),
+        ("M54.5", "Dor lombar baixa"),
+        ("J18.9", "Pneumonia não especificada"),
+    )
+
+    def __init__(self, latencia: str = "fixed:0", taxa_erro: float = 0.0, seed=None):
+        self.distribuicao = self._parse_latencia(latencia)
+        self.taxa_erro = taxa_erro
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def _parse_latencia(spec: str):
+        partes = (spec or "fixed:0").split(":")
+        tipo, valores = partes[0], [float(v) for v in partes[1:]]
+        if tipo == "fixed" and len(valores) == 1:
+            return tipo, valores
+        if tipo == "uniform" and len(valores) == 2:
+            return tipo, valores
+        if tipo == "lognormal" and len(valores) == 2:
+            return tipo, valores
+        raise ValueError(f"FAKE_LLM_LATENCY_MS inválido: {spec!r}")
+
+    def _sortear_latencia(self) -> float:
+        tipo, valores = self.distribuicao
+        if tipo == "fixed":
+            ms = valores[0]
+        elif tipo == "uniform":
+            ms = self._random.uniform(valores[0], valores[1])
+        else:
+            mediana, sigma = valores
+            ms = self._random.lognormvariate(0, sigma) * mediana
+        return max(ms, 0.0) / 1000
+
+    def _resposta(self, prompt: str) -> dict:
+        h = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        urgencia = "Alta" if "URGÊNCIA/EMERGÊNCIA" in prompt else self.URGENCIAS[h % 3]
+        cid = self.CIDS[(h >> 8) % len(self.CIDS)]
+        return {
+            "referral": self.ENCAMINHAMENTOS[(h >> 4) % len(self.ENCAMINHAMENTOS)],
+            "urgency": urgencia,
+            "justification": "Resposta gerada pelo backend fake de LLM para testes e benchmarks.",
+            "pathology_type": self.PATOLOGIAS[(h >> 12) % len(self.PATOLOGIAS)],
+            "cid10": {"code": cid[0], "description": cid[1]},
+            "cid10_secondary": [],
+            "diagnoses": [{"name": cid[1], "probability": "70%"}],
+            "exams": ["Hemograma completo"],
+            "medications": ["Dipirona 500 mg VO 6/6h se dor ou febre"],
+        }
+
+    def _talvez_falhar(self):
+        if self.taxa_erro and self._random.random() < self.taxa_erro:
+            raise FakeLLMError("Falha simulada pelo backend fake")
+
+    def gerar_json(self, model: str, prompt: str, timeout: float = None) -> RespostaLLM:
+        latencia = self._sortear_latencia()
+        if timeout is not None and latencia > timeout:
+            # Como o timeout HTTP do SDK: a chamada acaba no prazo em vez de segurar a thread
+            time.sleep(timeout)
+            raise TimeoutError(f"Backend fake não respondeu em {timeout:.1f}s")
+        time.sleep(latencia)
+        self._talvez_falhar()
+        texto = json.dumps(self._resposta(prompt), ensure_ascii=False)
+        tokens_prompt, tokens_saida = len(prompt) // 4, len(texto) // 4
+        return RespostaLLM(texto, tokens_prompt, tokens_saida, tokens_prompt + tokens_saida)
+
+    def verificar(self, model: str):
+        pass
+
+    def gerar_json_stream(self, model: str, prompt: str, timeout: float = None):
+        texto = json.dumps(self._resposta(prompt), ensure_ascii=False)
+        latencia = self._sortear_latencia()
+        pedacos = [texto[i:i + 40] for i in range(0, len(texto), 40)]
+        limite = time.monotonic() + timeout if timeout is not None else None
+        for i, pedaco in enumerate(pedacos):
+            espera = latencia / len(pedacos)
+            if limite is not None and time.monotonic() + espera > limite:
+                # Como o timeout HTTP do SDK: o stream parado acaba no prazo
+                time.sleep(max(limite - time.monotonic(), 0))
+                raise TimeoutError(f"Backend fake não terminou o stream em {timeout:.1f}s")
+            time.sleep(espera)
+            if i == len(pedacos) // 2:
+                self._talvez_falhar()
+            yield pedaco
+
+
+def criar_backend():
+    tipo = LLM_BACKEND
+    if tipo == "fake":
+        seed = os.getenv("FAKE_LLM_SEED")
+        return FakeBackend(
+            latencia=os.getenv("FAKE_LLM_LATENCY_MS", "lognormal:800:0.4"),
+            taxa_erro=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+    if tipo == "gemini":
+        return GeminiBackend(api_key=os.getenv("GEMINI_API_KEY"))
+    raise ValueError(f"LLM_BACKEND desconhecido: {tipo!r} (use 'gemini' ou 'fake')")
+
+
+_backend = None
+_lock = threading.Lock()
+_ultima_verificacao = None  # (monotonic, ok, erro)
+
+
+def backend():
+    """Backend configurado, criado uma vez por processo no primeiro uso."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = criar_backend()
+    return _backend
+
+
+def aquecer():
+    """Cria o backend numa thread, sem segurar o startup; erros (ex.: chave ausente) só são registrados."""
+    def _criar():
+        try:
+            backend()
+        except Exception as e:
+            print(f"Backend de LLM indisponível: {e}")
+    threading.Thread(target=_criar, name="llm-aquecimento", daemon=True).start()
+
+
+def verificar_disponibilidade(model: str):
+    """(ok, erro) da última verificação do backend, refeita no máximo a cada LLM_READY_CHECK_TTL segundos."""
+    global _ultima_verificacao
+    agora = time.monotonic()
+    if _ultima_verificacao and agora - _ultima_verificacao[0] < LLM_READY_CHECK_TTL:
+        return _ultima_verificacao[1], _ultima_verificacao[2]
+    try:
+        backend().verificar(model)
+        ok, erro = True, None
+    except Exception as e:
+        ok, erro = False, str(e)
+    _ultima_verificacao = (agora, ok, erro)
+    return ok, erro
@@ -0,0 +1,400 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import llm
+import metrics
+
+# Camada de resiliência sobre o backend de LLM (llm.backend()), usada por executar_analise_ia.
+#
+#   - Prazo: cada tentativa tem LLM_CALL_TIMEOUT_SECONDS e a chamada inteira (tentativas + esperas)
+#     LLM_DEADLINE_SECONDS. A chamada ao SDK roda numa thread do pool e recebe como timeout HTTP o prazo
+#     que ainda lhe resta: se estourar, o worker é liberado na hora e a thread abandonada termina junto,
+#     sem ocupar a vaga do pool além do prazo.
+#   - Retentativa: erros transitórios (timeout, conexão, 429, 5xx) são repetidos até LLM_MAX_RETRIES
+#     vezes por modelo, com backoff exponencial e jitter completo (sorteio entre 0 e o teto).
+#   - Circuit breaker por modelo: LLM_BREAKER_FAILURES falhas transitórias seguidas abrem o circuito;
+#     enquanto aberto as chamadas falham na hora (CircuitoAberto) em vez de esperar o prazo. Depois de
+#     LLM_BREAKER_COOLDOWN_SECONDS uma chamada de teste passa; se der certo o circuito fecha.
+#   - Hedging (LLM_HEDGE_ENABLED): se a resposta demorar mais que o p95 recente do modelo, uma segunda
+#     requisição igual é disparada e vale a que chegar primeiro. Corta a cauda de latência ao custo de
+#     alguns % de chamadas a mais. No máximo LLM_HEDGE_MAX_IN_FLIGHT cópias ao mesmo tempo, e nenhuma
+#     com o pool cheio (provedor lento): aí a cópia só disputaria vaga com chamadas novas.
+#   - Modelos reserva: LLM_MODELS é a lista ordenada de modelos; quando um esgota as tentativas (ou está
+#     com o circuito aberto) o próximo é usado.
+#
+# Cada tentativa (modelo, resultado, latência) é anotada na lista `tentativas` recebida, que vai para o
+# analysis_meta_json do caso.
+
+MODELOS_PADRAO = "gemini-2.0-flash,gemini-2.0-flash-lite"
+# GEMINI_MODEL (configuração antiga, um modelo só) continua valendo quando LLM_MODELS não é definido
+MODELOS = [
+    m.strip() for m in os.getenv("LLM_MODELS", os.getenv("GEMINI_MODEL") or MODELOS_PADRAO).split(",") if m.strip()
+]
+
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "30"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE_SECONDS", "90"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_MS = float(os.getenv("LLM_RETRY_BASE_MS", "500"))
+LLM_RETRY_MAX_MS = float(os.getenv("LLM_RETRY_MAX_MS", "8000"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_HEDGE_HABILITADO = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTIL = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_AMOSTRAS = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_ATRASO_MINIMO = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "250")) / 1000
+LLM_MAX_CONCORRENCIA = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_HEDGE_MAX_EM_VOO = int(os.getenv("LLM_HEDGE_MAX_IN_FLIGHT", str(max(1, LLM_MAX_CONCORRENCIA // 8))))
+
+# Latências recentes (por modelo) usadas para o p95 do hedging
+JANELA_LATENCIAS = 200
+CODIGOS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+TAMANHO_MAXIMO_ERRO = 200
+
+FECHADO = "closed"
+ABERTO = "open"
+MEIO_ABERTO = "half_open"
+
+
+class ErroLLM(Exception):
+    codigo = "error"
+
+
+class TimeoutLLM(ErroLLM):
+    codigo = "timeout"
+
+
+class PrazoEsgotado(ErroLLM):
+    codigo = "deadline_exceeded"
+
+
+class CircuitoAberto(ErroLLM):
+    codigo = "circuit_open"
+
+
+def erro_transitorio(e: Exception) -> bool:
+    if isinstance(e, (TimeoutLLM, TimeoutError, ConnectionError, llm.FakeLLMError)):
+        return True
+    codigo = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if isinstance(codigo, int):
+        return codigo in CODIGOS_TRANSITORIOS
+    # Erros de transporte do httpx (usado pelo SDK do Gemini): ConnectError, ReadTimeout, RemoteProtocolError...
+    nome = type(e).__name__
+    return any(parte in nome for parte in ("Timeout", "Connect", "Network", "Protocol"))
+
+
+def codigo_erro(e: Exception) -> str:
+    return getattr(e, "codigo", "error")
+
+
+class Circuito:
+    def __init__(self, limite_falhas: int, cooldown: float):
+        self.limite_falhas = limite_falhas
+        self.cooldown = cooldown
+        self.estado = FECHADO
+        self.falhas = 0
+        self._proxima_sonda = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == FECHADO:
+                return True
+            agora = time.monotonic()
+            if agora < self._proxima_sonda:
+                return False
+            # Aberto há tempo suficiente (ou a sonda anterior não voltou): deixa passar uma chamada de teste
+            self.estado = MEIO_ABERTO
+            self._proxima_sonda = agora + self.cooldown
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self.estado = FECHADO
+            self.falhas = 0
+
+    def falha(self) -> bool:
+        """Registra uma falha transitória; retorna True se o circuito abriu agora."""
+        with self._lock:
+            self.falhas += 1
+            if self.estado == MEIO_ABERTO or self.falhas >= self.limite_falhas:
+                abriu = self.estado != ABERTO
+                self.estado = ABERTO
+                self._proxima_sonda = time.monotonic() + self.cooldown
+                return abriu
+            return False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            dados = {"state": self.estado, "consecutive_failures": self.falhas}
+            if self.estado != FECHADO:
+                dados["next_probe_in_s"] = round(max(self._proxima_sonda - time.monotonic(), 0.0), 1)
+        return dados
+
+
+class ClienteLLM:
+    def __init__(self, modelos: list):
+        self.modelos = list(modelos)
+        self._circuitos = {}
+        self._latencias = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        # Chamadas ocupando thread do pool (inclusive abandonadas por prazo) e quantas delas são hedge
+        self._em_voo = 0
+        self._hedges_em_voo = 0
+
+    # --- estado por modelo ---
+
+    def circuito(self, modelo: str) -> Circuito:
+        with self._lock:
+            if modelo not in self._circuitos:
+                self._circuitos[modelo] = Circuito(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+            return self._circuitos[modelo]
+
+    def estado_circuitos(self) -> dict:
+        return {modelo: self.circuito(modelo).snapshot() for modelo in self.modelos}
+
+    def disponivel(self) -> bool:
+        """False quando todos os modelos estão com o circuito aberto."""
+        return any(c["state"] != ABERTO for c in self.estado_circuitos().values())
+
+    def _registrar_latencia(self, modelo: str, segundos: float):
+        with self._lock:
+            self._latencias.setdefault(modelo, deque(maxlen=JANELA_LATENCIAS)).append(segundos)
+
+    def atraso_hedge(self, modelo: str):
+        """p95 recente do modelo (ou None sem amostras suficientes / hedging desligado)."""
+        if not LLM_HEDGE_HABILITADO:
+            return None
+        with self._lock:
+            amostras = sorted(self._latencias.get(modelo, ()))
+        if len(amostras) < LLM_HEDGE_MIN_AMOSTRAS:
+            return None
+        indice = min(int(len(amostras) * LLM_HEDGE_QUANTIL), len(amostras) - 1)
+        return max(amostras[indice], LLM_HEDGE_ATRASO_MINIMO)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCORRENCIA, thread_name_prefix="llm")
+            return self._executor
+
+    def _submeter(self, modelo: str, prompt: str, timeout: float, hedge: bool):
+        with self._lock:
+            self._em_voo += 1
+            if hedge:
+                self._hedges_em_voo += 1
+
+        def liberar(_):
+            with self._lock:
+                self._em_voo -= 1
+                if hedge:
+                    self._hedges_em_voo -= 1
+
+        futuro = self._get_executor().submit(llm.backend().gerar_json, modelo, prompt, timeout)
+        futuro.add_done_callback(liberar)
+        return futuro
+
+    def hedge_liberado(self) -> bool:
+        """False com o pool cheio ou já com LLM_HEDGE_MAX_IN_FLIGHT cópias em andamento."""
+        with self._lock:
+            return self._em_voo < LLM_MAX_CONCORRENCIA and self._hedges_em_voo < LLM_HEDGE_MAX_EM_VOO
+
+    def ocupacao(self) -> dict:
+        with self._lock:
+            return {"in_flight": self._em_voo, "hedges_in_flight": self._hedges_em_voo, "max": LLM_MAX_CONCORRENCIA}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- chamadas ---
+
+    def _modelos(self, modelos) -> list:
+        return list(modelos) if modelos else self.modelos
+
+    @staticmethod
+    def _pausa(numero: int) -> float:
+        # Backoff exponencial com jitter completo: evita que os workers retentem todos juntos
+        teto = min(LLM_RETRY_MAX_MS, LLM_RETRY_BASE_MS * 2 ** (numero - 1)) / 1000
+        return random.uniform(0, teto)
+
+    @staticmethod
+    def _anotar(tentativas, modelo, numero, resultado, inicio, erro=None, hedge=False):
+        registro = {
+            "model": modelo,
+            "attempt": numero,
+            "outcome": resultado,
+            "latency_ms": round((time.monotonic() - inicio) * 1000, 1),
+        }
+        if hedge:
+            registro["hedge"] = True
+        if erro is not None:
+            registro["error"] = str(erro)[:TAMANHO_MAXIMO_ERRO] or erro.__class__.__name__
+        tentativas.append(registro)
+        metrics.registrar_tentativa_llm(modelo, resultado)
+
+    def _tentar(self, modelo: str, prompt: str, timeout: float, numero: int, tentativas: list, hedge_permitido: bool):
+        """Uma tentativa (com possível requisição de hedge). Retorna a RespostaLLM ou levanta o último erro."""
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        atraso = self.atraso_hedge(modelo) if hedge_permitido else None
+        pendentes = {self._submeter(modelo, prompt, timeout, hedge=False): (False, inicio)}
+        ultimo_erro = None
+
+        while pendentes:
+            agora = time.monotonic()
+            espera = limite - agora
+            if atraso is not None:
+                espera = min(espera, inicio + atraso - agora)
+            feitos, _ = wait(list(pendentes), timeout=max(espera, 0), return_when=FIRST_COMPLETED)
+
+            for futuro in feitos:
+                hedge, inicio_futuro = pendentes.pop(futuro)
+                try:
+                    resposta = futuro.result()
+                except Exception as e:
+                    ultimo_erro = e
+                    self._anotar(tentativas, modelo, numero, "error", inicio_futuro, e, hedge)
+                    continue
+                self._anotar(tentativas, modelo, numero, "ok", inicio_futuro, hedge=hedge)
+                self._registrar_latencia(modelo, time.monotonic() - inicio_futuro)
+                for perdedor, (hedge_perdedor, inicio_perdedor) in pendentes.items():
+                    perdedor.cancel()
+                    self._anotar(tentativas, modelo, numero, "abandoned", inicio_perdedor, hedge=hedge_perdedor)
+                resposta.model = modelo
+                return resposta
+
+            if not pendentes:
+                break
+            if time.monotonic() >= limite:
+                erro = TimeoutLLM(f"{modelo} não respondeu em {timeout:.1f}s")
+                for futuro, (hedge, inicio_futuro) in pendentes.items():
+                    futuro.cancel()
+                    self._anotar(tentativas, modelo, numero, "timeout", inicio_futuro, erro, hedge)
+                raise erro
+            if atraso is not None and time.monotonic() >= inicio + atraso:
+                # A primeira requisição passou do p95: dispara a cópia e fica com a que responder antes
+                atraso = None
+                if self.hedge_liberado():
+                    agora = time.monotonic()
+                    pendentes[self._submeter(modelo, prompt, limite - agora, hedge=True)] = (True, agora)
+
+        raise ultimo_erro
+
+    def gerar_json(self, prompt: str, modelos=None, tentativas: list = None):
+        """Gera a resposta JSON com prazo, retentativas, circuit breaker, hedging e modelos reserva.
+
+        A RespostaLLM devolvida traz `model` com o modelo que respondeu.
+        """
+        tentativas = tentativas if tentativas is not None else []
+        prazo = time.monotonic() + LLM_DEADLINE
+        ultimo_erro = None
+
+        for modelo in self._modelos(modelos):
+            circuito = self.circuito(modelo)
+            for numero in range(1, LLM_MAX_RETRIES + 2):
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise PrazoEsgotado(f"Prazo de {LLM_DEADLINE:.0f}s da análise esgotado") from ultimo_erro
+                estado_antes = circuito.estado
+                if not circuito.permitir():
+                    ultimo_erro = CircuitoAberto(f"Circuito aberto para {modelo}: provedor de IA falhando")
+                    self._anotar(tentativas, modelo, numero, "circuit_open", time.monotonic())
+                    break
+                try:
+                    resposta = self._tentar(
+                        modelo, prompt, min(LLM_CALL_TIMEOUT, restante), numero, tentativas,
+                        hedge_permitido=estado_antes == FECHADO,
+                    )
+                except Exception as e:
+                    ultimo_erro = e
+                    if not erro_transitorio(e):
+                        # Erro do pedido (ex.: 400/404): o provedor respondeu, não conta para o circuito
+                        circuito.sucesso()
+                        break
+                    if circuito.falha():
+                        print(f"Circuit breaker aberto para {modelo} após {circuito.falhas} falha(s): {e}")
+                    if numero > LLM_MAX_RETRIES:
+                        break
+                    pausa = self._pausa(numero)
+                    if time.monotonic() + pausa >= prazo:
+                        break
+                    time.sleep(pausa)
+                    continue
+                circuito.sucesso()
+                return resposta
+
+        if time.monotonic() >= prazo:
+            raise PrazoEsgotado(f"Prazo de {LLM_DEADLINE:.0f}s da análise esgotado") from ultimo_erro
+        raise ultimo_erro or ErroLLM("Nenhum modelo de LLM configurado")
+
+    def gerar_json_stream(self, prompt: str, modelos=None, tentativas: list = None, modelo_usado: dict = None):
+        """Versão em streaming: circuit breaker e modelos reserva valem até o primeiro trecho chegar.
+
+        Depois que o texto começou a ser enviado ao cliente não há como trocar de modelo; um erro no meio
+        do stream é propagado. `modelo_usado["model"]` recebe o modelo que respondeu.
+        O stream inteiro (tentativas + esperas) tem o mesmo prazo LLM_DEADLINE_SECONDS do gerar_json: o
+        restante vai como timeout HTTP de cada chamada e é conferido entre os trechos; estourado, levanta
+        PrazoEsgotado.
+        """
+        tentativas = tentativas if tentativas is not None else []
+        prazo = time.monotonic() + LLM_DEADLINE
+        ultimo_erro = None
+        for modelo in self._modelos(modelos):
+            circuito = self.circuito(modelo)
+            for numero in range(1, LLM_MAX_RETRIES + 2):
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise PrazoEsgotado(f"Prazo de {LLM_DEADLINE:.0f}s da análise esgotado") from ultimo_erro
+                if not circuito.permitir():
+                    ultimo_erro = CircuitoAberto(f"Circuito aberto para {modelo}: provedor de IA falhando")
+                    self._anotar(tentativas, modelo, numero, "circuit_open", time.monotonic())
+                    break
+                inicio = time.monotonic()
+                iniciado = False
+                stream = llm.backend().gerar_json_stream(modelo, prompt, restante)
+                try:
+                    for trecho in stream:
+                        if not iniciado:
+                            iniciado = True
+                            if modelo_usado is not None:
+                                modelo_usado["model"] = modelo
+                        yield trecho
+                        if time.monotonic() >= prazo:
+                            raise PrazoEsgotado(f"Prazo de {LLM_DEADLINE:.0f}s da análise esgotado no meio do stream")
+                except Exception as e:
+                    if not isinstance(e, PrazoEsgotado) and time.monotonic() >= prazo:
+                        # Timeout HTTP com o prazo do stream: mesmo erro da checagem entre trechos
+                        e = PrazoEsgotado(f"Prazo de {LLM_DEADLINE:.0f}s da análise esgotado: {e}")
+                    ultimo_erro = e
+                    self._anotar(tentativas, modelo, numero, "timeout" if isinstance(e, PrazoEsgotado) else "error",
+                                 inicio, e)
+                    if erro_transitorio(e) or isinstance(e, PrazoEsgotado):
+                        circuito.falha()
+                    else:
+                        circuito.sucesso()
+                    if iniciado or isinstance(e, PrazoEsgotado):
+                        raise e
+                    if not erro_transitorio(e) or numero > LLM_MAX_RETRIES:
+                        break
+                    pausa = self._pausa(numero)
+                    if time.monotonic() + pausa >= prazo:
+                        break
+                    time.sleep(pausa)
+                    continue
+                finally:
+                    stream.close()
+                self._anotar(tentativas, modelo, numero, "ok", inicio)
+                circuito.sucesso()
+                return
+        if time.monotonic() >= prazo:
+            raise PrazoEsgotado(f"Prazo de {LLM_DEADLINE:.0f}s da análise esgotado") from ultimo_erro
+        raise ultimo_erro or ErroLLM("Nenhum modelo de LLM configurado")
+
+cliente_llm = ClienteLLM(MODELOS)
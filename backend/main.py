@@ -1,30 +1,108 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, undefer_group
+from sqlalchemy import func, or_, text
+from contextlib import asynccontextmanager
+from typing import Optional
+from datetime import date
 import models
 import schemas
-from database import engine, get_db
+from database import engine, read_engine, get_db, get_read_db, SessionLocal, ReadSessionLocal
+import analysis_queue
+from analysis_queue import fila_analise, STATUS_EM_ANALISE
+import ai_cache
+from ai_cache import cache_analise
+import dashboard_rollup
+import pagination
+from ai_columns import aplicar_resultado_ia
+import batch_intake
+import ai_stream
+import patient_matching
+import case_search
+import case_export
+import case_similarity
+from case_similarity import indice_similaridade
+import cid10
+import http_cache
+import idempotency
+import fast_json
+from compression import CompressaoMiddleware, COMPRESSION_ENABLED
+import reanalysis_jobs
+import migrator
+from reanalysis_jobs import jobs_reanalise
+from single_flight import SingleFlight
+import argparse
+import asyncio
+from functools import partial
+from types import SimpleNamespace
 import os
+import tempfile
+import time
+import uuid
 from dotenv import load_dotenv
 import json
 from datetime import datetime, timedelta
 import uvicorn
-from google import genai
-from google.genai import types
-from collections import Counter
+import llm
+from llm_client import cliente_llm
+import llm_client
+import metrics
+import prompt_builder
 
 load_dotenv()
 
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("ERRO: A variável GEMINI_API_KEY não foi encontrada no arquivo .env")
-
-client = genai.Client(api_key=api_key)
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="AI Nurse Assist API")
+# LLM_BACKEND=gemini (padrão, exige GEMINI_API_KEY) ou fake (respostas locais para dev/benchmark).
+# O backend é criado sob demanda por llm.backend() (ver llm.py); prazos, retentativas, circuit breaker e
+# modelos reserva ficam em llm_client.py. GEMINI_MODEL é o modelo principal (primeiro de LLM_MODELS).
+GEMINI_MODEL = llm_client.MODELOS[0]
+
+# Quando ativo, POST /cases/ salva o caso como "Em análise" e a IA roda na fila em segundo plano
+ANALISE_ASSINCRONA = os.getenv("AI_ASYNC_ANALYSIS", "false").lower() in ("1", "true", "yes")
+
+# Em dev o banco é migrado no startup; em produção rode `python migrator.py` antes do deploy
+# (backfills longos) e use AUTO_MIGRATE=false
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+# /readyz falha se o LLM não responder; desligue para o pod continuar servindo leituras com a IA fora
+READYZ_REQUIRE_LLM = os.getenv("READYZ_REQUIRE_LLM", "true").lower() in ("1", "true", "yes")
+
+# Com vários workers (python main.py --workers N), só um recoloca análises/jobs pendentes na fila
+STARTUP_RECOVERY_TOKEN = os.getenv("STARTUP_RECOVERY_TOKEN")
+
+estado_app = {"pronto": False, "startup_ms": None}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    inicio = time.perf_counter()
+    aplicar_migracoes()
+    preparar_rollup_dashboard()
+    carregar_catalogo_cid10()
+    if responsavel_pela_recuperacao():
+        recuperar_analises_pendentes()
+        retomar_jobs_reanalise()
+    llm.aquecer()
+    if case_similarity.SIMILARITY_HABILITADO:
+        indice_similaridade.carregar_em_segundo_plano()
+    estado_app["startup_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    estado_app["pronto"] = True
+    print(f"API pronta em {estado_app['startup_ms']} ms.")
+    try:
+        yield
+    finally:
+        estado_app["pronto"] = False
+        fila_analise.shutdown()
+        jobs_reanalise.shutdown()
+        cliente_llm.shutdown()
+
+
+app = FastAPI(
+    title="AI Nurse Assist API",
+    default_response_class=fast_json.classe_resposta_padrao(),
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,7 +110,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.HEADER_CURSOR, "ETag", idempotency.HEADER_REPETIDA],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressaoMiddleware)
+app.middleware("http")(metrics.middleware_metricas)
+metrics.instrumentar_engine(engine)
+if read_engine is not engine:
+    metrics.instrumentar_engine(read_engine, "replica")
+http_cache.registrar_eventos()
 
 
 def calcular_idade(data_nascimento_str):
@@ -45,38 +131,67 @@ def calcular_idade(data_nascimento_str):
         return "não identificada"
 
 
-def executar_analise_ia(patient, care_type: str, anamnesis, hpma, extended_anamnesis: dict, symptoms: str, exams):
-    """Constrói o prompt clínico e executa a análise via Gemini. Retorna (ai_result, ai_sucesso)."""
-    idade = calcular_idade(patient.birth_date)
-    is_pediatric = isinstance(idade, int) and idade < 12
-
-    contexto_anamnese = ""
-    if anamnesis:
-        contexto_anamnese += f"\nAnamnese Geral: {anamnesis}"
-    if hpma:
-        contexto_anamnese += f"\nHPMA (História da Presente Moléstia Atual): {hpma}"
-    if extended_anamnesis.get("antecedentes_pessoais"):
-        contexto_anamnese += f"\nAntecedentes Pessoais: {extended_anamnesis['antecedentes_pessoais']}"
-    if extended_anamnesis.get("antecedentes_familiares"):
-        contexto_anamnese += f"\nAntecedentes Familiares: {extended_anamnesis['antecedentes_familiares']}"
-    if extended_anamnesis.get("antecedentes_cirurgicos"):
-        contexto_anamnese += f"\nAntecedentes Cirúrgicos: {extended_anamnesis['antecedentes_cirurgicos']}"
-    if extended_anamnesis.get("historia_gineco_obstetrica"):
-        contexto_anamnese += f"\nHistória Gineco-Obstétrica: {extended_anamnesis['historia_gineco_obstetrica']}"
-    if extended_anamnesis.get("habitos_vida"):
-        contexto_anamnese += f"\nHábitos de Vida: {extended_anamnesis['habitos_vida']}"
-    if extended_anamnesis.get("medicamentos_uso"):
-        contexto_anamnese += f"\nMedicamentos em Uso: {extended_anamnesis['medicamentos_uso']}"
-    if extended_anamnesis.get("alergias"):
-        contexto_anamnese += f"\nAlergias: {extended_anamnesis['alergias']}"
-    if extended_anamnesis.get("revisao_sistemas"):
-        contexto_anamnese += f"\nRevisão por Sistemas: {extended_anamnesis['revisao_sistemas']}"
-    if extended_anamnesis.get("pediatric_vaccines"):
-        contexto_anamnese += f"\nSituação Vacinal: {extended_anamnesis['pediatric_vaccines']}"
-    if extended_anamnesis.get("pediatric_dnpm"):
-        contexto_anamnese += f"\nDesenvolvimento Neuropsicomotor (DNPM): {extended_anamnesis['pediatric_dnpm']}"
-    if extended_anamnesis.get("pediatric_breastfed"):
-        contexto_anamnese += f"\nAleitamento Materno: {extended_anamnesis['pediatric_breastfed']}"
+def eh_pediatrico(care_type: str, idade) -> bool:
+    return care_type == "Pediátrico" or (isinstance(idade, int) and idade < 12)
+
+
+def faixa_analise(care_type: str, birth_date) -> str:
+    """Faixa de prioridade do caso na fila de análise (ver analysis_queue.py)."""
+    if care_type == "Urgência":
+        return analysis_queue.FAIXA_URGENCIA
+    if eh_pediatrico(care_type, calcular_idade(birth_date) if birth_date else None):
+        return analysis_queue.FAIXA_PEDIATRICO
+    return analysis_queue.FAIXA_ROTINA
+
+
+JUSTIFICATIVAS_ERRO_IA = {
+    "circuit_open": "Serviço de IA indisponível no momento (falhas seguidas do provedor). "
+                    "Reanalise o caso em alguns minutos ou faça a avaliação manual.",
+    "deadline_exceeded": "A IA não respondeu dentro do prazo. Reanalise o caso ou faça a avaliação manual.",
+}
+
+
+def resultado_ia_indisponivel(codigo_erro: Optional[str] = None):
+    """Resultado padrão gravado quando a IA falha: o caso fica para avaliação manual."""
+    return {
+        "referral": "Clínica Geral",
+        "urgency": "Indefinida",
+        "justification": JUSTIFICATIVAS_ERRO_IA.get(
+            codigo_erro, "Erro no processamento da IA. Avaliação manual necessária."),
+        "pathology_type": "Não classificado",
+        "cid10": {"code": "Z99", "description": "Sem classificação disponível"},
+        "cid10_secondary": [],
+        "diagnoses": [],
+        "exams": [],
+        "medications": [],
+    }
+
+
+def montar_prompt(patient, idade, care_type: str, anamnesis, hpma, extended_anamnesis: dict, symptoms: str,
+                  exams) -> prompt_builder.PromptMontado:
+    """Monta o prompt clínico respeitando PROMPT_TOKEN_BUDGET (ver prompt_builder.py)."""
+    pediatrico = eh_pediatrico(care_type, idade)
+    Secao = prompt_builder.Secao
+
+    # Ordem = ordem no prompt; o número é a prioridade (0 = nunca cortada, maior = cortada primeiro)
+    historico = Secao("medical_history", "Histórico Base (Condições Preexistentes)", patient.medical_history, 3)
+    anamnese = [
+        Secao("anamnesis", "Anamnese Geral", anamnesis, 4),
+        Secao("hpma", "HPMA (História da Presente Moléstia Atual)", hpma, 1),
+        Secao("antecedentes_pessoais", "Antecedentes Pessoais", extended_anamnesis.get("antecedentes_pessoais"), 3),
+        Secao("antecedentes_familiares", "Antecedentes Familiares", extended_anamnesis.get("antecedentes_familiares"), 5),
+        Secao("antecedentes_cirurgicos", "Antecedentes Cirúrgicos", extended_anamnesis.get("antecedentes_cirurgicos"), 5),
+        Secao("historia_gineco_obstetrica", "História Gineco-Obstétrica", extended_anamnesis.get("historia_gineco_obstetrica"), 4),
+        Secao("habitos_vida", "Hábitos de Vida", extended_anamnesis.get("habitos_vida"), 6),
+        Secao("medicamentos_uso", "Medicamentos em Uso", extended_anamnesis.get("medicamentos_uso"), prompt_builder.OBRIGATORIA),
+        Secao("alergias", "Alergias", extended_anamnesis.get("alergias"), prompt_builder.OBRIGATORIA),
+        Secao("revisao_sistemas", "Revisão por Sistemas", extended_anamnesis.get("revisao_sistemas"), 6),
+        Secao("pediatric_vaccines", "Situação Vacinal", extended_anamnesis.get("pediatric_vaccines"), 2 if pediatrico else 5),
+        Secao("pediatric_dnpm", "Desenvolvimento Neuropsicomotor (DNPM)", extended_anamnesis.get("pediatric_dnpm"), 2 if pediatrico else 5),
+        Secao("pediatric_breastfed", "Aleitamento Materno", extended_anamnesis.get("pediatric_breastfed"), 3 if pediatrico else 6),
+    ]
+    sintomas = Secao("symptoms", "QUEIXA PRINCIPAL / SINTOMAS ATUAIS", symptoms, prompt_builder.OBRIGATORIA)
+    exames = Secao("exams", "EXAMES INFORMADOS", exams, 2)
 
     if care_type == "Urgência":
         instrucao_tipo = (
@@ -84,7 +199,7 @@ def executar_analise_ia(patient, care_type: str, anamnesis, hpma, extended_anamn
             "Priorize a identificação de condições que ameaçam a vida. "
             "A urgência tende a ser Alta. Seja objetivo e direto na justificativa."
         )
-    elif care_type == "Pediátrico" or is_pediatric:
+    elif pediatrico:
         instrucao_tipo = (
             "ATENÇÃO: Paciente PEDIÁTRICO. "
             "Adapte todas as dosagens de medicamentos ao peso/idade pediátrica (mg/kg quando aplicável). "
@@ -97,7 +212,13 @@ def executar_analise_ia(patient, care_type: str, anamnesis, hpma, extended_anamn
             "Considere diagnósticos diferenciais amplos e condutas baseadas em evidências."
         )
 
-    prompt = f"""
+    # O nome fica fora do prompt: a resposta vai para o cache compartilhado (ai_cache.py) e não pode
+    # citar a identificação de outro paciente. A idade exata entra no prompt e na chave do cache.
+    texto_idade = f"{idade} anos" if isinstance(idade, int) else "Não informada"
+
+    def renderizar(textos: dict) -> str:
+        contexto_anamnese = "".join(f"\n{s.rotulo}: {textos[s.chave]}" for s in anamnese if textos.get(s.chave))
+        return f"""
     Campos ausentes do contexto indicam que a informação não estava disponível — ignore-os na análise clínica.
 
     Atue como um médico especialista sênior. {instrucao_tipo}
@@ -105,14 +226,13 @@ def executar_analise_ia(patient, care_type: str, anamnesis, hpma, extended_anamn
     TIPO DE ATENDIMENTO: {care_type}
 
     DADOS DO PACIENTE:
-    - Nome: {patient.full_name}
-    - Idade: {idade} anos
+    - Idade: {texto_idade}
     - Sexo: {patient.gender}
-    - Histórico Base (Condições Preexistentes): {patient.medical_history or "Não informado"}
+    - Histórico Base (Condições Preexistentes): {textos.get("medical_history") or "Não informado"}
     {contexto_anamnese}
 
-    QUEIXA PRINCIPAL / SINTOMAS ATUAIS: {symptoms}
-    EXAMES INFORMADOS: {exams or "Nenhum"}
+    QUEIXA PRINCIPAL / SINTOMAS ATUAIS: {textos.get("symptoms", "")}
+    EXAMES INFORMADOS: {textos.get("exams") or "Nenhum"}
 
     Retorne ESTRITAMENTE um JSON com as seguintes chaves:
     - referral: string. DEVE ser exatamente um dos valores: "Urgência", "Clínica Geral", "Pediatra", "Cardiologia", "Ortopedia", "Neurologia", "Ginecologia", "Psiquiatria", "Dermatologia", "Oftalmologia", "Otorrinolaringologia", "Urologia", "Gastroenterologia", "Pneumologia", "Endocrinologia", "Oncologia", "Reumatologia", "Infectologia", "Nefrologia", "Hematologia", "Outro"
@@ -126,38 +246,416 @@ def executar_analise_ia(patient, care_type: str, anamnesis, hpma, extended_anamn
     - medications: lista de strings com medicações sugeridas (nome genérico + dosagem). Se nenhuma medicação for indicada agora, retorne lista vazia []
     """
 
+    return prompt_builder.compactar([historico, *anamnese, sintomas, exames], renderizar)
+
+
+def completar_resultado_ia(ai_result: dict) -> dict:
+    """Preenche as chaves opcionais que o modelo às vezes omite."""
+    if "diagnoses" not in ai_result: ai_result["diagnoses"] = []
+    if "exams" not in ai_result: ai_result["exams"] = []
+    if "medications" not in ai_result: ai_result["medications"] = []
+    if "pathology_type" not in ai_result: ai_result["pathology_type"] = "Outra"
+    if "cid10" not in ai_result: ai_result["cid10"] = {"code": "Z99", "description": "Não classificado"}
+    if "cid10_secondary" not in ai_result: ai_result["cid10_secondary"] = []
+    # Códigos CID-10 conferidos com o catálogo antes de serem gravados
+    return cid10.catalogo().normalizar_resultado(ai_result)
+
+
+def chave_cache_analise(patient, idade, care_type, anamnesis, hpma, extended_anamnesis, symptoms, exams, model) -> str:
+    return ai_cache.gerar_chave(
+        idade=idade,
+        gender=patient.gender,
+        medical_history=patient.medical_history,
+        care_type=care_type,
+        anamnesis=anamnesis,
+        hpma=hpma,
+        extended_anamnesis=extended_anamnesis,
+        symptoms=symptoms,
+        exams=exams,
+        model=model,
+    )
+
+
+def executar_analise_ia(patient, care_type: str, anamnesis, hpma, extended_anamnesis: dict, symptoms: str, exams,
+                        use_cache: bool = True, model: Optional[str] = None, meta: Optional[dict] = None,
+                        owner_id: Optional[int] = None, case_id: Optional[int] = None):
+    """Constrói o prompt clínico e executa a análise via Gemini. Retorna (ai_result, ai_sucesso).
+
+    Com use_cache=False o cache é ignorado na leitura (opinião nova), mas o resultado ainda é gravado.
+    Com `owner_id` e SIMILARITY_REUSE_ENABLED, um caso revisado do médico muito parecido pode fornecer a
+    análise sem chamar o LLM (ver case_similarity.py); `case_id` evita que o próprio caso seja usado.
+    `model` sobrescreve a lista de modelos (usado pelos jobs de reanálise ao trocar de modelo, sem reservas).
+    `meta`, se passado, é preenchido com tokens do prompt, seções cortadas, latência e as tentativas feitas
+    ao LLM (vai para analysis_meta_json).
+    """
+    modelos = [model] if model else llm_client.MODELOS
+    model = modelos[0]
+    meta = meta if meta is not None else {}
+    meta.update({"model": model, "backend": llm.LLM_BACKEND, "cache_hit": False})
+    idade = calcular_idade(patient.birth_date)
+
+    chave_cache = chave_cache_analise(patient, idade, care_type, anamnesis, hpma, extended_anamnesis, symptoms, exams, model)
+    if use_cache:
+        ai_result = cache_analise.get(chave_cache)
+        if ai_result is not None:
+            metrics.registrar_analise("cache_hit", llm.LLM_BACKEND)
+            meta["cache_hit"] = True
+            return ai_result, True
+    else:
+        cache_analise.registrar_bypass()
+
+    if use_cache:
+        textos = case_similarity.textos_caso(symptoms, hpma, anamnesis, extended_anamnesis)
+        reaproveitada = case_similarity.analise_reaproveitavel(
+            owner_id, care_type, patient.birth_date, textos, excluir=case_id,
+        )
+        if reaproveitada is not None:
+            ai_result, vizinho_id, similaridade = reaproveitada
+            ai_result["justification"] = (
+                f"{ai_result.get('justification') or ''} "
+                f"(Análise reaproveitada do caso #{vizinho_id}, revisado pelo médico; similaridade {similaridade:.2f}.)"
+            ).strip()
+            metrics.registrar_analise("similar_reuse", llm.LLM_BACKEND)
+            meta.update(similar_case_id=vizinho_id, similarity=round(similaridade, 4))
+            return ai_result, True
+
+    with metrics.medir_fase("prompt_build"):
+        prompt = montar_prompt(patient, idade, care_type, anamnesis, hpma, extended_anamnesis, symptoms, exams)
+    metrics.registrar_prompt(prompt)
+    meta.update(prompt.meta())
+
     ai_sucesso = True
+    tentativas = []
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
-            config=types.GenerateContentConfig(response_mime_type="application/json"),
-        )
-        ai_result = json.loads(response.text)
-        if "diagnoses" not in ai_result: ai_result["diagnoses"] = []
-        if "exams" not in ai_result: ai_result["exams"] = []
-        if "medications" not in ai_result: ai_result["medications"] = []
-        if "pathology_type" not in ai_result: ai_result["pathology_type"] = "Outra"
-        if "cid10" not in ai_result: ai_result["cid10"] = {"code": "Z99", "description": "Não classificado"}
-        if "cid10_secondary" not in ai_result: ai_result["cid10_secondary"] = []
+        inicio = time.perf_counter()
+        try:
+            response = cliente_llm.gerar_json(prompt.texto, modelos, tentativas)
+        finally:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            metrics.observar_fase("llm_call", latencia_ms / 1000)
+            meta["llm_latency_ms"] = round(latencia_ms, 1)
+            meta["llm_attempts"] = tentativas
+        meta["model"] = response.model
+        metrics.registrar_tokens(response.model, response)
+        meta.update(prompt_tokens=response.prompt_tokens, output_tokens=response.output_tokens)
+        with metrics.medir_fase("parse"):
+            ai_result = completar_resultado_ia(json.loads(response.text))
+        # Resposta de um modelo reserva não entra no cache do principal
+        if response.model == model:
+            cache_analise.set(chave_cache, ai_result, model, latencia_ms)
     except Exception as e:
-        print(f"Erro Gemini: {e}")
+        print(f"Erro na IA ({llm.LLM_BACKEND}): {e}")
         ai_sucesso = False
-        ai_result = {
-            "referral": "Clínica Geral",
-            "urgency": "Indefinida",
-            "justification": "Erro no processamento da IA. Avaliação manual necessária.",
-            "pathology_type": "Não classificado",
-            "cid10": {"code": "Z99", "description": "Sem classificação disponível"},
-            "cid10_secondary": [],
-            "diagnoses": [],
-            "exams": [],
-            "medications": [],
-        }
+        meta["llm_error"] = llm_client.codigo_erro(e)
+        ai_result = resultado_ia_indisponivel(meta["llm_error"])
 
+    metrics.registrar_analise("success" if ai_sucesso else "error", llm.LLM_BACKEND)
     return ai_result, ai_sucesso
 
 
+def analisar_e_gravar(db: Session, case, patient, use_cache: bool = True, model: Optional[str] = None) -> bool:
+    """Roda a IA sobre um caso já salvo e grava o resultado (JSON, colunas e rollup). Retorna ai_sucesso."""
+    meta = {}
+    ai_result, ai_sucesso = executar_analise_ia(
+        patient=patient,
+        care_type=case.care_type or "Clínica Geral",
+        anamnesis=case.anamnesis,
+        hpma=case.hpma,
+        extended_anamnesis=dict(case.extended_anamnesis_json) if case.extended_anamnesis_json else {},
+        symptoms=case.symptoms,
+        exams=case.exams_input,
+        use_cache=use_cache,
+        model=model,
+        meta=meta,
+        owner_id=case.owner_id,
+        case_id=case.id,
+    )
+    gravar_resultado_ia(db, case, ai_result, ai_sucesso, meta)
+    return ai_sucesso
+
+
+def gravar_resultado_ia(db: Session, case, ai_result: dict, ai_sucesso: bool, meta: Optional[dict] = None):
+    chave_antiga = dashboard_rollup.chave_rollup(case)
+    aplicar_resultado_ia(case, ai_result, ai_sucesso, meta)
+    dashboard_rollup.mover_caso(db, chave_antiga, case)
+    db.commit()
+
+
+def gerar_eventos_analise(case, patient, use_cache: bool = True):
+    """Versão em streaming de analisar_e_gravar: gera eventos SSE enquanto o Gemini responde.
+
+    Eventos: "start", "delta" (texto bruto recebido), "field" (campo do JSON assim que fica completo,
+    ex.: urgency e referral), e no fim "done" (ou "error") com o resultado já salvo no caso.
+    `case` e `patient` chegam já carregados e fora de sessão: nenhuma conexão nem transação fica aberta
+    durante o stream do LLM; uma sessão curta abre só para gravar o resultado.
+    """
+    model = GEMINI_MODEL
+    modelo_usado = {"model": model}
+    idade = calcular_idade(patient.birth_date)
+    care_type = case.care_type or "Clínica Geral"
+    extended_anamnesis = dict(case.extended_anamnesis_json) if case.extended_anamnesis_json else {}
+    args_prompt = (care_type, case.anamnesis, case.hpma, extended_anamnesis, case.symptoms, case.exams_input)
+
+    yield ai_stream.evento_sse("start", {"case_id": case.id, "model": model})
+
+    chave_cache = chave_cache_analise(patient, idade, *args_prompt, model)
+    ai_result = cache_analise.get(chave_cache) if use_cache else None
+    if not use_cache:
+        cache_analise.registrar_bypass()
+    meta = {"model": model, "backend": llm.LLM_BACKEND, "cache_hit": ai_result is not None, "stream": True}
+
+    if ai_result is not None:
+        ai_sucesso = True
+        metrics.registrar_analise("cache_hit", llm.LLM_BACKEND)
+        for campo in ai_stream.CAMPOS_PARCIAIS:
+            if campo in ai_result:
+                yield ai_stream.evento_sse("field", {"field": campo, "value": ai_result[campo]})
+    else:
+        with metrics.medir_fase("prompt_build"):
+            prompt = montar_prompt(patient, idade, *args_prompt)
+        metrics.registrar_prompt(prompt)
+        meta.update(prompt.meta())
+        extrator = ai_stream.ExtratorParcial()
+        tentativas = []
+        meta["llm_attempts"] = tentativas
+        try:
+            inicio = time.perf_counter()
+            stream = cliente_llm.gerar_json_stream(prompt.texto, tentativas=tentativas, modelo_usado=modelo_usado)
+            for trecho in stream:
+                yield ai_stream.evento_sse("delta", {"text": trecho})
+                for campo, valor in extrator.feed(trecho):
+                    yield ai_stream.evento_sse("field", {"field": campo, "value": valor})
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            metrics.observar_fase("llm_stream", latencia_ms / 1000)
+            meta["llm_latency_ms"] = round(latencia_ms, 1)
+            meta["model"] = modelo_usado["model"]
+            with metrics.medir_fase("parse"):
+                ai_result = completar_resultado_ia(json.loads(extrator.texto))
+            if modelo_usado["model"] == model:
+                cache_analise.set(chave_cache, ai_result, model, latencia_ms)
+            ai_sucesso = True
+        except Exception as e:
+            print(f"Erro na IA ({llm.LLM_BACKEND}, stream): {e}")
+            meta["llm_error"] = llm_client.codigo_erro(e)
+            ai_result, ai_sucesso = resultado_ia_indisponivel(meta["llm_error"]), False
+        metrics.registrar_analise("success" if ai_sucesso else "error", llm.LLM_BACKEND)
+
+    db = SessionLocal()
+    try:
+        atual = consultar_caso_completo(db, case.id)
+        if atual is not None:
+            gravar_resultado_ia(db, atual, ai_result, ai_sucesso, meta)
+            status_final = atual.status
+    finally:
+        db.close()
+    if atual is None:
+        # Apagado enquanto a IA respondia
+        yield ai_stream.evento_sse("error", {"case_id": case.id, "detail": "Caso não encontrado"})
+        return
+    yield ai_stream.evento_sse("done" if ai_sucesso else "error", {
+        "case_id": case.id,
+        "status": status_final,
+        "ai_analysis_json": ai_result,
+    })
+
+
+def consultar_caso_completo(db: Session, case_id: int):
+    """Caso com as colunas do relato clínico (adiadas por padrão, ver models.GRUPO_RELATO) num SELECT só."""
+    return db.query(models.Case).options(undefer_group(models.GRUPO_RELATO)).\
+        filter(models.Case.id == case_id).first()
+
+
+def processar_analise_pendente(case_id: int, use_cache: bool = True):
+    """Executa a análise de IA de um caso salvo como "Em análise" (roda nos workers da fila)."""
+    db = SessionLocal()
+    try:
+        case = consultar_caso_completo(db, case_id)
+        if not case or case.status != STATUS_EM_ANALISE:
+            return
+
+        patient = db.query(models.Patient).filter(models.Patient.id == case.patient_id).first()
+        if not patient:
+            case.status = "Erro na Análise"
+            db.commit()
+            return
+
+        analisar_e_gravar(db, case, patient, use_cache=use_cache)
+    finally:
+        db.close()
+
+
+def reanalisar_por_id(case_id: int, model: Optional[str], use_cache: bool) -> bool:
+    """Reanálise de um caso pelos jobs em massa (cada chamada com sua própria Session)."""
+    db = SessionLocal()
+    try:
+        case = consultar_caso_completo(db, case_id)
+        if not case:
+            return False
+        patient = db.query(models.Patient).filter(models.Patient.id == case.patient_id).first()
+        if not patient:
+            return False
+        return analisar_e_gravar(db, case, patient, use_cache=use_cache, model=model)
+    finally:
+        db.close()
+
+
+# Reanálises concorrentes do mesmo caso (duplo clique, job em massa + médico) viram uma só chamada à IA
+reanalises_em_andamento = SingleFlight()
+
+
+def reanalisar_agrupado(case_id: int, model: Optional[str], use_cache: bool) -> bool:
+    """reanalisar_por_id, mas quem chega com a mesma reanálise já em andamento espera e recebe o mesmo resultado."""
+    chave = (case_id, model or GEMINI_MODEL, use_cache)
+    resultado, _ = reanalises_em_andamento.executar(chave, reanalisar_por_id, case_id, model, use_cache)
+    return resultado
+
+
+fila_analise.configurar(processar_analise_pendente)
+indice_similaridade.configurar(faixa_analise)
+jobs_reanalise.configurar(reanalisar_agrupado)
+
+
+def coletar_estado_ia():
+    """Gauges lidos na hora do scrape de /metrics: cache da IA, fila e jobs de reanálise."""
+    cache = cache_analise.stats()
+    fila = fila_analise.stats()
+    eventos_cache = ("memory_hits", "db_hits", "misses", "bypassed", "stores", "evictions")
+    return [
+        ("ai_queue_depth", "gauge", "Casos na fila de análise (aguardando ou em execução)", fila_analise.depth()),
+        ("ai_queue_workers", "gauge", "Workers da fila de análise", fila_analise.max_workers),
+        ("ai_queue_lane_depth", "gauge", "Casos aguardando worker, por faixa de prioridade",
+         [({"lane": f["lane"]}, f["queued"]) for f in fila["lanes"]]),
+        ("ai_queue_lane_running", "gauge", "Análises em execução, por faixa de prioridade",
+         [({"lane": f["lane"]}, f["running"]) for f in fila["lanes"]]),
+        ("reanalysis_jobs_running", "gauge", "Jobs de reanálise em execução neste processo", jobs_reanalise.em_execucao()),
+        ("reanalysis_in_flight", "gauge", "Reanálises em andamento (após agrupar chamadas repetidas)",
+         reanalises_em_andamento.stats()["in_flight"]),
+        ("reanalysis_coalesced_total", "counter", "Pedidos de reanálise atendidos pela chamada já em andamento",
+         reanalises_em_andamento.stats()["coalesced"]),
+        ("ai_llm_circuit_open", "gauge", "1 quando o circuit breaker do modelo está aberto (0.5 meio aberto)",
+         [({"model": modelo}, {"open": 1, "half_open": 0.5}.get(c["state"], 0))
+          for modelo, c in cliente_llm.estado_circuitos().items()]),
+        ("ai_llm_calls_in_flight", "gauge", "Chamadas ao LLM ocupando thread do pool (inclui hedges)",
+         cliente_llm.ocupacao()["in_flight"]),
+        ("ai_cache_memory_entries", "gauge", "Entradas no cache em memória da IA", cache["memory_entries"]),
+        ("ai_cache_hit_ratio", "gauge", "Taxa de acerto do cache da IA desde o startup", cache["hit_rate"]),
+        ("ai_cache_saved_seconds_total", "counter", "Tempo de LLM economizado pelo cache", cache["saved_ms"] / 1000),
+        ("ai_cache_events_total", "counter", "Eventos do cache da IA",
+         [({"event": evento}, cache[evento]) for evento in eventos_cache]),
+    ]
+
+
+metrics.registro.registrar_coletor(coletar_estado_ia)
+
+
+# --- STARTUP (chamados pelo lifespan, em ordem) ---
+
+def aplicar_migracoes():
+    if AUTO_MIGRATE:
+        migrator.migrar(engine)
+        return
+    faltando = migrator.pendentes(engine)
+    if faltando:
+        print(f"ATENÇÃO: {len(faltando)} migração(ões) pendente(s) ({', '.join(m.nome for m in faltando)}). "
+              "Rode python migrator.py.")
+
+
+def preparar_rollup_dashboard():
+    # Bancos anteriores ao rollup: monta os agregados uma vez a partir dos casos existentes
+    db = SessionLocal()
+    try:
+        if not db.query(models.DashboardRollup.id).first() and db.query(models.Case.id).first():
+            linhas = dashboard_rollup.reconstruir(db)
+            print(f"Rollup do dashboard criado a partir dos casos existentes ({linhas} linha(s)).")
+    finally:
+        db.close()
+
+
+def carregar_catalogo_cid10():
+    catalogo_cid10 = cid10.catalogo()
+    print(f"Catálogo CID-10 carregado: {len(catalogo_cid10)} código(s)"
+          f"{'' if catalogo_cid10.completo else ' (recorte parcial: códigos fora dele ficam sem conferência)'}.")
+
+
+def recuperar_analises_pendentes():
+    # Casos que ficaram "Em análise" por queda do processo voltam para a fila
+    db = SessionLocal()
+    try:
+        pendentes = db.query(models.Case.id, models.Case.care_type, models.Patient.birth_date).\
+            join(models.Patient, models.Case.patient_id == models.Patient.id).\
+            filter(models.Case.status == STATUS_EM_ANALISE).\
+            order_by(models.Case.id).all()
+    finally:
+        db.close()
+    for case_id, care_type, birth_date in pendentes:
+        fila_analise.enqueue(case_id, faixa=faixa_analise(care_type, birth_date))
+    if pendentes:
+        print(f"{len(pendentes)} análise(s) pendente(s) recolocada(s) na fila.")
+
+
+def retomar_jobs_reanalise():
+    retomados = jobs_reanalise.retomar_pendentes()
+    if retomados:
+        print(f"Jobs de reanálise retomados: {retomados}")
+
+
+def responsavel_pela_recuperacao() -> bool:
+    if not STARTUP_RECOVERY_TOKEN:
+        return True
+    # O primeiro worker a criar o arquivo fica com a recuperação; os demais só atendem requisições
+    caminho = os.path.join(tempfile.gettempdir(), f"ainurse-recovery-{STARTUP_RECOVERY_TOKEN}")
+    try:
+        os.close(os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+# --- SAÚDE ---
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: o processo e o event loop respondem (não toca no banco nem no LLM)."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    """Readiness: startup concluído, banco (e réplica) acessíveis, sem migrações pendentes e LLM disponível."""
+    checks = {"startup": {"ok": estado_app["pronto"], "ms": estado_app["startup_ms"]}}
+
+    engines = {"database": engine}
+    if read_engine is not engine:
+        engines["database_replica"] = read_engine
+    for nome, eng in engines.items():
+        inicio = time.perf_counter()
+        try:
+            with eng.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            checks[nome] = {"ok": True}
+        except Exception as e:
+            checks[nome] = {"ok": False, "error": str(e)}
+        checks[nome]["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    if checks["database"]["ok"]:
+        faltando = migrator.pendentes(engine)
+        checks["migrations"] = {"ok": not faltando, "pending": [m.versao for m in faltando]}
+
+    ok, erro = llm.verificar_disponibilidade(GEMINI_MODEL)
+    if ok and not cliente_llm.disponivel():
+        ok, erro = False, "circuit breaker aberto para todos os modelos"
+    checks["llm"] = {
+        "ok": ok, "required": READYZ_REQUIRE_LLM, "circuits": cliente_llm.estado_circuitos(),
+        "pool": cliente_llm.ocupacao(),
+        **({"error": erro} if erro else {}),
+    }
+
+    pronto = all(c["ok"] for nome, c in checks.items() if nome != "llm" or READYZ_REQUIRE_LLM)
+    return JSONResponse(
+        status_code=200 if pronto else 503,
+        content={"status": "ready" if pronto else "not_ready", "checks": checks},
+    )
+
+
 @app.post("/login", response_model=schemas.UserResponse)
 def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.email == user_credentials.email).first()
@@ -203,114 +701,300 @@ def update_user(user_id: int, user_update: schemas.UserUpdate, db: Session = Dep
 # --- ROTAS DE PACIENTES ---
 
 @app.get("/patients/", response_model=list[schemas.PatientResponse])
-def list_patients(owner_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Patient).filter(models.Patient.owner_id == owner_id).all()
+def list_patients(
+    owner_id: int,
+    request: Request,
+    limit: int = Query(pagination.PAGE_SIZE_PADRAO, ge=1),
+    cursor: Optional[str] = None,
+    sort: str = Query("-id", pattern=pagination.ORDENACAO_PATTERN),
+    name_prefix: Optional[str] = None,
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """Lista paginada por cursor. O cursor da próxima página vem no header X-Next-Cursor."""
+    etag = http_cache.gerar_etag("patients", owner_id, http_cache.versao_owner(db, owner_id), request.url.query)
+
+    def gerar():
+        query = db.query(models.Patient).filter(models.Patient.owner_id == owner_id)
+        if name_prefix:
+            query = query.filter(models.Patient.full_name.ilike(pagination.escapar_like(name_prefix) + "%", escape="\\"))
+        query = pagination.filtrar_periodo(query, models.Patient.created_at, created_from, created_to)
+
+        patients, proximo = pagination.paginar(query, models.Patient, sort, pagination.limitar_page_size(limit), cursor)
+        return fast_json.serializar(list[schemas.PatientResponse], patients), {pagination.HEADER_CURSOR: proximo} if proximo else {}
+
+    return http_cache.responder(request, owner_id, ("patients", request.url.query), etag, gerar)
 
 # --- ROTAS DE CASOS CLÍNICOS ---
 
-@app.post("/cases/", response_model=schemas.CaseResponse)
-def create_case(case_data: schemas.CaseCreate, owner_id: int, db: Session = Depends(get_db)):
-    patient = None
-
-    if case_data.patient_id:
-        patient = db.query(models.Patient).filter(models.Patient.id == case_data.patient_id).first()
-
-    if not patient and case_data.patient_data:
-        if case_data.patient_data.cpf:
-            patient = db.query(models.Patient).filter(
-                models.Patient.cpf == case_data.patient_data.cpf
-            ).first()
-
-        if not patient:
-            patient = db.query(models.Patient).filter(
-                models.Patient.full_name == case_data.patient_data.full_name,
-                models.Patient.birth_date == case_data.patient_data.birth_date
-            ).first()
-
-        if not patient:
-            patient = models.Patient(
-                full_name=case_data.patient_data.full_name,
-                birth_date=case_data.patient_data.birth_date,
-                gender=case_data.patient_data.gender,
-                cpf=case_data.patient_data.cpf,
-                mother_name=case_data.patient_data.mother_name,
-                medical_history=case_data.patient_data.medical_history,
-                owner_id=owner_id
-            )
-            db.add(patient)
-            db.commit()
-            db.refresh(patient)
+CAMPOS_ANAMNESE_ESTENDIDA = (
+    "antecedentes_pessoais", "antecedentes_familiares", "antecedentes_cirurgicos",
+    "historia_gineco_obstetrica", "habitos_vida", "medicamentos_uso", "alergias", "revisao_sistemas",
+    "pediatric_responsible", "pediatric_vaccines", "pediatric_breastfed", "pediatric_dnpm",
+)
 
-    if not patient:
-        raise HTTPException(status_code=400, detail="Dados do paciente não encontrados ou incompletos.")
 
+def montar_anamnese_estendida(case_data: schemas.CaseCreate) -> dict:
     extended_anamnesis = {}
-    if case_data.antecedentes_pessoais:
-        extended_anamnesis["antecedentes_pessoais"] = case_data.antecedentes_pessoais
-    if case_data.antecedentes_familiares:
-        extended_anamnesis["antecedentes_familiares"] = case_data.antecedentes_familiares
-    if case_data.antecedentes_cirurgicos:
-        extended_anamnesis["antecedentes_cirurgicos"] = case_data.antecedentes_cirurgicos
-    if case_data.historia_gineco_obstetrica:
-        extended_anamnesis["historia_gineco_obstetrica"] = case_data.historia_gineco_obstetrica
-    if case_data.habitos_vida:
-        extended_anamnesis["habitos_vida"] = case_data.habitos_vida
-    if case_data.medicamentos_uso:
-        extended_anamnesis["medicamentos_uso"] = case_data.medicamentos_uso
-    if case_data.alergias:
-        extended_anamnesis["alergias"] = case_data.alergias
-    if case_data.revisao_sistemas:
-        extended_anamnesis["revisao_sistemas"] = case_data.revisao_sistemas
-    if case_data.pediatric_responsible:
-        extended_anamnesis["pediatric_responsible"] = case_data.pediatric_responsible
-    if case_data.pediatric_vaccines:
-        extended_anamnesis["pediatric_vaccines"] = case_data.pediatric_vaccines
-    if case_data.pediatric_breastfed:
-        extended_anamnesis["pediatric_breastfed"] = case_data.pediatric_breastfed
-    if case_data.pediatric_dnpm:
-        extended_anamnesis["pediatric_dnpm"] = case_data.pediatric_dnpm
+    for campo in CAMPOS_ANAMNESE_ESTENDIDA:
+        valor = getattr(case_data, campo)
+        if valor:
+            extended_anamnesis[campo] = valor
+    return extended_anamnesis
 
-    care_type = case_data.care_type or "Clínica Geral"
 
-    ai_result, ai_sucesso = executar_analise_ia(
-        patient=patient,
-        care_type=care_type,
-        anamnesis=case_data.anamnesis,
-        hpma=case_data.hpma,
-        extended_anamnesis=extended_anamnesis,
-        symptoms=case_data.symptoms,
-        exams=case_data.exams,
-    )
+def resolver_pacientes(db: Session, itens: list, owner_id: int) -> list:
+    """Encontra ou cria o paciente de cada CaseCreate com uma única consulta indexada para o lote inteiro.
 
-    status_caso = "Analisado" if ai_sucesso else "Erro na Análise"
-
-    new_case = models.Case(
+    Mesma regra do cadastro individual: patient_id, depois CPF (só dígitos), depois nome normalizado
+    + data de nascimento; se nada bater, cria o paciente. Retorna a lista de pacientes (None quando faltam dados).
+    """
+    ids = {c.patient_id for c in itens if c.patient_id}
+    dados = [c.patient_data for c in itens if c.patient_data]
+    cpfs = {patient_matching.cpf_digitos(d.cpf) for d in dados} - {None}
+    chaves = {patient_matching.chave_paciente(d.full_name, d.birth_date) for d in dados}
+
+    criterios = []
+    if ids:
+        criterios.append(models.Patient.id.in_(ids))
+    if cpfs:
+        criterios.append(models.Patient.cpf_digits.in_(cpfs))
+    if chaves:
+        criterios.append(models.Patient.match_key.in_(chaves))
+
+    por_id, por_cpf, por_chave = {}, {}, {}
+    if criterios:
+        # Ordem decrescente: em caso de duplicata já existente, o paciente mais antigo prevalece
+        for p in db.query(models.Patient).filter(or_(*criterios)).order_by(models.Patient.id.desc()):
+            por_id[p.id] = p
+            if p.cpf_digits:
+                por_cpf[p.cpf_digits] = p
+            # Homônimos com a mesma chave ficam todos, do mais antigo ao mais novo
+            por_chave.setdefault(p.match_key, []).insert(0, p)
+
+    pacientes = []
+    novos = False
+    for case_data in itens:
+        patient = por_id.get(case_data.patient_id) if case_data.patient_id else None
+        pd = case_data.patient_data
+        if not patient and pd:
+            cpf = patient_matching.cpf_digitos(pd.cpf)
+            chave = patient_matching.chave_paciente(pd.full_name, pd.birth_date)
+            patient = (cpf and por_cpf.get(cpf)) or next(
+                (p for p in por_chave.get(chave, ()) if patient_matching.cpf_compativel(cpf, p)), None)
+            if not patient:
+                patient = models.Patient(
+                    full_name=pd.full_name,
+                    birth_date=pd.birth_date,
+                    gender=pd.gender,
+                    cpf=pd.cpf,
+                    mother_name=pd.mother_name,
+                    medical_history=pd.medical_history,
+                    owner_id=owner_id
+                )
+                patient_matching.preencher_chaves(patient)
+                db.add(patient)
+                novos = True
+                # Itens seguintes do mesmo lote reaproveitam o paciente recém-criado
+                if cpf:
+                    por_cpf[cpf] = patient
+                por_chave.setdefault(chave, []).append(patient)
+        pacientes.append(patient)
+
+    if novos:
+        db.commit()
+    return pacientes
+
+
+def novo_caso(case_data: schemas.CaseCreate, patient, owner_id: int, extended_anamnesis: dict):
+    return models.Case(
         patient_id=patient.id,
-        care_type=care_type,
+        care_type=case_data.care_type or "Clínica Geral",
         anamnesis=case_data.anamnesis,
         hpma=case_data.hpma,
         extended_anamnesis_json=extended_anamnesis if extended_anamnesis else None,
         symptoms=case_data.symptoms,
         exams_input=case_data.exams,
         owner_id=owner_id,
-        status=status_caso,
-        ai_analysis_json=ai_result
+        status=STATUS_EM_ANALISE,
     )
 
+
+@app.post("/cases/", response_model=schemas.CaseResponse)
+def create_case(case_data: schemas.CaseCreate, owner_id: int, async_analysis: Optional[bool] = None,
+                force_refresh: bool = False,
+                idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                db: Session = Depends(get_db)):
+    """Com o header Idempotency-Key, retentativas devolvem o resultado do primeiro cadastro (ver idempotency.py)."""
+    if idempotency_key is not None:
+        hash_req = idempotency.hash_requisicao(case_data.model_dump(mode="json"), async_analysis, force_refresh)
+        guardada = idempotency.reservar(db, owner_id, idempotency_key, hash_req)
+        if guardada is not None:
+            return guardada
+        try:
+            return cadastrar_caso(db, case_data, owner_id, async_analysis, force_refresh, idempotency_key)
+        except BaseException:
+            idempotency.liberar(db, owner_id, idempotency_key)
+            raise
+    return cadastrar_caso(db, case_data, owner_id, async_analysis, force_refresh)
+
+
+def cadastrar_caso(db: Session, case_data: schemas.CaseCreate, owner_id: int, async_analysis: Optional[bool],
+                   force_refresh: bool, idempotency_key: Optional[str] = None):
+    patient = resolver_pacientes(db, [case_data], owner_id)[0]
+
+    if not patient:
+        raise HTTPException(status_code=400, detail="Dados do paciente não encontrados ou incompletos.")
+
+    extended_anamnesis = montar_anamnese_estendida(case_data)
+    care_type = case_data.care_type or "Clínica Geral"
+    assincrono = ANALISE_ASSINCRONA if async_analysis is None else async_analysis
+
+    meta = {}
+    if not assincrono:
+        ai_result, ai_sucesso = executar_analise_ia(
+            patient=patient,
+            care_type=care_type,
+            anamnesis=case_data.anamnesis,
+            hpma=case_data.hpma,
+            extended_anamnesis=extended_anamnesis,
+            symptoms=case_data.symptoms,
+            exams=case_data.exams,
+            use_cache=not force_refresh,
+            meta=meta,
+            owner_id=owner_id,
+        )
+
+    new_case = novo_caso(case_data, patient, owner_id, extended_anamnesis)
+    if not assincrono:
+        aplicar_resultado_ia(new_case, ai_result, ai_sucesso, meta)
+
     db.add(new_case)
+    db.flush()
+    dashboard_rollup.registrar_caso(db, new_case)
+    corpo = None
+    if idempotency_key is not None:
+        new_case.patient_name = patient.full_name
+        # A resposta é gravada na mesma transação do caso: retentativa nunca acha caso sem resposta (nem o contrário)
+        corpo = fast_json.serializar(schemas.CaseResponse, new_case)
+        idempotency.concluir(db, owner_id, idempotency_key, corpo, case_id=new_case.id)
     db.commit()
-    db.refresh(new_case)
 
+    if assincrono:
+        fila_analise.enqueue(
+            new_case.id, faixa=faixa_analise(care_type, patient.birth_date), use_cache=not force_refresh,
+        )
+
+    if corpo is not None:
+        return Response(content=corpo, media_type="application/json")
+    db.refresh(new_case)
     new_case.patient_name = patient.full_name
-    return new_case
+    return fast_json.responder_modelo(schemas.CaseResponse, new_case)
+
+@app.post("/cases/batch", response_model=schemas.CaseBatchResponse)
+def create_cases_batch(
+    cases_data: list[schemas.CaseCreate],
+    owner_id: int,
+    concurrency: int = Query(batch_intake.BATCH_CONCURRENCY, ge=1, le=batch_intake.BATCH_CONCURRENCY_MAX),
+    item_timeout: float = Query(batch_intake.BATCH_ITEM_TIMEOUT, gt=0, le=600),
+    force_refresh: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Cadastro em lote: as análises rodam em paralelo (até `concurrency`) e os casos são gravados em blocos."""
+    if len(cases_data) > batch_intake.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Lote excede o limite de {batch_intake.BATCH_MAX_ITEMS} casos")
+
+    inicio = time.perf_counter()
+    pacientes = resolver_pacientes(db, cases_data, owner_id)
+    resultados = [schemas.CaseBatchItemResult(index=i) for i in range(len(cases_data))]
+
+    tarefas = {}
+    preparados = {}
+    metas = {}
+    for i, (case_data, patient) in enumerate(zip(cases_data, pacientes)):
+        if not patient:
+            resultados[i].error = "Dados do paciente não encontrados ou incompletos."
+            continue
+        extended_anamnesis = montar_anamnese_estendida(case_data)
+        # Cópia simples do paciente: as threads não podem tocar na Session
+        snapshot = SimpleNamespace(
+            full_name=patient.full_name, birth_date=patient.birth_date,
+            gender=patient.gender, medical_history=patient.medical_history,
+        )
+        preparados[i] = (case_data, patient.id, patient.full_name, extended_anamnesis)
+        metas[i] = {}
+        tarefas[i] = partial(
+            executar_analise_ia,
+            patient=snapshot,
+            care_type=case_data.care_type or "Clínica Geral",
+            anamnesis=case_data.anamnesis,
+            hpma=case_data.hpma,
+            extended_anamnesis=extended_anamnesis,
+            symptoms=case_data.symptoms,
+            exams=case_data.exams,
+            use_cache=not force_refresh,
+            meta=metas[i],
+            owner_id=owner_id,
+        )
+
+    bloco = []
+
+    def gravar_bloco():
+        try:
+            db.add_all([case for _, case, _ in bloco])
+            db.flush()
+            respostas = []
+            for i, case, nome in bloco:
+                dashboard_rollup.registrar_caso(db, case)
+                # Monta a resposta antes do commit para não recarregar cada caso depois
+                respostas.append((i, schemas.CaseResponse(
+                    id=case.id, patient_id=case.patient_id, status=case.status, created_at=case.created_at,
+                    ai_analysis_json=case.ai_analysis_json, patient_name=nome, care_type=case.care_type,
+                )))
+            db.commit()
+            for i, resposta in respostas:
+                resultados[i].case_id = resposta.id
+                resultados[i].status = resposta.status
+                resultados[i].case = resposta
+        except Exception as e:
+            db.rollback()
+            for i, _, _ in bloco:
+                resultados[i].error = f"Erro ao gravar caso: {e}"
+        bloco.clear()
+
+    for i, analise, erro in batch_intake.executar_em_paralelo(tarefas, concurrency, item_timeout):
+        case_data, patient_id, nome, extended_anamnesis = preparados[i]
+        if erro is not None:
+            ai_result, ai_sucesso = resultado_ia_indisponivel(), False
+            resultados[i].error = str(erro) or erro.__class__.__name__
+        else:
+            ai_result, ai_sucesso = analise
+        case = novo_caso(case_data, SimpleNamespace(id=patient_id), owner_id, extended_anamnesis)
+        aplicar_resultado_ia(case, ai_result, ai_sucesso, metas[i])
+        bloco.append((i, case, nome))
+        if len(bloco) >= batch_intake.BATCH_COMMIT_SIZE:
+            gravar_bloco()
+    if bloco:
+        gravar_bloco()
+
+    sucesso = sum(1 for r in resultados if r.case_id and not r.error)
+    return {
+        "total": len(cases_data),
+        "succeeded": sucesso,
+        "failed": len(cases_data) - sucesso,
+        "elapsed_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "items": resultados,
+    }
 
 @app.put("/cases/{case_id}", response_model=schemas.CaseDetailResponse)
 def update_case(case_id: int, case_update: schemas.CaseUpdate, db: Session = Depends(get_db)):
-    case = db.query(models.Case).filter(models.Case.id == case_id).first()
+    case = consultar_caso_completo(db, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Caso não encontrado")
 
     update_data = case_update.model_dump(exclude_none=True)
+    chave_antiga = dashboard_rollup.chave_rollup(case)
 
     extended_fields = {
         "antecedentes_pessoais", "antecedentes_familiares", "antecedentes_cirurgicos",
@@ -338,6 +1022,7 @@ def update_case(case_id: int, case_update: schemas.CaseUpdate, db: Session = Dep
         if direct_updates["doctor_conclusion"]:
             case.status = "Revisado pelo Médico"
 
+    dashboard_rollup.mover_caso(db, chave_antiga, case)
     db.commit()
     db.refresh(case)
 
@@ -357,49 +1042,213 @@ def update_case(case_id: int, case_update: schemas.CaseUpdate, db: Session = Dep
         case.mother_name = None
         case.medical_history = None
 
-    return case
+    return fast_json.responder_modelo(schemas.CaseDetailResponse, case)
+
+# Colunas da listagem de casos (campos do CaseResponse)
+COLUNAS_LISTA_CASOS = (
+    models.Case.id, models.Case.patient_id, models.Case.status, models.Case.created_at,
+    models.Case.ai_analysis_json, models.Case.care_type, models.Case.version, models.Case.updated_at,
+    models.Patient.full_name.label("patient_name"), models.Patient.cpf,
+)
 
 @app.get("/cases/", response_model=list[schemas.CaseResponse])
-def read_cases(owner_id: int, db: Session = Depends(get_db)):
-    results = db.query(models.Case, models.Patient.full_name, models.Patient.cpf).\
-              join(models.Patient, models.Case.patient_id == models.Patient.id).\
-              filter(models.Case.owner_id == owner_id).\
-              order_by(models.Case.id.desc()).all()
-
-    cases_list = []
-    for case, name, cpf in results:
-        case.patient_name = name
-        case.cpf = cpf
-        cases_list.append(case)
-    return cases_list
+def read_cases(
+    owner_id: int,
+    request: Request,
+    limit: int = Query(pagination.PAGE_SIZE_PADRAO, ge=1),
+    cursor: Optional[str] = None,
+    sort: str = Query("-id", pattern=pagination.ORDENACAO_PATTERN),
+    status: Optional[str] = None,
+    care_type: Optional[str] = None,
+    urgency: Optional[str] = None,
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    patient_name: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Lista paginada por cursor. O cursor da próxima página vem no header X-Next-Cursor.
+
+    Responde 304 para If-None-Match com a ETag atual (muda a cada caso/paciente alterado do médico).
+    """
+    etag = http_cache.gerar_etag("cases", owner_id, http_cache.versao_owner(db, owner_id), request.url.query)
+
+    def gerar():
+        # Projeção só com o que o CaseResponse usa: sem montar entidades nem trazer o relato clínico
+        query = db.query(*COLUNAS_LISTA_CASOS).\
+                join(models.Patient, models.Case.patient_id == models.Patient.id).\
+                filter(models.Case.owner_id == owner_id)
+        if status:
+            query = query.filter(models.Case.status == status)
+        if care_type:
+            query = query.filter(models.Case.care_type == care_type)
+        if urgency:
+            query = query.filter(models.Case.urgency == urgency)
+        if patient_name:
+            query = query.filter(models.Patient.full_name.ilike(pagination.escapar_like(patient_name) + "%", escape="\\"))
+        query = pagination.filtrar_periodo(query, models.Case.created_at, created_from, created_to)
+
+        results, proximo = pagination.paginar(query, models.Case, sort, pagination.limitar_page_size(limit), cursor)
+        return fast_json.serializar(list[schemas.CaseResponse], results), {pagination.HEADER_CURSOR: proximo} if proximo else {}
+
+    return http_cache.responder(request, owner_id, ("cases", request.url.query), etag, gerar)
+
+@app.get("/cases/search", response_model=list[schemas.CaseSearchResult])
+def search_cases(
+    owner_id: int,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Busca textual nos casos do médico, do mais ao menos relevante, com trecho destacado (entre « »)."""
+    try:
+        encontrados, proximo = case_search.buscar(db, owner_id, q, pagination.limitar_page_size(limit), cursor)
+    except case_search.BuscaIndisponivel as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if proximo:
+        response.headers[pagination.HEADER_CURSOR] = proximo
+    if not encontrados:
+        return []
+
+    ids = [case_id for case_id, _, _ in encontrados]
+    linhas = db.query(
+        models.Case.id, models.Case.patient_id, models.Case.status, models.Case.care_type,
+        models.Case.urgency, models.Case.created_at, models.Patient.full_name,
+    ).join(models.Patient, models.Case.patient_id == models.Patient.id).\
+        filter(models.Case.id.in_(ids)).all()
+    por_id = {linha.id: linha for linha in linhas}
+
+    resultados = []
+    for case_id, score, snippet in encontrados:
+        linha = por_id.get(case_id)
+        if linha:
+            resultados.append({
+                "id": linha.id, "patient_id": linha.patient_id, "patient_name": linha.full_name,
+                "status": linha.status, "care_type": linha.care_type, "urgency": linha.urgency,
+                "created_at": linha.created_at, "score": score, "snippet": snippet,
+            })
+    return resultados
+
+@app.get("/cases/export")
+def export_cases(
+    owner_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    status: Optional[str] = None,
+    flatten_ai: bool = False,
+):
+    """Exporta os casos do médico (com a análise da IA) em streaming, um lote por vez (ver case_export.py)."""
+    # Sessão própria: precisa continuar aberta enquanto o corpo é enviado, e o gerador a fecha no fim
+    db = ReadSessionLocal()
+    query = case_export.consulta_exportacao(db, owner_id, created_from, created_to, status)
+    nome_arquivo = f"casos_{owner_id}_{datetime.now():%Y%m%d}.{format}"
+    return StreamingResponse(
+        case_export.exportar(db, format, query, achatar=flatten_ai),
+        media_type=case_export.FORMATOS[format],
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"', "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/cases/{case_id}", response_model=schemas.CaseDetailResponse)
-def read_case_detail(case_id: int, db: Session = Depends(get_db)):
-    case = db.query(models.Case).filter(models.Case.id == case_id).first()
+def read_case_detail(case_id: int, request: Request, db: Session = Depends(get_read_db)):
+    # Só a versão é lida antes de decidir: um If-None-Match que confere não carrega nem serializa o caso
+    versao = http_cache.versao_caso(db, case_id)
+    if not versao:
+        raise HTTPException(status_code=404, detail="Caso não encontrado")
+    etag = http_cache.gerar_etag("case", case_id, versao.version)
+
+    def gerar():
+        case = consultar_caso_completo(db, case_id)
+        patient = db.query(models.Patient).filter(models.Patient.id == case.patient_id).first()
+        if patient:
+            case.patient_name = patient.full_name
+            case.birth_date = patient.birth_date
+            case.gender = patient.gender
+            case.cpf = patient.cpf
+            case.mother_name = patient.mother_name
+            case.medical_history = patient.medical_history
+        else:
+            case.patient_name = "Desconhecido"
+            case.birth_date = None
+            case.gender = "N/A"
+            case.cpf = None
+            case.mother_name = None
+            case.medical_history = "N/A"
+        return fast_json.serializar(schemas.CaseDetailResponse, case), {}
+
+    return http_cache.responder(request, versao.owner_id, ("case", case_id), etag, gerar)
+
+def _ler_status_caso(case_id: int):
+    db = SessionLocal()
+    try:
+        row = db.query(models.Case.id, models.Case.status, models.Case.ai_analysis_json).\
+              filter(models.Case.id == case_id).first()
+    finally:
+        db.close()
+    if not row:
+        raise HTTPException(status_code=404, detail="Caso não encontrado")
+    return {"id": row.id, "status": row.status, "ai_analysis_json": row.ai_analysis_json}
+
+@app.get("/cases/{case_id}/similar", response_model=list[schemas.CaseSimilarResult])
+def similar_cases(
+    case_id: int,
+    k: int = Query(10, ge=1, le=100),
+    reviewed_only: bool = False,
+    min_score: float = Query(case_similarity.SIMILARITY_MIN_SCORE, ge=0, le=1),
+    db: Session = Depends(get_read_db),
+):
+    """Casos do mesmo médico com relato clínico mais parecido (similaridade do cosseno, de 0 a 1).
+
+    Só casos com similaridade acima de min_score (padrão SIMILARITY_MIN_SCORE) entram no resultado.
+    """
+    if not case_similarity.SIMILARITY_HABILITADO:
+        raise HTTPException(status_code=503, detail="Busca por casos similares desativada (SIMILARITY_ENABLED)")
+    case = consultar_caso_completo(db, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Caso não encontrado")
 
-    patient = db.query(models.Patient).filter(models.Patient.id == case.patient_id).first()
-    if patient:
-        case.patient_name = patient.full_name
-        case.birth_date = patient.birth_date
-        case.gender = patient.gender
-        case.cpf = patient.cpf
-        case.mother_name = patient.mother_name
-        case.medical_history = patient.medical_history
-    else:
-        case.patient_name = "Desconhecido"
-        case.birth_date = None
-        case.gender = "N/A"
-        case.cpf = None
-        case.mother_name = None
-        case.medical_history = "N/A"
-
-    return case
+    encontrados = case_similarity.similares(db, case, k, apenas_revisados=reviewed_only, minimo=min_score)
+    if not encontrados:
+        return []
+    linhas = db.query(
+        models.Case.id, models.Case.patient_id, models.Case.status, models.Case.care_type,
+        models.Case.urgency, models.Case.cid10_code, models.Case.created_at, models.Patient.full_name,
+    ).join(models.Patient, models.Case.patient_id == models.Patient.id).\
+        filter(models.Case.id.in_([similar_id for similar_id, _ in encontrados])).all()
+    por_id = {linha.id: linha for linha in linhas}
+
+    resultados = []
+    for similar_id, score in encontrados:
+        linha = por_id.get(similar_id)
+        if linha:
+            resultados.append({
+                "id": linha.id, "patient_id": linha.patient_id, "patient_name": linha.full_name,
+                "status": linha.status, "care_type": linha.care_type, "urgency": linha.urgency,
+                "cid10_code": linha.cid10_code, "created_at": linha.created_at, "score": round(score, 4),
+            })
+    return resultados
+
+
+@app.get("/cases/{case_id}/status", response_model=schemas.CaseStatusResponse)
+async def read_case_status(case_id: int, wait: float = Query(0, ge=0, le=30)):
+    """Polling/long-poll do status da análise. Com wait > 0 segura a resposta até a análise terminar."""
+    deadline = time.monotonic() + wait
+    while True:
+        case_status = await run_in_threadpool(_ler_status_caso, case_id)
+        restante = deadline - time.monotonic()
+        if case_status["status"] != STATUS_EM_ANALISE or restante <= 0:
+            return case_status
+        # Se o caso está na fila deste processo acorda assim que ela terminar; senão reconsulta o banco a cada 1s
+        if fila_analise.is_pending(case_id):
+            await fila_analise.aguardar(case_id, min(restante, 1.0))
+        else:
+            await asyncio.sleep(min(restante, 1.0))
 
 @app.post("/cases/{case_id}/reanalisar", response_model=schemas.CaseDetailResponse)
-def reanalisar_caso(case_id: int, db: Session = Depends(get_db)):
-    case = db.query(models.Case).filter(models.Case.id == case_id).first()
+def reanalisar_caso(case_id: int, force_refresh: bool = False, db: Session = Depends(get_db)):
+    """force_refresh=true ignora o cache quando o médico quer explicitamente uma nova opinião da IA."""
+    case = consultar_caso_completo(db, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Caso não encontrado")
 
@@ -407,22 +1256,12 @@ def reanalisar_caso(case_id: int, db: Session = Depends(get_db)):
     if not patient:
         raise HTTPException(status_code=404, detail="Paciente não encontrado")
 
-    extended_anamnesis = dict(case.extended_anamnesis_json) if case.extended_anamnesis_json else {}
-
-    ai_result, ai_sucesso = executar_analise_ia(
-        patient=patient,
-        care_type=case.care_type or "Clínica Geral",
-        anamnesis=case.anamnesis,
-        hpma=case.hpma,
-        extended_anamnesis=extended_anamnesis,
-        symptoms=case.symptoms,
-        exams=case.exams_input,
-    )
-
-    case.ai_analysis_json = ai_result
-    case.status = "Analisado" if ai_sucesso else "Erro na Análise"
-    db.commit()
+    # A análise é gravada por outra Session (a da chamada que estiver à frente); encerra a transação de
+    # leitura para recarregar o caso já com o resultado
+    db.rollback()
+    reanalisar_agrupado(case_id, None, use_cache=not force_refresh)
     db.refresh(case)
+    db.refresh(patient)
 
     case.patient_name = patient.full_name
     case.birth_date = patient.birth_date
@@ -430,64 +1269,153 @@ def reanalisar_caso(case_id: int, db: Session = Depends(get_db)):
     case.cpf = patient.cpf
     case.mother_name = patient.mother_name
     case.medical_history = patient.medical_history
-    return case
+    return fast_json.responder_modelo(schemas.CaseDetailResponse, case)
+
 
+@app.get("/cases/{case_id}/analysis/stream")
+def stream_case_analysis(case_id: int, force_refresh: bool = False):
+    """Reanalisa o caso enviando a saída parcial da IA por Server-Sent Events.
+
+    É GET para poder ser consumido direto por EventSource no navegador.
+    """
+    db = SessionLocal()
+    try:
+        case = consultar_caso_completo(db, case_id)
+        patient = db.query(models.Patient).filter(models.Patient.id == case.patient_id).first() if case else None
+    finally:
+        # Os objetos já carregados continuam legíveis; a sessão não atravessa o stream
+        db.close()
+    if not case or not patient:
+        raise HTTPException(status_code=404, detail="Caso não encontrado" if not case else "Paciente não encontrado")
+
+    return StreamingResponse(
+        gerar_eventos_analise(case, patient, use_cache=not force_refresh),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.delete("/cases/{case_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_case(case_id: int, owner_id: int, db: Session = Depends(get_db)):
-    case = db.query(models.Case).filter(models.Case.id == case_id, models.Case.owner_id == owner_id).first()
-    if not case:
+    # Só as colunas da chave do rollup e um DELETE pela PK: o caso não é montado como entidade
+    filtro = (models.Case.id == case_id, models.Case.owner_id == owner_id)
+    case = db.query(
+        models.Case.owner_id, models.Case.created_at, models.Case.care_type, models.Case.ai_analysis_json
+    ).filter(*filtro).first()
+    # rowcount 0: outra requisição apagou o caso entre o SELECT e o DELETE
+    if not case or not db.query(models.Case).filter(*filtro).delete(synchronize_session=False):
+        db.rollback()
         raise HTTPException(status_code=404, detail="Caso não encontrado")
-    db.delete(case)
+    dashboard_rollup.remover_caso(db, case)
+    # DELETE fora do ORM não passa pelo before_flush do http_cache
+    http_cache.incrementar_owner(db, owner_id)
     db.commit()
     return None
 
-@app.get("/dashboard/stats", response_model=schemas.DashboardStats)
-def get_dashboard_stats(owner_id: int, db: Session = Depends(get_db)):
-    cases = db.query(models.Case).filter(models.Case.owner_id == owner_id).all()
-
-    urgency_counter: Counter = Counter()
-    care_type_counter: Counter = Counter()
-    pathology_counter: Counter = Counter()
+# --- JOBS DE REANÁLISE EM MASSA ---
+
+def _job_response(job):
+    dados = schemas.ReanalysisJobResponse.model_validate(job)
+    dados.running = jobs_reanalise.is_running(job.id)
+    dados.throughput_per_min = reanalysis_jobs.throughput_por_minuto(job)
+    return dados
+
+@app.post("/jobs/reanalysis", response_model=schemas.ReanalysisJobResponse, status_code=status.HTTP_201_CREATED)
+def create_reanalysis_job(job_data: schemas.ReanalysisJobCreate, db: Session = Depends(get_db)):
+    job = reanalysis_jobs.criar_job(db, **job_data.model_dump())
+    jobs_reanalise.start(job.id)
+    return _job_response(job)
+
+@app.get("/jobs/reanalysis", response_model=list[schemas.ReanalysisJobResponse])
+def list_reanalysis_jobs(db: Session = Depends(get_db)):
+    jobs = db.query(models.ReanalysisJob).order_by(models.ReanalysisJob.id.desc()).limit(50).all()
+    return [_job_response(job) for job in jobs]
+
+@app.get("/jobs/reanalysis/{job_id}", response_model=schemas.ReanalysisJobResponse)
+def read_reanalysis_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.ReanalysisJob).filter(models.ReanalysisJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return _job_response(job)
+
+@app.post("/jobs/reanalysis/{job_id}/cancel", response_model=schemas.ReanalysisJobResponse)
+def cancel_reanalysis_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.ReanalysisJob).filter(models.ReanalysisJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if not jobs_reanalise.cancel(job_id) and job.state not in (reanalysis_jobs.JOB_CONCLUIDO, reanalysis_jobs.JOB_CANCELADO):
+        # Job parado (erro, ou rodando em outro processo): marca direto no banco
+        job.state = reanalysis_jobs.JOB_CANCELADO
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    return _job_response(job)
+
+@app.post("/jobs/reanalysis/{job_id}/resume", response_model=schemas.ReanalysisJobResponse)
+def resume_reanalysis_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.ReanalysisJob).filter(models.ReanalysisJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if job.state in (reanalysis_jobs.JOB_CONCLUIDO, reanalysis_jobs.JOB_CANCELADO):
+        raise HTTPException(status_code=409, detail=f"Job já está {job.state}")
+    jobs_reanalise.start(job.id)
+    return _job_response(job)
+
+@app.get("/cid10/autocomplete", response_model=list[schemas.Cid10Item])
+def cid10_autocomplete(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50)):
+    """Sugestões por prefixo do código (ex.: "J18") ou de palavras da descrição, sem diferenciar acentos."""
+    return cid10.catalogo().buscar(q, limit)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=metrics.renderizar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ai/cache/stats", response_model=schemas.AICacheStats)
+def get_ai_cache_stats():
+    return cache_analise.stats()
+
+@app.get("/ai/queue/stats", response_model=schemas.AIQueueStats)
+def get_ai_queue_stats():
+    return fila_analise.stats()
 
-    for case in cases:
-        ai = case.ai_analysis_json or {}
-        urgency_val = ai.get("urgency", "Indefinida")
-        if urgency_val not in ("Alta", "Média", "Baixa"):
-            urgency_val = "Indefinida"
-        urgency_counter[urgency_val] += 1
+@app.get("/dashboard/stats", response_model=schemas.DashboardStats)
+def get_dashboard_stats(owner_id: int, request: Request, db: Session = Depends(get_read_db)):
+    today = datetime.now().date()
+    # A janela de 7 dias muda à meia-noite mesmo sem alterações: a data entra na ETag
+    etag = http_cache.gerar_etag("dashboard", owner_id, http_cache.versao_owner(db, owner_id), today.isoformat())
+    return http_cache.responder(
+        request, owner_id, ("dashboard", today.isoformat()), etag,
+        lambda: (fast_json.serializar(schemas.DashboardStats, calcular_estatisticas(db, owner_id, today)), {}),
+    )
 
-        care_type_counter[case.care_type or "Clínica Geral"] += 1
+def calcular_estatisticas(db: Session, owner_id: int, today: date) -> dict:
+    inicio = today - timedelta(days=6)
 
-        pathology_val = ai.get("pathology_type")
-        if pathology_val:
-            pathology_counter[pathology_val] += 1
+    urgency_rows, care_type_rows, pathology_rows, date_rows = dashboard_rollup.ler_estatisticas(
+        db, owner_id, inicio.isoformat()
+    )
 
+    urgency_counter = {k: v for k, v in urgency_rows}
     urgency_order = ["Alta", "Média", "Baixa", "Indefinida"]
     urgency_result = [
         {"name": k, "value": urgency_counter[k]}
-        for k in urgency_order if urgency_counter[k] > 0
+        for k in urgency_order if urgency_counter.get(k, 0) > 0
     ]
 
     care_type_result = [
-        {"name": k, "value": v} for k, v in care_type_counter.most_common()
+        {"name": k, "value": v} for k, v in care_type_rows
     ]
 
     pathology_result = [
-        {"name": k, "value": v} for k, v in pathology_counter.most_common(5)
+        {"name": k, "value": v} for k, v in pathology_rows
     ]
 
-    today = datetime.now().date()
     cases_by_date_map: dict = {}
     for i in range(6, -1, -1):
         day = today - timedelta(days=i)
         cases_by_date_map[day.isoformat()] = 0
 
-    for case in cases:
-        if case.created_at:
-            day_str = case.created_at.date().isoformat() if hasattr(case.created_at, 'date') else str(case.created_at)[:10]
-            if day_str in cases_by_date_map:
-                cases_by_date_map[day_str] += 1
+    for day_str, total in date_rows:
+        if day_str in cases_by_date_map:
+            cases_by_date_map[day_str] += total
 
     cases_by_date_result = [
         {"date": date_str, "total": total}
@@ -502,4 +1430,19 @@ def get_dashboard_stats(owner_id: int, db: Session = Depends(get_db)):
     }
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Sobe a API.")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "0")),
+                        help="Processos de produção (sem reload). 0 = modo dev com reload")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
+    else:
+        # Migra uma vez aqui, antes de criar os workers, em vez de cada um disputar o mesmo banco no startup
+        if AUTO_MIGRATE:
+            migrator.migrar(engine)
+        os.environ["AUTO_MIGRATE"] = "false"
+        os.environ["STARTUP_RECOVERY_TOKEN"] = uuid.uuid4().hex
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, reload=False)
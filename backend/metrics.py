@@ -0,0 +1,319 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Instrumentação do caminho quente, exposta em GET /metrics no formato texto do Prometheus.
+# Implementação própria e mínima (contadores, histogramas e coletores chamados na hora do scrape)
+# para não adicionar dependência; os nomes seguem as convenções do Prometheus.
+#
+# METRICS_ENABLED=false desliga a coleta. SLOW_REQUEST_MS > 0 loga as requisições mais lentas
+# que o limite, com a lista de queries SQL executadas.
+
+METRICAS_HABILITADAS = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+BUCKETS_IA = (0.001, 0.01, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+BUCKETS_QUERIES = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+LE_INF = 'le="+Inf"'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(nomes, valores, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _formatar_valor(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Counter:
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, labels=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **labels):
+        chave = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_formatar_labels(self.labels, chave)} {_formatar_valor(v)}" for chave, v in itens]
+
+
+class Histogram:
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, labels=(), buckets=BUCKETS_HTTP):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [contagem por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, valor: float, **labels):
+        chave = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def amostras(self):
+        with self._lock:
+            itens = [(chave, list(serie)) for chave, serie in self._series.items()]
+        linhas = []
+        for chave, serie in itens:
+            for limite, contagem in zip(self.buckets, serie):
+                le = f'le="{_formatar_valor(float(limite))}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_labels(self.labels, chave, le)} {contagem}")
+            linhas.append(f"{self.nome}_bucket{_formatar_labels(self.labels, chave, LE_INF)} {serie[-1]}")
+            linhas.append(f"{self.nome}_sum{_formatar_labels(self.labels, chave)} {_formatar_valor(serie[-2])}")
+            linhas.append(f"{self.nome}_count{_formatar_labels(self.labels, chave)} {serie[-1]}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+        self._coletores = []
+
+    def counter(self, nome, ajuda, labels=()) -> Counter:
+        metrica = Counter(nome, ajuda, labels)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histogram(self, nome, ajuda, labels=(), buckets=BUCKETS_HTTP) -> Histogram:
+        metrica = Histogram(nome, ajuda, labels, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def registrar_coletor(self, funcao):
+        """funcao() -> lista de (nome, tipo, ajuda, valor) onde valor é um número ou [(labels_dict, número)].
+
+        Chamada a cada scrape, para estado que já existe em outro lugar (tamanho do cache, fila, pool).
+        """
+        self._coletores.append(funcao)
+
+    def renderizar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.amostras())
+        for coletor in self._coletores:
+            try:
+                familias = coletor()
+            except Exception as e:
+                print(f"Erro no coletor de métricas {getattr(coletor, '__name__', coletor)}: {e}")
+                continue
+            for nome, tipo, ajuda, valor in familias:
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                amostras = valor if isinstance(valor, list) else [({}, valor)]
+                for labels, v in amostras:
+                    linhas.append(f"{nome}{_formatar_labels(labels.keys(), labels.values())} {_formatar_valor(v)}")
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+HTTP_DURACAO = registro.histogram(
+    "http_request_duration_seconds", "Latência das requisições por rota", ("method", "route", "status"))
+HTTP_QUERIES = registro.histogram(
+    "http_request_sql_queries", "Queries SQL executadas por requisição", ("method", "route"), BUCKETS_QUERIES)
+HTTP_TEMPO_SQL = registro.histogram(
+    "http_request_sql_duration_seconds", "Tempo total em SQL por requisição", ("method", "route"), BUCKETS_HTTP)
+HTTP_LENTAS = registro.counter(
+    "http_slow_requests_total", "Requisições acima de SLOW_REQUEST_MS", ("method", "route"))
+SQL_DURACAO = registro.histogram(
+    "db_query_duration_seconds", "Duração de cada query SQL", ("operation", "engine"), BUCKETS_SQL)
+IA_FASES = registro.histogram(
+    "ai_analysis_phase_seconds", "Tempo de cada fase da análise de IA (prompt, chamada ao LLM, parse)",
+    ("phase",), BUCKETS_IA)
+IA_ANALISES = registro.counter(
+    "ai_analyses_total", "Análises de IA por resultado (success, error, cache_hit, similar_reuse)", ("outcome", "backend"))
+IA_PROMPT_TOKENS = registro.histogram(
+    "ai_prompt_tokens_estimated", "Tamanho estimado do prompt após a compactação",
+    (), (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000))
+IA_PROMPT_SECOES = registro.counter(
+    "ai_prompt_sections_total", "Seções do prompt truncadas, omitidas ou deduplicadas pelo orçamento", ("section", "action"))
+IA_TOKENS = registro.counter(
+    "ai_tokens_total", "Tokens consumidos no LLM, segundo os metadados da resposta", ("model", "kind"))
+IA_ESPERA_FILA = registro.histogram(
+    "ai_queue_wait_seconds", "Tempo dos casos na fila de análise até um worker pegar, por faixa de prioridade",
+    ("lane",), BUCKETS_IA)
+IA_TENTATIVAS = registro.counter(
+    "ai_llm_attempts_total", "Chamadas ao LLM por modelo e resultado (ok, error, timeout, circuit_open, abandoned)",
+    ("model", "outcome"))
+
+
+# --- Contexto por requisição (queries SQL) ---
+
+class ContextoRequisicao:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries = []  # (sql, segundos)
+
+
+# O objeto é mutável: os endpoints síncronos rodam no threadpool com uma cópia do contexto,
+# mas apontando para a mesma instância, então as queries feitas lá entram na conta da requisição.
+_contexto_atual = contextvars.ContextVar("metricas_requisicao", default=None)
+
+
+def _operacao(sql: str) -> str:
+    palavra = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "OTHER"
+    return palavra if palavra in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+_engines = {}  # nome -> engine, para os gauges do pool
+
+
+def _coletar_pools():
+    checked_out, tamanho = [], []
+    for nome, engine in list(_engines.items()):
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            checked_out.append(({"engine": nome}, pool.checkedout()))
+            tamanho.append(({"engine": nome}, pool.size()))
+    if not checked_out:
+        return []
+    return [
+        ("db_pool_checked_out", "gauge", "Conexões do pool em uso", checked_out),
+        ("db_pool_size", "gauge", "Tamanho configurado do pool", tamanho),
+    ]
+
+
+def instrumentar_engine(engine, nome: str = "primary"):
+    """Mede cada query do engine e a associa à requisição em andamento (se houver)."""
+    if not METRICAS_HABILITADAS or nome in _engines:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get("metricas_inicio")
+        if not inicios:
+            return
+        duracao = time.perf_counter() - inicios.pop()
+        SQL_DURACAO.observe(duracao, operation=_operacao(statement), engine=nome)
+        ctx = _contexto_atual.get()
+        if ctx is not None:
+            ctx.queries.append((statement, duracao))
+
+    if not _engines:
+        registro.registrar_coletor(_coletar_pools)
+    _engines[nome] = engine
+
+
+def _nome_rota(request) -> str:
+    # Usa o template da rota (/cases/{case_id}) e não o caminho real, para não explodir a cardinalidade
+    rota = request.scope.get("route")
+    return getattr(rota, "path", None) or "nao_encontrada"
+
+
+async def middleware_metricas(request, call_next):
+    if not METRICAS_HABILITADAS:
+        return await call_next(request)
+
+    ctx = ContextoRequisicao()
+    token = _contexto_atual.set(ctx)
+    inicio = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duracao = time.perf_counter() - inicio
+        _contexto_atual.reset(token)
+        metodo, rota = request.method, _nome_rota(request)
+        tempo_sql = sum(d for _, d in ctx.queries)
+        HTTP_DURACAO.observe(duracao, method=metodo, route=rota, status=status_code)
+        HTTP_QUERIES.observe(len(ctx.queries), method=metodo, route=rota)
+        HTTP_TEMPO_SQL.observe(tempo_sql, method=metodo, route=rota)
+        if SLOW_REQUEST_MS > 0 and duracao * 1000 >= SLOW_REQUEST_MS:
+            HTTP_LENTAS.inc(method=metodo, route=rota)
+            _logar_requisicao_lenta(request, status_code, duracao, ctx.queries, tempo_sql)
+
+
+def _logar_requisicao_lenta(request, status_code, duracao, queries, tempo_sql):
+    print(f"[lenta] {request.method} {request.url.path} -> {status_code} em {duracao * 1000:.1f} ms "
+          f"({len(queries)} queries, {tempo_sql * 1000:.1f} ms em SQL)")
+    for sql, d in queries:
+        texto = " ".join(sql.split())
+        print(f"    {d * 1000:8.2f} ms  {texto[:300]}")
+
+
+# --- Análise de IA ---
+
+@contextmanager
+def medir_fase(fase: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        IA_FASES.observe(time.perf_counter() - inicio, phase=fase)
+
+
+def observar_fase(fase: str, segundos: float):
+    IA_FASES.observe(segundos, phase=fase)
+
+
+def registrar_analise(outcome: str, backend: str):
+    IA_ANALISES.inc(outcome=outcome, backend=backend)
+
+
+def registrar_prompt(prompt):
+    IA_PROMPT_TOKENS.observe(prompt.tokens_estimados)
+    for acao, secoes in (("truncated", prompt.truncadas), ("dropped", prompt.omitidas), ("deduplicated", prompt.deduplicadas)):
+        for secao in secoes:
+            IA_PROMPT_SECOES.inc(section=secao, action=acao)
+
+
+def registrar_tokens(model: str, resposta):
+    for kind in ("prompt", "output"):
+        valor = getattr(resposta, f"{kind}_tokens", None)
+        if valor:
+            IA_TOKENS.inc(valor, model=model, kind=kind)
+
+
+def observar_espera_fila(faixa: str, segundos: float):
+    IA_ESPERA_FILA.observe(segundos, lane=faixa)
+
+
+def registrar_tentativa_llm(model: str, outcome: str):
+    IA_TENTATIVAS.inc(model=model, outcome=outcome)
+
+
+def renderizar() -> str:
+    return registro.renderizar()
@@ -0,0 +1,94 @@
+import json
+
+from sqlalchemy import JSON, DateTime, Integer, String, Text, text
+
+import case_search
+import models
+import patient_matching
+from ai_columns import extrair_campos_ia
+from migrator import AdicionarColuna, Backfill, CriarIndice, CriarTabelas, Funcao, Migracao
+
+# Histórico do esquema, em ordem. Nunca altere uma migração já publicada: crie a próxima versão.
+# Bancos novos recebem as tabelas completas na 0001 e os passos seguintes viram no-op (todos idempotentes);
+# bancos antigos (criados pelo create_all + migrate_db.py anteriores) são completados passo a passo.
+
+
+def _json(valor):
+    # No SQLite colunas JSON lidas por SQL textual vêm como string
+    return json.loads(valor) if isinstance(valor, str) else valor
+
+
+def _preencher_colunas_ia(conn, linhas):
+    conn.execute(
+        text("UPDATE cases SET urgency = :urgency, referral = :referral, pathology_type = :pathology_type, "
+             "cid10_code = :cid10_code WHERE id = :id"),
+        [{"id": case_id, **extrair_campos_ia(_json(ai))} for case_id, ai in linhas],
+    )
+
+
+def _preencher_chaves_pacientes(conn, linhas):
+    conn.execute(
+        text("UPDATE patients SET cpf_digits = :cpf_digits, match_key = :match_key WHERE id = :id"),
+        [
+            {
+                "id": patient_id,
+                "cpf_digits": patient_matching.cpf_digitos(cpf),
+                "match_key": patient_matching.chave_paciente(full_name, birth_date),
+            }
+            for patient_id, full_name, birth_date, cpf in linhas
+        ],
+    )
+
+
+MIGRACOES = [
+    Migracao(1, "esquema_inicial", [
+        CriarTabelas(models.Base.metadata),
+    ]),
+    Migracao(2, "colunas_ia_promovidas", [
+        AdicionarColuna("cases", "doctor_conclusion", Text()),
+        AdicionarColuna("cases", "urgency", String()),
+        AdicionarColuna("cases", "referral", String()),
+        AdicionarColuna("cases", "pathology_type", String()),
+        AdicionarColuna("cases", "cid10_code", String()),
+        CriarIndice("ix_cases_owner_created_at", "cases", ("owner_id", "created_at")),
+        CriarIndice("ix_cases_owner_urgency", "cases", ("owner_id", "urgency")),
+        CriarIndice("ix_cases_referral", "cases", ("referral",)),
+        CriarIndice("ix_cases_pathology_type", "cases", ("pathology_type",)),
+        CriarIndice("ix_cases_cid10_code", "cases", ("cid10_code",)),
+    ]),
+    Migracao(3, "backfill_colunas_ia", [
+        Backfill(
+            "colunas_ia", "cases", "urgency IS NULL AND ai_analysis_json IS NOT NULL",
+            ("id", "ai_analysis_json"), _preencher_colunas_ia,
+        ),
+    ]),
+    Migracao(4, "chaves_deduplicacao_pacientes", [
+        AdicionarColuna("patients", "cpf_digits", String()),
+        AdicionarColuna("patients", "match_key", String()),
+        CriarIndice("ix_patients_cpf_digits", "patients", ("cpf_digits",)),
+        CriarIndice("ix_patients_match_key", "patients", ("match_key",)),
+        Backfill(
+            "chaves_pacientes", "patients", "match_key IS NULL",
+            ("id", "full_name", "birth_date", "cpf"), _preencher_chaves_pacientes,
+        ),
+    ]),
+    Migracao(5, "metadados_analise", [
+        AdicionarColuna("cases", "analysis_meta_json", JSON()),
+    ]),
+    Migracao(6, "busca_textual", [
+        # SQLite: tabela FTS5 + triggers (populada uma vez); Postgres: coluna tsvector gerada + índice GIN
+        Funcao("criar índice de busca textual dos casos", case_search.preparar_indice, tabela_estimativa="cases"),
+    ]),
+    Migracao(7, "versao_dos_casos", [
+        AdicionarColuna("cases", "version", Integer(), nullable=False, default="1"),
+        AdicionarColuna("cases", "updated_at", DateTime()),
+        CriarTabelas(models.Base.metadata, [models.OwnerDataVersion.__table__]),
+    ]),
+    Migracao(8, "chaves_idempotencia", [
+        CriarTabelas(models.Base.metadata, [models.IdempotencyKey.__table__]),
+    ]),
+    Migracao(9, "busca_textual_sem_acentos", [
+        # Postgres: recria cases.search_vector na configuração portuguese_unaccent; no SQLite não muda nada
+        Funcao("refazer índice de busca textual sem acentos", case_search.preparar_indice, tabela_estimativa="cases"),
+    ]),
+]
@@ -0,0 +1,416 @@
+import argparse
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, Float, Integer, MetaData, String, Table, inspect, select, text)
+
+# Migrações versionadas do esquema (SQLite e Postgres).
+#
+# As migrações ficam em migrations.py, em ordem; cada uma é uma lista de passos idempotentes
+# (criar tabela, adicionar coluna, criar índice, SQL por dialeto, backfill em lotes). O estado fica em
+# schema_migrations (uma linha por versão aplicada) e o progresso dos backfills em schema_backfills.
+#
+# Backfills rodam em lotes por id, cada lote na sua transação junto com o registro do progresso:
+# se o processo cair, a próxima execução continua do último id gravado. Entre lotes há uma pausa
+# (MIGRATION_PAUSE_SECONDS) para não disputar o banco com a API. No Postgres os índices são criados
+# com CREATE INDEX CONCURRENTLY (sem bloquear escritas) e um advisory lock impede duas execuções juntas.
+#
+# Uso, a partir de backend/:
+#   python migrator.py              # aplica as migrações pendentes
+#   python migrator.py --status     # lista aplicadas e pendentes
+#   python migrator.py --dry-run    # só estima linhas e duração de cada passo pendente
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+MIGRATION_PAUSE_SECONDS = float(os.getenv("MIGRATION_PAUSE_SECONDS", "0.05"))
+# Estimativa grosseira para DDL que reescreve/varre a tabela (índices, colunas geradas) no dry-run
+LINHAS_POR_SEGUNDO_DDL = 200_000
+# Usada quando o lote de amostra não pode rodar (a coluna do filtro só existe depois de um passo anterior)
+LINHAS_POR_SEGUNDO_BACKFILL = 2_000
+CHAVE_ADVISORY_LOCK = 7_412_019
+
+ESTADO_APLICADA = "aplicada"
+ESTADO_EM_ANDAMENTO = "em_andamento"
+
+metadata_estado = MetaData()
+
+tabela_migracoes = Table(
+    "schema_migrations", metadata_estado,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(200), nullable=False),
+    Column("state", String(20), nullable=False),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime, nullable=True),
+    Column("duration_ms", Float, nullable=True),
+)
+
+tabela_backfills = Table(
+    "schema_backfills", metadata_estado,
+    Column("migration", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(100), primary_key=True),
+    Column("last_id", Integer, default=0),
+    Column("rows_done", Integer, default=0),
+    Column("updated_at", DateTime),
+    Column("finished_at", DateTime, nullable=True),
+)
+
+
+class Estimativa:
+    def __init__(self, descricao: str, linhas: int = 0, segundos: float = 0.0):
+        self.descricao = descricao
+        self.linhas = linhas
+        self.segundos = segundos
+
+
+def _contar(conn, tabela: str, filtro: str = None) -> int:
+    if not inspect(conn).has_table(tabela):
+        return 0
+    where = f" WHERE {filtro}" if filtro else ""
+    return conn.execute(text(f"SELECT COUNT(*) FROM {tabela}{where}")).scalar() or 0
+
+
+# --- Passos ---
+
+class CriarTabelas:
+    """Cria as tabelas (de models ou uma lista de Table) que ainda não existem."""
+
+    def __init__(self, metadata, tabelas=None):
+        self.metadata = metadata
+        self.tabelas = tabelas
+
+    def descrever(self) -> str:
+        nomes = ", ".join(t.name for t in self.tabelas) if self.tabelas else "todas as tabelas do modelo"
+        return f"criar tabelas ausentes ({nomes})"
+
+    def aplicar(self, engine, versao: int):
+        with engine.begin() as conn:
+            self.metadata.create_all(conn, tables=self.tabelas, checkfirst=True)
+
+    def estimar(self, conn) -> Estimativa:
+        return Estimativa(self.descrever())
+
+
+class AdicionarColuna:
+    def __init__(self, tabela: str, coluna: str, tipo, nullable: bool = True, default: str = None):
+        self.tabela = tabela
+        self.coluna = coluna
+        self.tipo = tipo
+        self.nullable = nullable
+        self.default = default
+
+    def descrever(self) -> str:
+        return f"adicionar coluna {self.tabela}.{self.coluna}"
+
+    def _existe(self, conn) -> bool:
+        return any(c["name"] == self.coluna for c in inspect(conn).get_columns(self.tabela))
+
+    def aplicar(self, engine, versao: int):
+        with engine.begin() as conn:
+            if self._existe(conn):
+                return
+            sql = f"ALTER TABLE {self.tabela} ADD COLUMN {self.coluna} {self.tipo.compile(dialect=conn.dialect)}"
+            if self.default is not None:
+                sql += f" DEFAULT {self.default}"
+            if not self.nullable:
+                sql += " NOT NULL"
+            conn.execute(text(sql))
+
+    def estimar(self, conn) -> Estimativa:
+        # Com default constante, SQLite e Postgres 11+ não reescrevem a tabela: é só metadado
+        if inspect(conn).has_table(self.tabela) and self._existe(conn):
+            return Estimativa(self.descrever() + " (já existe)")
+        return Estimativa(self.descrever())
+
+
+class CriarIndice:
+    def __init__(self, nome: str, tabela: str, colunas: tuple):
+        self.nome = nome
+        self.tabela = tabela
+        self.colunas = colunas
+
+    def descrever(self) -> str:
+        return f"criar índice {self.nome} em {self.tabela} ({', '.join(self.colunas)})"
+
+    def aplicar(self, engine, versao: int):
+        colunas = ", ".join(self.colunas)
+        if engine.dialect.name == "postgresql":
+            # CONCURRENTLY não roda dentro de transação
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.nome} ON {self.tabela} ({colunas})"))
+            return
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {self.nome} ON {self.tabela} ({colunas})"))
+
+    def estimar(self, conn) -> Estimativa:
+        linhas = _contar(conn, self.tabela)
+        return Estimativa(self.descrever(), linhas, linhas / LINHAS_POR_SEGUNDO_DDL)
+
+
+class Funcao:
+    """Passo escrito em Python: `funcao(engine)` (deve ser idempotente)."""
+
+    def __init__(self, descricao: str, funcao, tabela_estimativa: str = None):
+        self.descricao = descricao
+        self.funcao = funcao
+        self.tabela_estimativa = tabela_estimativa
+
+    def descrever(self) -> str:
+        return self.descricao
+
+    def aplicar(self, engine, versao: int):
+        self.funcao(engine)
+
+    def estimar(self, conn) -> Estimativa:
+        if not self.tabela_estimativa:
+            return Estimativa(self.descricao)
+        linhas = _contar(conn, self.tabela_estimativa)
+        return Estimativa(self.descricao, linhas, linhas / LINHAS_POR_SEGUNDO_DDL)
+
+
+class Backfill:
+    """Atualiza linhas antigas em lotes retomáveis.
+
+    Seleciona `colunas` (a primeira deve ser o id) das linhas de `tabela` que atendem `filtro`, em ordem de id,
+    e chama `processar(conn, linhas)` para cada lote dentro de uma transação. O filtro deve deixar de valer
+    para as linhas já processadas (ex.: "match_key IS NULL"), o que também torna o passo idempotente.
+    """
+
+    def __init__(self, nome: str, tabela: str, filtro: str, colunas: tuple, processar):
+        self.nome = nome
+        self.tabela = tabela
+        self.filtro = filtro
+        self.colunas = colunas
+        self.processar = processar
+
+    def descrever(self) -> str:
+        return f"backfill {self.nome} ({self.tabela} WHERE {self.filtro})"
+
+    def _lote(self, conn, ultimo_id: int, tamanho: int):
+        sql = (
+            f"SELECT {', '.join(self.colunas)} FROM {self.tabela} "
+            f"WHERE {self.colunas[0]} > :ultimo AND ({self.filtro}) ORDER BY {self.colunas[0]} LIMIT :lote"
+        )
+        return conn.execute(text(sql), {"ultimo": ultimo_id, "lote": tamanho}).all()
+
+    def aplicar(self, engine, versao: int, tamanho: int = None, pausa: float = None):
+        tamanho = tamanho or MIGRATION_BATCH_SIZE
+        pausa = MIGRATION_PAUSE_SECONDS if pausa is None else pausa
+        chave = {"migration": versao, "name": self.nome}
+
+        with engine.begin() as conn:
+            progresso = conn.execute(select(tabela_backfills).filter_by(**chave)).first()
+            if progresso is None:
+                conn.execute(tabela_backfills.insert().values(**chave, last_id=0, rows_done=0, updated_at=datetime.now()))
+            elif progresso.finished_at is not None:
+                return
+        ultimo_id = progresso.last_id if progresso else 0
+        total = progresso.rows_done if progresso else 0
+
+        while True:
+            with engine.begin() as conn:
+                linhas = self._lote(conn, ultimo_id, tamanho)
+                if linhas:
+                    self.processar(conn, linhas)
+                    ultimo_id = linhas[-1][0]
+                    total += len(linhas)
+                conn.execute(tabela_backfills.update().filter_by(**chave).values(
+                    last_id=ultimo_id, rows_done=total, updated_at=datetime.now(),
+                    finished_at=None if linhas else datetime.now(),
+                ))
+            if not linhas:
+                return
+            print(f"    {self.nome}: {total} linha(s) (último id {ultimo_id})")
+            if pausa:
+                time.sleep(pausa)
+
+    def estimar(self, conn, tamanho: int = None, pausa: float = None) -> Estimativa:
+        tamanho = tamanho or MIGRATION_BATCH_SIZE
+        pausa = MIGRATION_PAUSE_SECONDS if pausa is None else pausa
+        linhas = _contar(conn, self.tabela, self.filtro)
+        if not linhas:
+            return Estimativa(self.descrever(), 0, 0.0)
+        lotes = math.ceil(linhas / tamanho)
+        # Mede um lote de verdade numa conexão separada, dentro de uma transação que é desfeita em seguida
+        with conn.engine.connect() as conn_amostra:
+            transacao = conn_amostra.begin()
+            inicio = time.perf_counter()
+            try:
+                amostra = self._lote(conn_amostra, 0, tamanho)
+                self.processar(conn_amostra, amostra)
+            finally:
+                transacao.rollback()
+        por_linha = (time.perf_counter() - inicio) / max(len(amostra), 1)
+        return Estimativa(self.descrever(), linhas, lotes * pausa + linhas * por_linha)
+
+    def estimar_sem_amostra(self, conn) -> Estimativa:
+        linhas = _contar(conn, self.tabela)
+        segundos = math.ceil(linhas / MIGRATION_BATCH_SIZE) * MIGRATION_PAUSE_SECONDS + linhas / LINHAS_POR_SEGUNDO_BACKFILL
+        return Estimativa(self.descrever() + " (após passos anteriores; estimado pelo total da tabela)", linhas, segundos)
+
+
+class Migracao:
+    def __init__(self, versao: int, nome: str, passos: list):
+        self.versao = versao
+        self.nome = nome
+        self.passos = passos
+
+
+# --- Execução ---
+
+def _lock(engine):
+    """Advisory lock no Postgres (várias réplicas da API subindo juntas); no SQLite não é necessário."""
+    if engine.dialect.name != "postgresql":
+        return None
+    conn = engine.connect()
+    conn.execute(text("SELECT pg_advisory_lock(:chave)"), {"chave": CHAVE_ADVISORY_LOCK})
+    conn.commit()
+    return conn
+
+
+def _liberar(conn):
+    if conn is not None:
+        conn.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": CHAVE_ADVISORY_LOCK})
+        conn.commit()
+        conn.close()
+
+
+def preparar_estado(engine):
+    with engine.begin() as conn:
+        metadata_estado.create_all(conn, checkfirst=True)
+
+
+def versoes_aplicadas(engine) -> set:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return set()
+        return set(conn.execute(
+            select(tabela_migracoes.c.version).where(tabela_migracoes.c.state == ESTADO_APLICADA)
+        ).scalars())
+
+
+def pendentes(engine, migracoes: list = None) -> list:
+    migracoes = _carregar() if migracoes is None else migracoes
+    aplicadas = versoes_aplicadas(engine)
+    return [m for m in migracoes if m.versao not in aplicadas]
+
+
+def migrar(engine, migracoes: list = None, ate: int = None) -> list:
+    """Aplica as migrações pendentes em ordem (até a versão `ate`, se informada). Retorna as versões aplicadas."""
+    migracoes = _carregar() if migracoes is None else migracoes
+    lock = _lock(engine)
+    try:
+        preparar_estado(engine)
+        aplicadas = []
+        for migracao in pendentes(engine, migracoes):
+            if ate is not None and migracao.versao > ate:
+                break
+            print(f"Migração {migracao.versao:04d} {migracao.nome}...")
+            inicio = time.perf_counter()
+            with engine.begin() as conn:
+                existente = conn.execute(select(tabela_migracoes).filter_by(version=migracao.versao)).first()
+                if existente is None:
+                    conn.execute(tabela_migracoes.insert().values(
+                        version=migracao.versao, name=migracao.nome, state=ESTADO_EM_ANDAMENTO, started_at=datetime.now(),
+                    ))
+            for passo in migracao.passos:
+                print(f"  - {passo.descrever()}")
+                passo.aplicar(engine, migracao.versao)
+            with engine.begin() as conn:
+                conn.execute(tabela_migracoes.update().filter_by(version=migracao.versao).values(
+                    state=ESTADO_APLICADA, finished_at=datetime.now(),
+                    duration_ms=round((time.perf_counter() - inicio) * 1000, 1),
+                ))
+            aplicadas.append(migracao.versao)
+        return aplicadas
+    finally:
+        _liberar(lock)
+
+
+def estimar(engine, migracoes: list = None) -> list:
+    """Dry-run: [(migracao, [Estimativa])] das pendentes, sem alterar o banco."""
+    migracoes = _carregar() if migracoes is None else migracoes
+    resultado = []
+    for migracao in pendentes(engine, migracoes):
+        estimativas = []
+        for passo in migracao.passos:
+            # Conexão por passo: no Postgres um erro invalida a transação inteira
+            with engine.connect() as conn:
+                try:
+                    estimativas.append(passo.estimar(conn))
+                except Exception:
+                    conn.rollback()
+                    if not hasattr(passo, "estimar_sem_amostra"):
+                        raise
+                    estimativas.append(passo.estimar_sem_amostra(conn))
+        resultado.append((migracao, estimativas))
+    return resultado
+
+
+def _carregar() -> list:
+    from migrations import MIGRACOES
+    return MIGRACOES
+
+
+def imprimir_status(engine):
+    with engine.connect() as conn:
+        linhas = []
+        if inspect(conn).has_table("schema_migrations"):
+            linhas = conn.execute(select(tabela_migracoes).order_by(tabela_migracoes.c.version)).all()
+    registradas = {l.version: l for l in linhas}
+    for migracao in _carregar():
+        linha = registradas.get(migracao.versao)
+        estado = f"{linha.state} em {linha.finished_at or linha.started_at:%Y-%m-%d %H:%M}" if linha else "pendente"
+        print(f"{migracao.versao:04d} {migracao.nome:<40} {estado}")
+
+
+def imprimir_estimativa(estimativas: list):
+    if not estimativas:
+        print("Nenhuma migração pendente.")
+        return
+    total = 0.0
+    for migracao, passos in estimativas:
+        print(f"Migração {migracao.versao:04d} {migracao.nome}")
+        for e in passos:
+            detalhe = f" — {e.linhas} linha(s), ~{e.segundos:.1f}s" if e.linhas else ""
+            print(f"  - {e.descricao}{detalhe}")
+            total += e.segundos
+    print(f"Duração estimada: ~{total:.1f}s (lotes de {MIGRATION_BATCH_SIZE}, pausa de {MIGRATION_PAUSE_SECONDS}s)")
+
+
+def main():
+    global MIGRATION_BATCH_SIZE, MIGRATION_PAUSE_SECONDS
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Aplica as migrações versionadas do banco.")
+    parser.add_argument("--dry-run", action="store_true", help="Só estima linhas e duração, sem alterar nada")
+    parser.add_argument("--status", action="store_true", help="Lista migrações aplicadas e pendentes")
+    parser.add_argument("--target", type=int, help="Aplica só até esta versão")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MIGRATION_PAUSE_SECONDS, help="Pausa em segundos entre lotes")
+    parser.add_argument("--json", action="store_true", help="Saída do --dry-run em JSON")
+    args = parser.parse_args()
+    MIGRATION_BATCH_SIZE, MIGRATION_PAUSE_SECONDS = args.batch_size, args.pause
+
+    if args.status:
+        imprimir_status(engine)
+    elif args.dry_run:
+        estimativas = estimar(engine)
+        if args.json:
+            print(json.dumps([
+                {"version": m.versao, "name": m.nome,
+                 "steps": [{"step": e.descricao, "rows": e.linhas, "seconds": round(e.segundos, 2)} for e in passos]}
+                for m, passos in estimativas
+            ], ensure_ascii=False, indent=2))
+        else:
+            imprimir_estimativa(estimativas)
+    else:
+        aplicadas = migrar(engine, ate=args.target)
+        print(f"{len(aplicadas)} migração(ões) aplicada(s)." if aplicadas else "Banco já está na versão mais recente.")
+
+
+if __name__ == "__main__":
+    # Roda pelo módulo importado: migrations.py usa as classes e as configurações de `migrator`, não de __main__
+    import migrator
+    migrator.main()
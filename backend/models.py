@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey, JSON, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey, JSON, DateTime, Float, UniqueConstraint, Index
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from database import Base
 import datetime
@@ -29,28 +29,130 @@ class Patient(Base):
     medical_history = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
 
+    # Chaves normalizadas de deduplicação (ver patient_matching.py)
+    cpf_digits = Column(String, nullable=True, index=True)
+    match_key = Column(String, nullable=True, index=True)
+
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="patients")
     cases = relationship("Case", back_populates="patient", cascade="all, delete-orphan")
 
+# Colunas pesadas do caso (relato clínico e metadados da análise) ficam fora do SELECT padrão:
+# as listagens não precisam delas. Quem precisa do caso inteiro usa undefer_group(GRUPO_RELATO),
+# e acessar qualquer uma delas num caso já carregado busca o grupo todo numa consulta só.
+GRUPO_RELATO = "relato"
+
 class Case(Base):
     __tablename__ = "cases"
+    __table_args__ = (
+        Index("ix_cases_owner_created_at", "owner_id", "created_at"),
+        Index("ix_cases_owner_urgency", "owner_id", "urgency"),
+    )
     id = Column(Integer, primary_key=True, index=True)
 
     patient_id = Column(Integer, ForeignKey("patients.id"))
     patient = relationship("Patient", back_populates="cases")
 
     care_type = Column(String, default="Clínica Geral")
-    anamnesis = Column(Text, nullable=True)
-    hpma = Column(Text, nullable=True)
-    extended_anamnesis_json = Column(JSON, nullable=True)
-    symptoms = Column(Text)
-    exams_input = Column(Text, nullable=True)
+    anamnesis = deferred(Column(Text, nullable=True), group=GRUPO_RELATO)
+    hpma = deferred(Column(Text, nullable=True), group=GRUPO_RELATO)
+    extended_anamnesis_json = deferred(Column(JSON, nullable=True), group=GRUPO_RELATO)
+    symptoms = deferred(Column(Text), group=GRUPO_RELATO)
+    exams_input = deferred(Column(Text, nullable=True), group=GRUPO_RELATO)
     ai_analysis_json = Column(JSON, nullable=True)
-    doctor_conclusion = Column(Text, nullable=True)
+    doctor_conclusion = deferred(Column(Text, nullable=True), group=GRUPO_RELATO)
     status = Column(String, default="Pendente")
 
+    # Cópias indexadas de campos do ai_analysis_json (ver ai_columns.py)
+    urgency = Column(String, nullable=True)
+    referral = Column(String, nullable=True, index=True)
+    pathology_type = Column(String, nullable=True, index=True)
+    cid10_code = Column(String, nullable=True, index=True)
+
+    # Metadados da última análise: tokens do prompt (estimados e reais), seções cortadas, latência
+    analysis_meta_json = deferred(Column(JSON, nullable=True), group=GRUPO_RELATO)
+
     created_at = Column(DateTime, default=func.now())
 
+    # Incrementada a cada alteração (ver http_cache.py): base da ETag do detalhe do caso
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="cases")
+
+class AIAnalysisCache(Base):
+    __tablename__ = "ai_analysis_cache"
+    key = Column(String(64), primary_key=True)
+    model = Column(String)
+    result_json = Column(JSON)
+    latency_ms = Column(Float, nullable=True)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, index=True)
+    last_hit_at = Column(DateTime, nullable=True)
+
+class DashboardRollup(Base):
+    __tablename__ = "dashboard_rollup"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "day", "urgency", "care_type", "pathology_type", name="uq_dashboard_rollup_chave"),
+    )
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    day = Column(String(10))
+    urgency = Column(String)
+    care_type = Column(String)
+    pathology_type = Column(String, default="")
+    count = Column(Integer, default=0)
+
+class OwnerDataVersion(Base):
+    """Versão dos dados de cada médico: muda a cada caso/paciente criado, alterado ou apagado (ETag das listagens)."""
+    __tablename__ = "owner_data_versions"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Resposta guardada de um POST /cases/ com Idempotency-Key, para repetir o resultado em retentativas."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "key", name="uq_idempotency_keys_owner_key"),
+    )
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    state = Column(String, default="em_andamento")
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    case_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+class ReanalysisJob(Base):
+    __tablename__ = "reanalysis_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Filtro dos casos
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status_filter = Column(String, nullable=True)
+    created_from = Column(DateTime, nullable=True)
+    created_to = Column(DateTime, nullable=True)
+
+    model = Column(String, nullable=True)
+    rate_per_minute = Column(Float, default=60.0)
+    concurrency = Column(Integer, default=4)
+    force_refresh = Column(Boolean, default=True)
+
+    state = Column(String, default="pendente", index=True)
+    total = Column(Integer, default=0)
+    max_case_id = Column(Integer, default=0)
+    last_case_id = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    elapsed_seconds = Column(Float, default=0.0)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+from datetime import date, datetime, time, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# Paginação por cursor (keyset) para as listagens.
+# O cursor guarda a posição do último item da página (valor da coluna de ordenação + id),
+# então a próxima página é um WHERE indexado em vez de OFFSET: o custo depende do tamanho da página,
+# não do tamanho do histórico.
+
+PAGE_SIZE_PADRAO = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+# Ordenações aceitas: "-" = decrescente
+ORDENACOES = ("-id", "id", "-created_at", "created_at")
+ORDENACAO_PATTERN = "^-?(id|created_at)$"
+
+HEADER_CURSOR = "X-Next-Cursor"
+
+
+def codificar_cursor(sort: str, valor, ultimo_id: int) -> str:
+    if isinstance(valor, datetime):
+        valor = valor.isoformat()
+    payload = json.dumps({"s": sort, "v": valor, "id": ultimo_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(token: str, sort: str) -> dict:
+    try:
+        preenchimento = "=" * (-len(token) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(token + preenchimento).decode("utf-8"))
+        if dados["s"] != sort:
+            raise ValueError("cursor gerado para outra ordenação")
+        if sort.lstrip("-") == "created_at" and dados["v"] is not None:
+            dados["v"] = datetime.fromisoformat(dados["v"])
+        dados["id"] = int(dados["id"])
+        return dados
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+
+
+def limitar_page_size(limit) -> int:
+    if not limit:
+        return PAGE_SIZE_PADRAO
+    return max(1, min(int(limit), PAGE_SIZE_MAX))
+
+
+def filtrar_periodo(query, coluna, date_from: date = None, date_to: date = None):
+    """Filtra [date_from, date_to] inclusivo nos dois extremos (date_to vale o dia inteiro)."""
+    if date_from:
+        query = query.filter(coluna >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.filter(coluna < datetime.combine(date_to + timedelta(days=1), time.min))
+    return query
+
+
+def escapar_like(prefixo: str) -> str:
+    return prefixo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def paginar(query, modelo, sort: str, limit: int, cursor: str = None):
+    """Aplica ordenação + keyset e retorna (itens, próximo_cursor).
+
+    A query pode ter colunas extras (ex.: join com Patient); o primeiro elemento de cada linha
+    deve ser a entidade `modelo`. Também aceita uma projeção só de colunas, desde que inclua o id
+    e a coluna de ordenação com os mesmos nomes dos atributos do modelo.
+    """
+    descendente = sort.startswith("-")
+    coluna = getattr(modelo, sort.lstrip("-"))
+    id_coluna = modelo.id
+
+    if cursor:
+        pos = decodificar_cursor(cursor, sort)
+        if coluna is id_coluna:
+            query = query.filter(id_coluna < pos["id"] if descendente else id_coluna > pos["id"])
+        elif descendente:
+            query = query.filter(or_(coluna < pos["v"], and_(coluna == pos["v"], id_coluna < pos["id"])))
+        else:
+            query = query.filter(or_(coluna > pos["v"], and_(coluna == pos["v"], id_coluna > pos["id"])))
+
+    if coluna is id_coluna:
+        ordem = [id_coluna.desc() if descendente else id_coluna.asc()]
+    else:
+        ordem = [coluna.desc(), id_coluna.desc()] if descendente else [coluna.asc(), id_coluna.asc()]
+
+    # Busca um item a mais só para saber se existe próxima página
+    linhas = query.order_by(*ordem).limit(limit + 1).all()
+    proximo = None
+    if len(linhas) > limit:
+        linhas = linhas[:limit]
+        ultimo = linhas[-1]
+        entidade = ultimo[0] if hasattr(ultimo, "_mapping") and isinstance(ultimo[0], modelo) else ultimo
+        proximo = codificar_cursor(sort, getattr(entidade, sort.lstrip("-")), entidade.id)
+    return linhas, proximo
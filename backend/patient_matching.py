@@ -0,0 +1,39 @@
+import re
+import unicodedata
+
+# Chaves normalizadas para encontrar pacientes já cadastrados.
+# - cpf_digits: só os dígitos do CPF ("123.456.789-00" == "12345678900")
+# - match_key: nome sem acentos/caixa/espaços extras + data de nascimento ("Maria  Silva" == "maria silva")
+# As duas colunas são indexadas, então o cadastro encontra o paciente com uma única consulta.
+# A match_key só identifica o paciente quando os CPFs não conflitam: mesmo nome e nascimento com
+# CPFs diferentes são homônimos, não a mesma pessoa (mesma regra do dedupe_patients.py).
+
+_NAO_DIGITOS = re.compile(r"\D")
+
+
+def cpf_digitos(cpf):
+    if not cpf:
+        return None
+    digitos = _NAO_DIGITOS.sub("", cpf)
+    return digitos or None
+
+
+def normalizar_nome(nome) -> str:
+    if not nome:
+        return ""
+    sem_acentos = "".join(c for c in unicodedata.normalize("NFKD", nome) if not unicodedata.combining(c))
+    return " ".join(sem_acentos.casefold().split())
+
+
+def chave_paciente(full_name, birth_date) -> str:
+    return f"{normalizar_nome(full_name)}|{(birth_date or '').strip()}"
+
+
+def cpf_compativel(cpf_digits, patient) -> bool:
+    """Falso só quando os dois lados têm CPF e eles diferem."""
+    return not cpf_digits or not patient.cpf_digits or patient.cpf_digits == cpf_digits
+
+
+def preencher_chaves(patient):
+    patient.cpf_digits = cpf_digitos(patient.cpf)
+    patient.match_key = chave_paciente(patient.full_name, patient.birth_date)
@@ -0,0 +1,135 @@
+import math
+import os
+import re
+
+# Montagem do prompt clínico com orçamento de tokens.
+#
+# Cada parte variável do prompt (histórico, anamnese, HPMA, antecedentes, exames...) é uma Secao com prioridade.
+# Seções obrigatórias (sintomas, alergias, medicamentos em uso) nunca são cortadas. As demais entram em ordem
+# de prioridade enquanto houver orçamento; a que não couber inteira é truncada (início + fim, que costuma ser
+# o mais recente em históricos colados) e as seguintes são omitidas. Antes disso, frases repetidas entre
+# seções (ex.: o mesmo laudo colado na anamnese e no histórico) são removidas das seções menos prioritárias.
+#
+# A contagem é uma estimativa (caracteres / PROMPT_CHARS_PER_TOKEN); a contagem real do modelo vem nos
+# metadados da resposta e é gravada junto, em cases.analysis_meta_json.
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))  # 0 = sem limite
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+
+OBRIGATORIA = 0
+# Abaixo disso não vale a pena incluir um pedaço truncado da seção
+MIN_TOKENS_TRECHO = 24
+MARCADOR_CORTE = " [...] "
+# Trechos curtos ("Nega.", "Sem alterações.") se repetem legitimamente entre seções
+MIN_CARACTERES_DEDUP = 20
+
+
+class Secao:
+    __slots__ = ("chave", "rotulo", "texto", "prioridade")
+
+    def __init__(self, chave: str, rotulo: str, texto, prioridade: int):
+        self.chave = chave
+        self.rotulo = rotulo
+        # Só o espaço horizontal é colapsado aqui: as quebras de linha separam itens colados (exames, listas)
+        # em _trechos e são achatadas depois da deduplicação
+        self.texto = re.sub(r"[ \t]*\n\s*", "\n", re.sub(r"[ \t\r\f\v]+", " ", str(texto))).strip() if texto else ""
+        self.prioridade = prioridade
+
+
+class PromptMontado:
+    def __init__(self, texto: str, orcamento: int, truncadas: list, omitidas: list, deduplicadas: list):
+        self.texto = texto
+        self.tokens_estimados = estimar_tokens(texto)
+        self.orcamento = orcamento
+        self.truncadas = truncadas
+        self.omitidas = omitidas
+        self.deduplicadas = deduplicadas
+
+    def meta(self) -> dict:
+        return {
+            "prompt_tokens_estimated": self.tokens_estimados,
+            "prompt_budget": self.orcamento or None,
+            "sections_truncated": self.truncadas,
+            "sections_dropped": self.omitidas,
+            "sections_deduplicated": self.deduplicadas,
+        }
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto or "") / PROMPT_CHARS_PER_TOKEN)
+
+
+def custo_secao(secao: Secao, texto: str = None) -> int:
+    return estimar_tokens(f"\n{secao.rotulo}: {secao.texto if texto is None else texto}")
+
+
+def _trechos(texto: str) -> list:
+    # Frases / itens de lista: quebra depois de ponto, ponto e vírgula ou quebra de linha
+    return [t for t in re.split(r"(?<=[.;])\s+|\s*\n\s*", texto) if t.strip()]
+
+
+def _chave_trecho(trecho: str) -> str:
+    return " ".join(re.findall(r"\w+", trecho.casefold()))
+
+
+def deduplicar(secoes: list) -> list:
+    """Remove das seções menos prioritárias as frases que já aparecem numa mais prioritária."""
+    vistos = set()
+    alteradas = []
+    for secao in sorted(secoes, key=lambda s: s.prioridade):
+        if not secao.texto:
+            continue
+        mantidos = []
+        removidos = False
+        for trecho in _trechos(secao.texto):
+            chave = _chave_trecho(trecho)
+            if len(chave) >= MIN_CARACTERES_DEDUP:
+                if chave in vistos and secao.prioridade != OBRIGATORIA:
+                    removidos = True
+                    continue
+                vistos.add(chave)
+            mantidos.append(trecho.strip())
+        secao.texto = " ".join(mantidos)
+        if removidos:
+            alteradas.append(secao.chave)
+    return alteradas
+
+
+def truncar(texto: str, max_tokens: int) -> str:
+    """Corta o texto para caber em max_tokens mantendo 2/3 do início e 1/3 do fim, em limite de palavra."""
+    max_chars = int(max_tokens * PROMPT_CHARS_PER_TOKEN) - len(MARCADOR_CORTE)
+    if len(texto) <= max_chars + len(MARCADOR_CORTE):
+        return texto
+    if max_chars <= 0:
+        return ""
+    inicio = texto[: max_chars * 2 // 3].rsplit(" ", 1)[0]
+    fim = texto[len(texto) - max_chars // 3:].split(" ", 1)[-1]
+    return inicio + MARCADOR_CORTE + fim
+
+
+def compactar(secoes: list, renderizar, orcamento: int = PROMPT_TOKEN_BUDGET) -> PromptMontado:
+    """Escolhe o texto de cada seção dentro do orçamento e devolve o prompt final.
+
+    `renderizar(textos)` recebe {chave: texto} (seções omitidas ficam de fora) e devolve o prompt completo.
+    """
+    deduplicadas = deduplicar(secoes)
+    textos = {s.chave: s.texto for s in secoes if s.texto}
+    truncadas, omitidas = [], []
+
+    if orcamento:
+        disponivel = orcamento - estimar_tokens(renderizar({}))
+        disponivel -= sum(custo_secao(s) for s in secoes if s.texto and s.prioridade == OBRIGATORIA)
+        # sorted é estável: empate de prioridade mantém a ordem em que a seção aparece no prompt
+        for secao in sorted((s for s in secoes if s.texto and s.prioridade != OBRIGATORIA), key=lambda s: s.prioridade):
+            custo = custo_secao(secao)
+            if custo <= disponivel:
+                disponivel -= custo
+            elif disponivel - custo_secao(secao, "") >= MIN_TOKENS_TRECHO:
+                textos[secao.chave] = truncar(secao.texto, disponivel - custo_secao(secao, ""))
+                truncadas.append(secao.chave)
+                disponivel = 0
+            else:
+                del textos[secao.chave]
+                omitidas.append(secao.chave)
+
+    return PromptMontado(renderizar(textos), orcamento, truncadas, omitidas, deduplicadas)
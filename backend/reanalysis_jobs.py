@@ -0,0 +1,233 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import func
+
+import models
+from database import SessionLocal
+
+# Jobs de reanálise em massa (ex.: troca de modelo ou de prompt).
+# O job percorre os casos do filtro em ordem de id, em blocos; ao fim de cada bloco grava o progresso
+# (last_case_id + contadores) no banco. Se o processo cair, o job volta do último bloco gravado no startup.
+
+JOB_PENDENTE = "pendente"
+JOB_EXECUTANDO = "executando"
+JOB_CONCLUIDO = "concluído"
+JOB_CANCELADO = "cancelado"
+JOB_ERRO = "erro"
+
+# Quantos casos por bloco, em múltiplos da concorrência do job
+BLOCOS_POR_WORKER = 4
+
+
+class TokenBucket:
+    """Limita a taxa de chamadas: `taxa` fichas por segundo, acumulando no máximo `capacidade`."""
+
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa
+        self.capacidade = max(capacidade, 1.0)
+        self._fichas = self.capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancelado: threading.Event = None) -> bool:
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado) * self.taxa)
+                self._atualizado = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = (1 - self._fichas) / self.taxa
+            if cancelado is not None and cancelado.wait(espera):
+                return False
+            if cancelado is None:
+                time.sleep(espera)
+
+
+def filtrar_casos(query, job):
+    if job.owner_id is not None:
+        query = query.filter(models.Case.owner_id == job.owner_id)
+    if job.status_filter:
+        query = query.filter(models.Case.status == job.status_filter)
+    if job.created_from:
+        query = query.filter(models.Case.created_at >= job.created_from)
+    if job.created_to:
+        query = query.filter(models.Case.created_at < job.created_to)
+    return query
+
+
+def criar_job(db, owner_id=None, status_filter=None, created_from=None, created_to=None,
+              model=None, rate_per_minute=60.0, concurrency=4, force_refresh=True):
+    job = models.ReanalysisJob(
+        owner_id=owner_id,
+        status_filter=status_filter,
+        created_from=created_from,
+        created_to=created_to,
+        model=model,
+        rate_per_minute=rate_per_minute,
+        concurrency=concurrency,
+        force_refresh=force_refresh,
+        state=JOB_PENDENTE,
+        last_case_id=0,
+        processed=0,
+        succeeded=0,
+        failed=0,
+        elapsed_seconds=0.0,
+        created_at=datetime.utcnow(),
+    )
+    # O alvo é fixado na criação: casos novos depois disso não entram no job
+    consulta = filtrar_casos(db.query(func.count(models.Case.id), func.max(models.Case.id)), job)
+    job.total, job.max_case_id = consulta.one()
+    job.max_case_id = job.max_case_id or 0
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+class ReanalysisJobRunner:
+    def __init__(self):
+        self._handler = None
+        self._threads = {}
+        self._cancelar = {}
+        self._cancelados_usuario = set()
+        self._lock = threading.Lock()
+
+    def configurar(self, handler):
+        """handler(case_id, model, use_cache) -> bool reanalisa um caso e diz se a IA teve sucesso."""
+        self._handler = handler
+
+    def start(self, job_id: int) -> bool:
+        with self._lock:
+            if job_id in self._threads and self._threads[job_id].is_alive():
+                return False
+            evento = threading.Event()
+            thread = threading.Thread(target=self._executar, args=(job_id, evento),
+                                      name=f"reanalise-job-{job_id}", daemon=True)
+            self._cancelar[job_id] = evento
+            self._threads[job_id] = thread
+        thread.start()
+        return True
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancela a pedido do usuário. Retorna False se o job não estava rodando neste processo."""
+        with self._lock:
+            evento = self._cancelar.get(job_id)
+            if evento:
+                self._cancelados_usuario.add(job_id)
+        if evento:
+            evento.set()
+        return evento is not None
+
+    def is_running(self, job_id: int) -> bool:
+        with self._lock:
+            thread = self._threads.get(job_id)
+        return bool(thread and thread.is_alive())
+
+    def em_execucao(self) -> int:
+        with self._lock:
+            return sum(1 for thread in self._threads.values() if thread.is_alive())
+
+    def retomar_pendentes(self):
+        """Chamado no startup: jobs que estavam executando quando o processo caiu continuam do checkpoint."""
+        db = SessionLocal()
+        try:
+            ids = [i for (i,) in db.query(models.ReanalysisJob.id).filter(models.ReanalysisJob.state == JOB_EXECUTANDO)]
+        finally:
+            db.close()
+        for job_id in ids:
+            self.start(job_id)
+        return ids
+
+    def shutdown(self):
+        # Interrompe sem marcar como cancelado: os jobs continuam "executando" no banco e são retomados no startup
+        with self._lock:
+            eventos = list(self._cancelar.values())
+        for evento in eventos:
+            evento.set()
+
+    def _executar(self, job_id: int, cancelado: threading.Event):
+        db = SessionLocal()
+        try:
+            job = db.query(models.ReanalysisJob).filter(models.ReanalysisJob.id == job_id).first()
+            if not job or job.state in (JOB_CONCLUIDO, JOB_CANCELADO):
+                return
+            job.state = JOB_EXECUTANDO
+            job.started_at = job.started_at or datetime.utcnow()
+            job.last_error = None
+            db.commit()
+
+            bucket = TokenBucket(taxa=job.rate_per_minute / 60.0, capacidade=job.concurrency)
+            tamanho_bloco = job.concurrency * BLOCOS_POR_WORKER
+            use_cache = not job.force_refresh
+            modelo = job.model  # lido aqui: as threads do pool não podem tocar na Session
+
+            with ThreadPoolExecutor(max_workers=job.concurrency, thread_name_prefix=f"job-{job_id}") as executor:
+                while not cancelado.is_set():
+                    ids = [i for (i,) in filtrar_casos(db.query(models.Case.id), job).
+                           filter(models.Case.id > job.last_case_id, models.Case.id <= job.max_case_id).
+                           order_by(models.Case.id).limit(tamanho_bloco)]
+                    if not ids:
+                        job.state = JOB_CONCLUIDO
+                        job.finished_at = datetime.utcnow()
+                        break
+
+                    inicio = time.monotonic()
+
+                    def processar(case_id):
+                        if not bucket.acquire(cancelado):
+                            return None
+                        try:
+                            return self._handler(case_id, modelo, use_cache)
+                        except Exception as e:
+                            print(f"Erro ao reanalisar caso {case_id} (job {job_id}): {e}")
+                            return False
+
+                    resultados = list(executor.map(processar, ids))
+                    if cancelado.is_set() and None in resultados:
+                        # Bloco interrompido no meio: descarta o checkpoint parcial, ele é refeito ao retomar
+                        break
+
+                    job.last_case_id = ids[-1]
+                    job.processed += len(resultados)
+                    job.succeeded += sum(1 for r in resultados if r)
+                    job.failed += sum(1 for r in resultados if not r)
+                    job.elapsed_seconds += time.monotonic() - inicio
+                    job.updated_at = datetime.utcnow()
+                    db.commit()
+
+            with self._lock:
+                pelo_usuario = job_id in self._cancelados_usuario
+            if cancelado.is_set() and job.state == JOB_EXECUTANDO and pelo_usuario:
+                job.state = JOB_CANCELADO
+                job.finished_at = datetime.utcnow()
+            job.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Erro no job de reanálise {job_id}: {e}")
+            job = db.query(models.ReanalysisJob).filter(models.ReanalysisJob.id == job_id).first()
+            if job:
+                job.state = JOB_ERRO
+                job.last_error = str(e)[:500]
+                job.updated_at = datetime.utcnow()
+                db.commit()
+        finally:
+            db.close()
+            with self._lock:
+                self._threads.pop(job_id, None)
+                self._cancelar.pop(job_id, None)
+                self._cancelados_usuario.discard(job_id)
+
+
+def throughput_por_minuto(job) -> float:
+    if not job.elapsed_seconds:
+        return 0.0
+    return round(job.processed / job.elapsed_seconds * 60, 2)
+
+
+jobs_reanalise = ReanalysisJobRunner()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Any
 from datetime import datetime
 
@@ -95,6 +95,8 @@ class CaseResponse(BaseModel):
     patient_name: Optional[str] = None
     care_type: Optional[str] = None
     cpf: Optional[str] = None
+    version: Optional[int] = None
+    updated_at: Optional[Any] = None
 
     class Config:
         from_attributes = True
@@ -111,10 +113,56 @@ class CaseDetailResponse(CaseResponse):
     symptoms: str
     exams_input: Optional[str] = None
     doctor_conclusion: Optional[str] = None
+    analysis_meta_json: Optional[Any] = None
 
     class Config:
         from_attributes = True
 
+class CaseBatchItemResult(BaseModel):
+    index: int
+    case_id: Optional[int] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+    case: Optional[CaseResponse] = None
+
+class CaseBatchResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    elapsed_ms: float
+    items: List[CaseBatchItemResult]
+
+class CaseSearchResult(BaseModel):
+    id: int
+    patient_id: int
+    patient_name: Optional[str] = None
+    status: str
+    care_type: Optional[str] = None
+    urgency: Optional[str] = None
+    created_at: Any
+    score: float
+    snippet: Optional[str] = None
+
+class CaseSimilarResult(BaseModel):
+    id: int
+    patient_id: int
+    patient_name: Optional[str] = None
+    status: str
+    care_type: Optional[str] = None
+    urgency: Optional[str] = None
+    cid10_code: Optional[str] = None
+    created_at: Any
+    score: float
+
+class CaseStatusResponse(BaseModel):
+    id: int
+    status: str
+    ai_analysis_json: Optional[Any] = None
+
+class Cid10Item(BaseModel):
+    code: str
+    description: str
+
 # --- DASHBOARD SCHEMAS ---
 class NameValueItem(BaseModel):
     name: str
@@ -129,3 +177,64 @@ class DashboardStats(BaseModel):
     care_type: List[NameValueItem]
     pathology: List[NameValueItem]
     cases_by_date: List[DateTotalItem]
+
+# --- AI CACHE SCHEMAS ---
+class AICacheStats(BaseModel):
+    enabled: bool
+    memory_hits: int
+    db_hits: int
+    misses: int
+    bypassed: int
+    stores: int
+    evictions: int
+    memory_entries: int
+    hit_rate: float
+    saved_ms: float
+
+class AIQueueLaneStats(BaseModel):
+    lane: str
+    weight: float
+    max_running: int
+    queued: int
+    running: int
+    enqueued_total: int
+    processed_total: int
+    wait_avg_ms: float
+    wait_p95_ms: float
+    wait_max_ms: float
+
+class AIQueueStats(BaseModel):
+    workers: int
+    depth: int
+    lanes: list[AIQueueLaneStats]
+
+# --- REANALYSIS JOB SCHEMAS ---
+class ReanalysisJobCreate(BaseModel):
+    owner_id: Optional[int] = None
+    status_filter: Optional[str] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    model: Optional[str] = None
+    rate_per_minute: float = Field(60.0, gt=0, le=6000)
+    concurrency: int = Field(4, ge=1, le=32)
+    force_refresh: bool = True
+
+class ReanalysisJobResponse(ReanalysisJobCreate):
+    id: int
+    state: str
+    total: int
+    processed: int
+    succeeded: int
+    failed: int
+    last_case_id: int
+    elapsed_seconds: float
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    running: bool = False
+    throughput_per_min: float = 0.0
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import Future
+
+# Agrupamento de chamadas concorrentes ("single-flight").
+# Enquanto uma chamada para a chave estiver em andamento, as demais com a mesma chave não repetem
+# o trabalho: esperam a primeira terminar e recebem o mesmo resultado (ou a mesma exceção).
+# Vale por processo; com vários workers do uvicorn cada um tem o seu registro.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    def executar(self, chave, funcao, *args, **kwargs):
+        """Roda funcao(*args, **kwargs), ou aguarda a execução já em andamento para a mesma chave.
+
+        Retorna (resultado, compartilhado): compartilhado=True quando o resultado veio da chamada de outro.
+        """
+        with self._lock:
+            futuro = self._em_andamento.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_andamento[chave] = futuro
+                self._stats["executed"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not lider:
+            return futuro.result(), True
+
+        try:
+            resultado = funcao(*args, **kwargs)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado, False
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+
+    def em_andamento(self, chave) -> bool:
+        with self._lock:
+            return chave in self._em_andamento
+
+    def stats(self) -> dict:
+        with self._lock:
+            dados = dict(self._stats)
+            dados["in_flight"] = len(self._em_andamento)
+        return dados
@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Ambiente dos testes: definido antes de qualquer import do app (database.py lê DATABASE_URL no import).
+# Banco SQLite em memória (compartilhado entre threads, ver database.criar_engine) e LLM fake,
+# então os testes não dependem de arquivo local, de .env nem de GEMINI_API_KEY.
+os.environ.update({
+    "DATABASE_URL": "sqlite://",
+    "DATABASE_REPLICA_URL": "",
+    "LLM_BACKEND": "fake",
+    "FAKE_LLM_LATENCY_MS": "fixed:0",
+    "FAKE_LLM_ERROR_RATE": "0",
+    "SIMILARITY_ENABLED": "false",
+    "AI_CACHE_ENABLED": "false",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,141 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import undefer_group
+
+import main
+import models
+from database import engine, read_engine, ReadSessionLocal
+
+# Colunas e bytes que as rotas de casos buscam no banco: as listagens e o DELETE não podem voltar a
+# carregar o relato clínico (colunas do grupo models.GRUPO_RELATO), e o detalhe o carrega num SELECT só.
+
+COLUNA_CASES = re.compile(r"\bcases\.(\w+)")
+RELATO = {prop.key for prop in models.Case.__mapper__.column_attrs if prop.group == models.GRUPO_RELATO}
+COLUNAS_ROLLUP = {"owner_id", "created_at", "care_type", "ai_analysis_json"}
+TOTAL_CASOS = 12
+
+# Relato longo, como os colados do prontuário: é o que a projeção deixa de trafegar
+TEXTO_LONGO = "Paciente refere cefaleia holocraniana pulsátil, pior pela manhã, sem melhora com analgésicos. " * 20
+
+
+class Captura:
+    """Registra os SELECTs executados: colunas de cases na projeção e bytes das linhas devolvidas."""
+
+    def __init__(self):
+        self.consultas = []
+        self.ativa = False
+
+    def depois_de_executar(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.ativa or not statement.lstrip().upper().startswith("SELECT"):
+            return
+        projecao = re.split(r"\bFROM\b", statement, maxsplit=1, flags=re.IGNORECASE)[0]
+        # O SELECT é repetido num cursor à parte para medir o resultado sem consumir o da aplicação
+        linhas = cursor.connection.cursor().execute(statement, parameters).fetchall()
+        self.consultas.append({
+            "colunas": set(COLUNA_CASES.findall(projecao)),
+            "bytes": sum(tamanho(valor) for linha in linhas for valor in linha),
+        })
+
+    def medir(self, funcao):
+        self.consultas, self.ativa = [], True
+        try:
+            resultado = funcao()
+        finally:
+            self.ativa = False
+        return resultado, self.consultas
+
+
+def tamanho(valor) -> int:
+    if valor is None:
+        return 0
+    if isinstance(valor, str):
+        return len(valor.encode("utf-8"))
+    if isinstance(valor, bytes):
+        return len(valor)
+    return 8
+
+
+def colunas(consultas) -> set:
+    return set().union(*(c["colunas"] for c in consultas)) if consultas else set()
+
+
+@pytest.fixture(scope="module")
+def cenario():
+    captura = Captura()
+    motores = {engine, read_engine}
+    for motor in motores:
+        event.listen(motor, "after_cursor_execute", captura.depois_de_executar)
+    try:
+        with TestClient(main.app) as client:
+            resp = client.post("/users/", json={
+                "email": "colunas@example.com", "full_name": "Médico Colunas", "crm": "123456", "password": "teste",
+            })
+            assert resp.status_code == 200, resp.text
+            owner_id = resp.json()["id"]
+            case_ids = []
+            for i in range(TOTAL_CASOS):
+                resp = client.post("/cases/", params={"owner_id": owner_id}, json={
+                    "patient_data": {
+                        "full_name": f"Paciente {i}", "birth_date": "1980-05-17", "gender": "F",
+                        "cpf": f"{52998224725 + i * 11:011d}",
+                    },
+                    "symptoms": f"Cefaleia há {i + 1} dias. {TEXTO_LONGO}",
+                    "hpma": TEXTO_LONGO,
+                    "anamnesis": TEXTO_LONGO,
+                    "exams_input": "Hemograma sem alterações.\nPCR 3 mg/L",
+                })
+                assert resp.status_code == 200, resp.text
+                case_ids.append(resp.json()["id"])
+            yield client, captura, owner_id, case_ids
+    finally:
+        for motor in motores:
+            event.remove(motor, "after_cursor_execute", captura.depois_de_executar)
+
+
+def test_lista_de_casos_nao_busca_relato(cenario):
+    client, captura, owner_id, _ = cenario
+    resp, consultas = captura.medir(lambda: client.get("/cases/", params={"owner_id": owner_id, "limit": 50}))
+    assert resp.status_code == 200
+    assert len(resp.json()) == TOTAL_CASOS
+    assert consultas, "a listagem deveria consultar o banco"
+    assert not colunas(consultas) & RELATO
+
+
+def test_lista_de_casos_busca_menos_bytes_que_a_entidade_completa(cenario):
+    client, captura, owner_id, _ = cenario
+    _, lista = captura.medir(lambda: client.get("/cases/", params={"owner_id": owner_id, "limit": 50, "sort": "id"}))
+
+    def entidade_completa():
+        db = ReadSessionLocal()
+        try:
+            return db.query(models.Case).options(undefer_group(models.GRUPO_RELATO)).\
+                filter(models.Case.owner_id == owner_id).order_by(models.Case.id).limit(51).all()
+        finally:
+            db.close()
+
+    _, completa = captura.medir(entidade_completa)
+    bytes_lista = sum(c["bytes"] for c in lista)
+    bytes_completa = sum(c["bytes"] for c in completa)
+    # O relato de cada caso tem ~15 KB; a página projetada traz só os campos do CaseResponse
+    assert bytes_lista * 5 < bytes_completa, (bytes_lista, bytes_completa)
+
+
+def test_detalhe_carrega_relato_num_select(cenario):
+    client, captura, _, case_ids = cenario
+    resp, consultas = captura.medir(lambda: client.get(f"/cases/{case_ids[0]}"))
+    assert resp.status_code == 200
+    assert resp.json()["hpma"]
+    com_relato = [c for c in consultas if c["colunas"] & RELATO]
+    assert len(com_relato) == 1
+    assert RELATO <= com_relato[0]["colunas"]
+
+
+def test_delete_busca_so_a_chave_do_rollup(cenario):
+    client, captura, owner_id, case_ids = cenario
+    resp, consultas = captura.medir(lambda: client.delete(f"/cases/{case_ids[-1]}", params={"owner_id": owner_id}))
+    assert resp.status_code == 204
+    assert colunas(consultas) <= COLUNAS_ROLLUP
+    assert client.get(f"/cases/{case_ids[-1]}").status_code == 404
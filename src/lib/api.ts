@@ -1 +1,20 @@
 export const API_URL = "http://127.0.0.1:8001";
+
+// As listagens (/cases/, /patients/) são paginadas por cursor: a próxima página vem no header X-Next-Cursor.
+// Busca todas as páginas de uma listagem e devolve os itens concatenados.
+export const PAGE_SIZE = 200;
+
+export async function fetchAllPages<T = any>(path: string): Promise<T[]> {
+  const items: T[] = [];
+  let cursor: string | null = null;
+  do {
+    const url = new URL(`${API_URL}${path}`);
+    url.searchParams.set("limit", String(PAGE_SIZE));
+    if (cursor) url.searchParams.set("cursor", cursor);
+    const response = await fetch(url.toString());
+    if (!response.ok) throw new Error(`Erro ${response.status} ao buscar ${path}`);
+    items.push(...(await response.json()));
+    cursor = response.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return items;
+}
@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import { API_URL } from "@/lib/api";
+import { API_URL, fetchAllPages } from "@/lib/api";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
@@ -63,13 +63,13 @@ const Dashboard = () => {
 
     const fetchData = async () => {
       try {
-        const [resCases, resPatients, resStats] = await Promise.all([
-          fetch(`${API_URL}/cases/?owner_id=${medico.id}`),
-          fetch(`${API_URL}/patients/?owner_id=${medico.id}`),
+        const [data, dp, resStats] = await Promise.all([
+          fetchAllPages(`/cases/?owner_id=${medico.id}`),
+          fetchAllPages(`/patients/?owner_id=${medico.id}`),
           fetch(`${API_URL}/dashboard/stats?owner_id=${medico.id}`),
         ]);
-        if (resCases.ok) { const data = await resCases.json(); setCases(data.sort((a: any, b: any) => b.id - a.id)); }
-        if (resPatients.ok) { const dp = await resPatients.json(); setPatientCount(dp.length); }
+        setCases(data.sort((a: any, b: any) => b.id - a.id));
+        setPatientCount(dp.length);
         if (resStats.ok) { const ds = await resStats.json(); setStats(ds); }
       } catch (error) { console.error("Erro ao buscar dados:", error); }
       finally { setLoading(false); }
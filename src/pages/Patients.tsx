@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { useNavigate, useSearchParams } from "react-router-dom";
-import { API_URL } from "@/lib/api";
+import { API_URL, fetchAllPages } from "@/lib/api";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
@@ -81,8 +81,8 @@ const Patients = () => {
     if (!medico?.id) { navigate("/login"); return; }
     const fetchCases = async () => {
       try {
-        const response = await fetch(`${API_URL}/cases/?owner_id=${medico.id}`);
-        if (response.ok) { const data = await response.json(); setCases(data.sort((a: Case, b: Case) => b.id - a.id)); }
+        const data = await fetchAllPages<Case>(`/cases/?owner_id=${medico.id}`);
+        setCases(data.sort((a: Case, b: Case) => b.id - a.id));
       } catch (error) { console.error("Erro ao buscar pacientes:", error); }
       finally { setLoading(false); }
     };